@@ -0,0 +1,106 @@
+import argparse
+import os
+import time
+import numpy as np
+import torch
+from PIL import Image
+from transformers import CLIPProcessor, CLIPModel
+
+DEFAULT_MODEL = "openai/clip-vit-base-patch32"
+BACKENDS = ('torch', 'quantized', 'onnx')
+
+# Wrapper exposing only the image tower, so it can be exported to ONNX on its own
+class _ImageFeatures(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+# Batched CPU inference for CLIP image embeddings.
+#
+# Backends:
+#   torch      - the stock fp32 model
+#   quantized  - the model with its Linear layers dynamically quantized to int8
+#   onnx       - the image tower exported once to ONNX and run with ONNX Runtime
+class ClipEmbedder:
+    def __init__(self, model_name=DEFAULT_MODEL, backend='torch', batch_size=32, threads=None, onnx_path=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+        if threads:
+            torch.set_num_threads(threads)
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.processor = CLIPProcessor.from_pretrained(model_name)
+
+        model = CLIPModel.from_pretrained(model_name).eval()
+        if backend == 'quantized':
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        if backend == 'onnx':
+            self.session = self._load_onnx(model, onnx_path or f"{model_name.replace('/', '--')}-image.onnx", threads)
+        else:
+            self.model = model
+
+    # Name under which embeddings are cached, so backends never share cached vectors
+    @property
+    def cache_key(self):
+        return self.model_name if self.backend == 'torch' else f"{self.model_name}@{self.backend}"
+
+    def _load_onnx(self, model, onnx_path, threads):
+        import onnxruntime
+
+        if not os.path.exists(onnx_path):
+            size = self.processor.image_processor.crop_size['height']
+            torch.onnx.export(
+                _ImageFeatures(model),
+                torch.zeros(1, 3, size, size),
+                onnx_path,
+                input_names=['pixel_values'],
+                output_names=['image_embeds'],
+                dynamic_axes={'pixel_values': {0: 'batch'}, 'image_embeds': {0: 'batch'}},
+                opset_version=14,
+            )
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        return onnxruntime.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+
+    # Function to embed a list of PIL images, running the model once per batch
+    def embed(self, images):
+        embeddings = []
+        for start in range(0, len(images), self.batch_size):
+            batch = images[start:start + self.batch_size]
+            if self.backend == 'onnx':
+                inputs = self.processor(images=batch, return_tensors="np")
+                features = self.session.run(None, {'pixel_values': inputs['pixel_values'].astype(np.float32)})[0]
+            else:
+                inputs = self.processor(images=batch, return_tensors="pt")
+                with torch.no_grad():
+                    features = self.model.get_image_features(**inputs).numpy()
+            embeddings.extend(features.tolist())
+        return embeddings
+
+# Function to measure images/sec for each backend on synthetic images
+def benchmark(backends, num_images, batch_size, threads):
+    rng = np.random.default_rng(0)
+    images = [Image.fromarray(rng.integers(0, 255, (256, 256, 3), dtype=np.uint8)) for _ in range(num_images)]
+    results = {}
+    for backend in backends:
+        embedder = ClipEmbedder(backend=backend, batch_size=batch_size, threads=threads)
+        embedder.embed(images[:batch_size])  # Warm up
+        started = time.perf_counter()
+        embedder.embed(images)
+        results[backend] = num_images / (time.perf_counter() - started)
+        print(f"{backend:>10}: {results[backend]:,.1f} images/sec (batch size {batch_size}, threads {torch.get_num_threads()})")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark CLIP image embedding backends on CPU.")
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--images', type=int, default=256)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+    benchmark(args.backends, args.images, args.batch_size, args.threads)
@@ -6,5 +6,19 @@ class Config:
     MONGODB_URI = os.getenv("MONGODB_URI")
     MONGODB_DATABASE = "retail_store"
     MONGODB_COLLECTION = "products"
+    # Precomputed nearest neighbours, built by recommendations-generator.py
+    MONGODB_RECOMMENDATIONS_COLLECTION = "product_recommendations"
+    # Neighbours stored per product; the web app's live fallback returns as many
+    RECOMMENDATIONS_COUNT = int(os.getenv("RECOMMENDATIONS_COUNT", 9))
     # OpenAI API Key
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    # Optional OpenAI-compatible endpoint, e.g. http://127.0.0.1:8808/v1 for the offline stub server
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+    # Reduced embedding size passed to the embeddings API; unset keeps the model's full size
+    EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", 0)) or None
+    # Optional SQLite file that keeps embeddings across runs
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+    # Stored encoding of vectors: "array", "float32" or "int8"; see ecomm-web-app/vector_codec.py
+    VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "array")
+    # int8 quantization scale; unset derives it from the vector dimensions
+    VECTOR_INT8_SCALE = float(os.getenv("VECTOR_INT8_SCALE", 0)) or None
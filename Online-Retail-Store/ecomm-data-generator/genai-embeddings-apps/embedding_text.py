@@ -0,0 +1,21 @@
+import hashlib
+from config import Config
+
+# The text embedded for each product and the hash that identifies it, shared by the
+# embedding generator and the vector storage migration.
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+
+# Fields needed to build the embedded text, plus the hash of the last embedded text
+SOURCE_FIELDS = {'sub_category': 1, 'name': 1, 'description': 1, 'material': 1, 'colors': 1, 'embeddings_hash': 1}
+
+# Function to concatenate the specified fields
+def concatenate_fields(document):
+    concatenated_text = 'Sub Category: ' + document["sub_category"] + '; Product Name: ' + document["name"]+ '; Product Description: ' + document["description"] + '; Product Materials:  ' + document["material"] + '; '
+    concatenated_text += 'Available Colours: ' + ' '.join(document["colors"]) + '; '
+    return concatenated_text
+
+# Function to hash the embedded content, so unchanged products can be skipped on the next run
+def content_hash(text, model=EMBEDDING_MODEL, dimensions=Config.EMBEDDING_DIMENSIONS):
+    key = f"{model}\n{text}" if not dimensions else f"{model}\n{dimensions}\n{text}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
@@ -1,27 +1,26 @@
-from pymongo import MongoClient
+import argparse
+import os
+import sys
+from pymongo import MongoClient, UpdateOne
 from config import Config
-import requests
 from PIL import Image
 from io import BytesIO
-import torch
-from transformers import CLIPProcessor, CLIPModel
+from image_cache import ImageCache, create_session, fetch_images
+from clip_inference import ClipEmbedder, BACKENDS
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'ecomm-web-app'))
+from vector_codec import encode_vector
 
 # MongoDB connection details
 client = MongoClient(Config.MONGODB_URI)
 db = client[Config.MONGODB_DATABASE]
 collection = db[Config.MONGODB_COLLECTION]
 
-# Initialize CLIP model and processor
-model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-
-# Function to download and open an image from a URL
-def download_image(url):
-    response = requests.get(url)
+# Function to open an image from downloaded bytes
+def open_image(content, url):
     try:
-        img = Image.open(BytesIO(response.content))
+        img = Image.open(BytesIO(content))
         img.verify()  # Verify the image file integrity
-        img = Image.open(BytesIO(response.content))  # Reopen image after verify to reset file pointer
+        img = Image.open(BytesIO(content))  # Reopen image after verify to reset file pointer
         # Convert image to RGBA if it has a palette with transparency
         if img.mode == 'P' and 'transparency' in img.info:
             img = img.convert('RGBA')
@@ -30,25 +29,94 @@ def download_image(url):
         return None
     return img
 
-# Function to generate image embedding using CLIP
-def generate_image_embedding(image):
-    inputs = processor(images=image, return_tensors="pt")
-    with torch.no_grad():
-        embeddings = model.get_image_features(**inputs)
-    return embeddings.squeeze().tolist()
-
-# Read documents, download images, generate embeddings, and update documents
-for document in collection.find({'created_manually': True}):
-    image_embeddings = []
-    for image_url in document.get("images", []):
-        try:
-            image = download_image(image_url)
-            if image is not None:
-                embedding = generate_image_embedding(image)
-                image_embeddings.append(embedding)
-        except Exception as e:
-            print(f"Error processing image {image_url}: {e}")
+# Function to embed every unique image once, reusing embeddings already in the cache.
+# Uncached images are decoded first and then sent through CLIP in batches; when a batch
+# fails, its images are retried one at a time so a single bad image is all that is lost.
+# Returns a {content_hash: embedding} map; images that could not be decoded or embedded
+# are left out and counted in stats['failed_images'].
+def embed_images(url_hashes, cache, embedder, stats):
+    embeddings = {}
+    pending = {}
+    urls = {}
+    for url, content_hash in url_hashes.items():
+        if content_hash is None or content_hash in embeddings or content_hash in pending:
+            continue
+        embedding = cache.get_embedding(embedder.cache_key, content_hash)
+        if embedding is not None:
+            embeddings[content_hash] = embedding
             continue
-    collection.update_one({'_id': document['_id']}, {'$set': {'image_embeddings': image_embeddings}})
+        image = open_image(cache.get_image(content_hash), url)
+        if image is not None:
+            pending[content_hash] = image
+            urls[content_hash] = url
+        else:
+            stats['failed_images'] += 1
+
+    try:
+        embedded = dict(zip(pending, embedder.embed(list(pending.values()))))
+    except Exception as e:
+        print(f"Error embedding a batch of {len(pending)} images, retrying them one by one: {e}")
+        embedded = {}
+        for content_hash, image in pending.items():
+            try:
+                embedded[content_hash] = embedder.embed([image])[0]
+            except Exception as e:
+                print(f"Error processing image {urls[content_hash]}: {e}")
+                stats['failed_images'] += 1
+
+    for content_hash, embedding in embedded.items():
+        cache.put_embedding(embedder.cache_key, content_hash, embedding)
+        embeddings[content_hash] = embedding
+    return embeddings
+
+# Function to download, embed and write back one batch of documents
+def process_batch(documents, cache, session, embedder, workers, stats):
+    urls = [url for document in documents for url in document.get("images", [])]
+    url_hashes = fetch_images(urls, cache, session, workers)
+    embeddings = embed_images(url_hashes, cache, embedder, stats)
+
+    updates = []
+    for document in documents:
+        image_embeddings = []
+        for image_url in document.get("images", []):
+            content_hash = url_hashes.get(image_url)
+            if content_hash in embeddings:
+                image_embeddings.append(encode_vector(embeddings[content_hash], Config.VECTOR_STORAGE, Config.VECTOR_INT8_SCALE))
+        updates.append(UpdateOne({'_id': document['_id']}, {'$set': {'image_embeddings': image_embeddings}}))
+    if updates:
+        collection.bulk_write(updates, ordered=False)
+
+    stats['documents'] += len(documents)
+    stats['images'] += len(urls)
+    stats['unique_urls'] += len(url_hashes)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate product image embeddings with CLIP.")
+    parser.add_argument('--workers', type=int, default=16, help="Concurrent image downloads")
+    parser.add_argument('--batch-size', type=int, default=500, help="Documents per download batch and bulk write")
+    parser.add_argument('--backend', default='torch', choices=BACKENDS, help="CLIP inference backend")
+    parser.add_argument('--inference-batch-size', type=int, default=32, help="Images per CLIP forward pass")
+    parser.add_argument('--threads', type=int, default=None, help="CPU threads used for inference (default: torch default)")
+    parser.add_argument('--cache-dir', default='image-cache', help="Directory of the content-addressed image and embedding cache")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    cache = ImageCache(args.cache_dir)
+    session = create_session(args.workers)
+    embedder = ClipEmbedder(backend=args.backend, batch_size=args.inference_batch_size, threads=args.threads)
+    stats = {'documents': 0, 'images': 0, 'unique_urls': 0, 'failed_images': 0}
+
+    # Read documents, download images, generate embeddings, and update documents
+    batch = []
+    for document in collection.find({'created_manually': True}, {'images': 1}):
+        batch.append(document)
+        if len(batch) >= args.batch_size:
+            process_batch(batch, cache, session, embedder, args.workers, stats)
+            batch = []
+    if batch:
+        process_batch(batch, cache, session, embedder, args.workers, stats)
 
-print("Image embeddings generated and updated successfully.")
+    print(f"Processed {stats['documents']} documents referencing {stats['images']} images "
+          f"({stats['unique_urls']} unique URL lookups, {stats['failed_images']} images skipped after errors).")
+    print("Image embeddings generated and updated successfully.")
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+# Content-addressed on-disk cache of downloaded images and their embeddings.
+#
+# Layout under the cache root:
+#   urls/<sha256 of url>          -> sha256 of the image bytes the url served
+#   blobs/<sha256 of bytes>       -> the image bytes
+#   embeddings/<model>/<sha256>   -> JSON embedding computed from those bytes
+#
+# Identical images served from different URLs share one blob and one embedding.
+class ImageCache:
+    def __init__(self, root):
+        self.root = root
+        for sub_dir in ('urls', 'blobs', 'embeddings'):
+            os.makedirs(os.path.join(root, sub_dir), exist_ok=True)
+
+    def _url_path(self, url):
+        return os.path.join(self.root, 'urls', hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def _blob_path(self, content_hash):
+        return os.path.join(self.root, 'blobs', content_hash)
+
+    def _embedding_path(self, model, content_hash):
+        return os.path.join(self.root, 'embeddings', model.replace('/', '--'), content_hash)
+
+    def content_hash_for(self, url):
+        try:
+            with open(self._url_path(url)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def put_image(self, url, content):
+        content_hash = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(content_hash)
+        if not os.path.exists(blob_path):
+            _atomic_write(blob_path, content, 'wb')
+        _atomic_write(self._url_path(url), content_hash, 'w')
+        return content_hash
+
+    def get_image(self, content_hash):
+        with open(self._blob_path(content_hash), 'rb') as f:
+            return f.read()
+
+    def get_embedding(self, model, content_hash):
+        try:
+            with open(self._embedding_path(model, content_hash)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put_embedding(self, model, content_hash, embedding):
+        path = self._embedding_path(model, content_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _atomic_write(path, json.dumps(embedding), 'w')
+
+# Function to write a file via a temporary name so concurrent readers never see partial data.
+# The temporary file is unique per call, as several threads may write the same path.
+def _atomic_write(path, data, mode):
+    tmp = tempfile.NamedTemporaryFile(mode, dir=os.path.dirname(path), suffix='.tmp', delete=False)
+    try:
+        with tmp:
+            tmp.write(data)
+        os.replace(tmp.name, path)
+    except OSError:
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+        raise
+
+# Function to build a requests session whose connection pool matches the worker count
+def create_session(workers):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=2)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+# Function to fetch every URL missing from the cache, each unique URL once, on a thread pool.
+# Returns a {url: content_hash} map; URLs that failed to download or to be cached map to None.
+def fetch_images(urls, cache, session, workers, timeout=30):
+    resolved = {}
+    missing = []
+    for url in dict.fromkeys(urls):
+        content_hash = cache.content_hash_for(url)
+        if content_hash:
+            resolved[url] = content_hash
+        else:
+            missing.append(url)
+
+    def fetch(url):
+        try:
+            response = session.get(url, timeout=timeout)
+            response.raise_for_status()
+            return url, cache.put_image(url, response.content)
+        except requests.RequestException as e:
+            print(f"Error downloading image {url}: {e}")
+            return url, None
+        except OSError as e:
+            print(f"Error caching image {url}: {e}")
+            return url, None
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for url, content_hash in executor.map(fetch, missing):
+                resolved[url] = content_hash
+    return resolved
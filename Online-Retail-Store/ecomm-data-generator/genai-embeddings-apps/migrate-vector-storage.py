@@ -0,0 +1,117 @@
+import argparse
+import os
+import sys
+import time
+import bson
+import numpy as np
+from pymongo import MongoClient, UpdateOne
+from config import Config
+from embedding_text import SOURCE_FIELDS, concatenate_fields, content_hash
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'ecomm-web-app'))
+from vector_codec import STORAGE_FORMATS, decode_vector, encode_vector, storage_of, truncate_vector
+
+# MongoDB connection details
+client = MongoClient(Config.MONGODB_URI)
+db = client[Config.MONGODB_DATABASE]
+collection = db[Config.MONGODB_COLLECTION]
+
+# Function to re-encode one product's vectors; returns the $set document, or None when
+# its embeddings and image embeddings are already in the target encoding and dimensions
+def convert(document, storage, dimensions, scale):
+    embeddings = document['embeddings']
+    current = decode_vector(embeddings, scale)
+    image_embeddings = document.get('image_embeddings') or []
+
+    updates = {}
+    if storage_of(embeddings) != storage or (dimensions and len(current) != dimensions):
+        if dimensions and len(current) != dimensions:
+            current = truncate_vector(current, dimensions)
+            # The embeddings now match what the API returns for this size, so record that in
+            # the hash and the generator keeps skipping unchanged products
+            updates['embeddings_hash'] = content_hash(concatenate_fields(document), dimensions=dimensions)
+        updates['embeddings'] = encode_vector(current, storage, scale)
+    if any(storage_of(vector) != storage for vector in image_embeddings):
+        updates['image_embeddings'] = [encode_vector(vector, storage, scale) for vector in image_embeddings]
+    return updates or None
+
+# Function to convert every product in _id-ordered batches written with bulk_write
+def migrate(storage, dimensions, batch_size, scale):
+    projection = {**SOURCE_FIELDS, 'embeddings': 1, 'image_embeddings': 1}
+    query = {'embeddings': {'$exists': True}}
+    stats = {'read': 0, 'converted': 0}
+    started = time.perf_counter()
+    last_id = None
+    while True:
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        documents = list(collection.find(query, projection).sort('_id', 1).limit(batch_size))
+        if not documents:
+            break
+        last_id = documents[-1]['_id']
+
+        updates = []
+        for document in documents:
+            changes = convert(document, storage, dimensions, scale)
+            if changes:
+                updates.append(UpdateOne({'_id': document['_id']}, {'$set': changes}))
+        if updates:
+            collection.bulk_write(updates, ordered=False)
+
+        stats['read'] += len(documents)
+        stats['converted'] += len(updates)
+        print(f"{stats['read']} read, {stats['converted']} converted ({stats['read'] / (time.perf_counter() - started):.0f} docs/s)")
+    return stats
+
+# Function to compare document size and recall@k of each encoding on a sample of products.
+# Ground truth is exact euclidean search over the stored vectors at full precision;
+# queries are sampled products, searching the rest of the sample.
+def report(sample_size, queries, k, dimensions, scale):
+    documents = list(collection.aggregate([{'$match': {'embeddings': {'$exists': True}}}, {'$sample': {'size': sample_size}}]))
+    if len(documents) <= queries:
+        print("Not enough products with embeddings for a report.")
+        return
+
+    baseline = np.stack([decode_vector(document['embeddings'], scale) for document in documents])
+    print(f"{len(documents)} products, {baseline.shape[1]} stored dimensions, {queries} queries, recall@{k}")
+
+    def top_k(vectors):
+        query_vectors, corpus = vectors[:queries], vectors[queries:]
+        distances = (corpus ** 2).sum(axis=1)[None, :] - 2 * query_vectors @ corpus.T
+        return [set(row) for row in np.argpartition(distances, k - 1, axis=1)[:, :k]]
+
+    truth = top_k(baseline)
+    variants = [(storage, None) for storage in STORAGE_FORMATS]
+    if dimensions and dimensions < baseline.shape[1]:
+        variants += [(storage, dimensions) for storage in STORAGE_FORMATS]
+
+    print(f"{'Encoding':<10} {'Dims':>6} {'Avg doc':>10} {'Vector':>10} {f'Recall@{k}':>10}")
+    for storage, reduced in variants:
+        encoded = [
+            encode_vector(truncate_vector(vector, reduced) if reduced else vector, storage, scale)
+            for vector in baseline
+        ]
+        document_sizes = [len(bson.BSON.encode({**document, 'embeddings': value})) for document, value in zip(documents, encoded)]
+        vector_sizes = [len(bson.BSON.encode({'embeddings': value})) for value in encoded]
+        found = top_k(np.stack([decode_vector(value, scale) for value in encoded]))
+        recall = np.mean([len(a & b) / k for a, b in zip(found, truth)])
+        print(f"{storage:<10} {reduced or baseline.shape[1]:>6} {np.mean(document_sizes) / 1024:>8.1f}KB {np.mean(vector_sizes) / 1024:>8.1f}KB {recall:>10.3f}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert stored product vectors to another encoding and/or fewer dimensions.")
+    parser.add_argument('--storage', default=Config.VECTOR_STORAGE, choices=STORAGE_FORMATS, help="Target encoding")
+    parser.add_argument('--dimensions', type=int, default=Config.EMBEDDING_DIMENSIONS, help="Truncate and renormalize to this many dimensions")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Products per bulk write")
+    parser.add_argument('--report', action='store_true', help="Only report sizes and recall on a sample, without writing")
+    parser.add_argument('--sample', type=int, default=5000, help="Products sampled by --report")
+    parser.add_argument('--queries', type=int, default=200, help="Queries run by --report")
+    parser.add_argument('-k', type=int, default=10)
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.report:
+        report(args.sample, args.queries, args.k, args.dimensions, Config.VECTOR_INT8_SCALE)
+    else:
+        stats = migrate(args.storage, args.dimensions, args.batch_size, Config.VECTOR_INT8_SCALE)
+        print(f"Converted {stats['converted']} of {stats['read']} products to {args.storage}.")
+        print("Update numDimensions in vector_search_index.json if the dimensions changed, and set VECTOR_STORAGE for the web app.")
@@ -1,27 +1,133 @@
-from pymongo import MongoClient
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import MongoClient, UpdateOne
+from bson import ObjectId
 from config import Config
 from openai import OpenAI
-aiClient = OpenAI()
+# The embedding service lives with the web app so offline and online code share one path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'ecomm-web-app'))
+from embedding_service import EmbeddingService
+from vector_codec import encode_vector
+from embedding_text import EMBEDDING_MODEL, SOURCE_FIELDS, concatenate_fields, content_hash
+aiClient = OpenAI(base_url=Config.OPENAI_BASE_URL)
 
 # MongoDB connection details
 client = MongoClient(Config.MONGODB_URI)
 db = client[Config.MONGODB_DATABASE]
 collection = db[Config.MONGODB_COLLECTION]
 
-# Function to concatenate the specified fields
-def concatenate_fields(document):
-    concatenated_text = 'Sub Category: ' + document["sub_category"] + '; Product Name: ' + document["name"]+ '; Product Description: ' + document["description"] + '; Product Materials:  ' + document["material"] + '; '
-    concatenated_text += 'Available Colours: ' + ' '.join(document["colors"]) + '; '
-    return concatenated_text
+# Cached, batched embeddings; dimensions must match what the web app queries with
+embedding_service = EmbeddingService(
+    lambda: aiClient,
+    model=EMBEDDING_MODEL,
+    dimensions=Config.EMBEDDING_DIMENSIONS,
+    persist_path=Config.EMBEDDING_CACHE_PATH
+)
 
 # Function to generate vector embedding using OpenAI
-def generate_embedding(text, model="text-embedding-3-large"):
-   return aiClient.embeddings.create(input = [text], model=model).data[0].embedding
+def generate_embedding(text):
+    return embedding_service.embed(text)
 
-# Read documents, concatenate fields, generate embeddings, and update documents
-for document in collection.find({'created_manually': True}):
-    concatenated_text = concatenate_fields(document)
-    embedding = generate_embedding(concatenated_text)
-    collection.update_one({'_id': document['_id']}, {'$set': {'embeddings': embedding}})
+# Function to generate vector embeddings for many texts in as few requests as possible;
+# every text is embedded once per run, so only the SQLite cache keeps them
+def generate_embeddings(texts):
+    return embedding_service.embed_many(texts, remember=False)
 
-print("Embeddings generated and updated successfully.")
\ No newline at end of file
+# Function to load the last fully written _id from the checkpoint file
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get('last_id')
+
+# Function to atomically save the last fully written _id to the checkpoint file
+def save_checkpoint(path, last_id):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'last_id': last_id}, f)
+    os.replace(tmp_path, path)
+
+# Function to lazily read products in _id order, yielding batches that still need embedding
+def pending_batches(query, batch_size, stats):
+    batch = []
+    last_id = None
+    for document in collection.find(query, SOURCE_FIELDS).sort('_id', 1).batch_size(batch_size * 4):
+        last_id = document['_id']
+        stats['read'] += 1
+        text = concatenate_fields(document)
+        text_hash = content_hash(text)
+        if document.get('embeddings_hash') == text_hash:
+            stats['skipped'] += 1
+            continue
+        batch.append((document['_id'], text, text_hash))
+        if len(batch) >= batch_size:
+            yield batch, last_id
+            batch = []
+    if batch or last_id is not None:
+        yield batch, last_id
+
+# Function to embed one batch of texts and turn the results into bulk updates
+def embed_batch(batch):
+    if not batch:
+        return []
+    embeddings = generate_embeddings([text for _, text, _ in batch])
+    return [
+        UpdateOne({'_id': _id}, {'$set': {
+            'embeddings': encode_vector(embedding, Config.VECTOR_STORAGE, Config.VECTOR_INT8_SCALE),
+            'embeddings_hash': text_hash
+        }})
+        for (_id, _, text_hash), embedding in zip(batch, embeddings)
+    ]
+
+# Function to run the batched, concurrent and resumable embedding pipeline
+def run_pipeline(batch_size, concurrency, checkpoint_path):
+    query = {'created_manually': True}
+    last_id = load_checkpoint(checkpoint_path)
+    if last_id is not None:
+        query['_id'] = {'$gt': ObjectId(last_id)}
+        print(f"Resuming after {last_id}")
+
+    stats = {'read': 0, 'skipped': 0, 'embedded': 0}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Results are written back in submission order so the checkpoint only
+        # ever covers products whose embeddings are safely stored
+        in_flight = deque()
+        for batch, batch_last_id in pending_batches(query, batch_size, stats):
+            in_flight.append((executor.submit(embed_batch, batch), batch_last_id))
+            if len(in_flight) >= concurrency:
+                write_batch(*in_flight.popleft(), checkpoint_path, stats)
+        while in_flight:
+            write_batch(*in_flight.popleft(), checkpoint_path, stats)
+
+    elapsed = time.perf_counter() - started
+    print(f"Read {stats['read']} products, embedded {stats['embedded']}, skipped {stats['skipped']} unchanged in {elapsed:.1f}s.")
+    # A finished run starts from the beginning next time, relying on the content hash to skip work
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+# Function to write one embedded batch with bulk_write and advance the checkpoint
+def write_batch(future, batch_last_id, checkpoint_path, stats):
+    updates = future.result()
+    if updates:
+        collection.bulk_write(updates, ordered=False)
+        stats['embedded'] += len(updates)
+    save_checkpoint(checkpoint_path, str(batch_last_id))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate product text embeddings with OpenAI.")
+    parser.add_argument('--batch-size', type=int, default=256, help="Texts per embeddings request and per bulk write")
+    parser.add_argument('--concurrency', type=int, default=4, help="Embeddings requests in flight at once")
+    parser.add_argument('--checkpoint', default='product-embeddings.checkpoint.json', help="Checkpoint file used to resume an interrupted run")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    embedding_service.max_batch = args.batch_size
+    run_pipeline(args.batch_size, args.concurrency, args.checkpoint)
+    print("Embeddings generated and updated successfully.")
@@ -0,0 +1,109 @@
+import argparse
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import MongoClient, UpdateOne
+from config import Config
+
+# MongoDB connection details
+client = MongoClient(Config.MONGODB_URI)
+db = client[Config.MONGODB_DATABASE]
+collection = db[Config.MONGODB_COLLECTION]
+recommendations_collection = db[Config.MONGODB_RECOMMENDATIONS_COLLECTION]
+
+# Function to find the top-k nearest neighbours of one product with $vectorSearch
+def nearest_neighbours(product, k, num_candidates):
+    pipeline = [
+        {
+            "$vectorSearch": {
+                "index": "vs_details",
+                "queryVector": product['embeddings'],
+                "path": "embeddings",
+                "numCandidates": max(num_candidates, k + 1),
+                "limit": k + 1,
+            }
+        },
+        {'$match': {'_id': {'$ne': product['_id']}}},
+        {'$limit': k},
+        {'$project': {'_id': 1, 'score': {'$meta': 'vectorSearchScore'}}}
+    ]
+    return [{'product_id': n['_id'], 'score': n['score']} for n in collection.aggregate(pipeline)]
+
+# Function to build the upsert for one product's recommendation row
+def build_row(product, k, num_candidates):
+    neighbours = nearest_neighbours(product, k, num_candidates)
+    return UpdateOne(
+        {'_id': product['_id']},
+        {'$set': {
+            'neighbours': neighbours,
+            'source_hash': product.get('embeddings_hash'),
+            'updated_at': datetime.datetime.utcnow()
+        }},
+        upsert=True
+    )
+
+# Function to walk products and recommendation rows together in _id order, yielding
+# ('stale', _id) for products whose row is missing or was built from other embeddings, and
+# ('orphan', _id) for rows whose product was deleted or lost its embeddings. Products
+# without an embeddings_hash cannot be compared, so they are always stale. Both cursors
+# stream, so memory stays flat however large the catalog.
+def row_changes(full_refresh, batch_size=10000):
+    products = collection.find({'embeddings': {'$exists': True}}, {'embeddings_hash': 1}).sort('_id', 1).batch_size(batch_size)
+    rows = recommendations_collection.find({}, {'source_hash': 1}).sort('_id', 1).batch_size(batch_size)
+    row = next(rows, None)
+    for product in products:
+        while row is not None and row['_id'] < product['_id']:
+            yield 'orphan', row['_id']
+            row = next(rows, None)
+        source_hash = None
+        if row is not None and row['_id'] == product['_id']:
+            source_hash = row.get('source_hash')
+            row = next(rows, None)
+        if full_refresh or source_hash is None or product.get('embeddings_hash') != source_hash:
+            yield 'stale', product['_id']
+    while row is not None:
+        yield 'orphan', row['_id']
+        row = next(rows, None)
+
+# Function to refresh the rows of a batch of products concurrently and write them with bulk_write
+def refresh_batch(product_ids, executor, k, num_candidates):
+    products = list(collection.find({'_id': {'$in': product_ids}}, {'embeddings': 1, 'embeddings_hash': 1}))
+    updates = list(executor.map(lambda product: build_row(product, k, num_candidates), products))
+    if updates:
+        recommendations_collection.bulk_write(updates, ordered=False)
+    return len(updates)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Precompute the nearest-neighbour recommendations of every product.")
+    parser.add_argument('-k', type=int, default=Config.RECOMMENDATIONS_COUNT, help="Neighbours stored per product")
+    parser.add_argument('--num-candidates', type=int, default=50, help="$vectorSearch numCandidates")
+    parser.add_argument('--workers', type=int, default=8, help="Vector searches in flight at once")
+    parser.add_argument('--batch-size', type=int, default=200, help="Products per bulk write")
+    parser.add_argument('--full', action='store_true', help="Rebuild every row instead of only changed products")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    started = time.perf_counter()
+    refreshed = 0
+    deleted = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        batch = []
+        orphans = []
+        for change, product_id in row_changes(args.full):
+            if change == 'orphan':
+                orphans.append(product_id)
+                if len(orphans) >= args.batch_size:
+                    deleted += recommendations_collection.delete_many({'_id': {'$in': orphans}}).deleted_count
+                    orphans = []
+                continue
+            batch.append(product_id)
+            if len(batch) >= args.batch_size:
+                refreshed += refresh_batch(batch, executor, args.k, args.num_candidates)
+                batch = []
+        if batch:
+            refreshed += refresh_batch(batch, executor, args.k, args.num_candidates)
+        if orphans:
+            deleted += recommendations_collection.delete_many({'_id': {'$in': orphans}}).deleted_count
+
+    print(f"Refreshed recommendations for {refreshed} products and deleted {deleted} orphaned rows in {time.perf_counter() - started:.1f}s.")
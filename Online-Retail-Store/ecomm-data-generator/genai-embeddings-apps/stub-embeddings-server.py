@@ -0,0 +1,138 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI endpoints, for running the embedding pipeline and the web
+# app offline. Point them at it with OPENAI_BASE_URL=http://127.0.0.1:8808/v1 and any
+# OPENAI_API_KEY. The web app's tests and benchmarks import it through
+# ecomm-web-app/benchmarks/stub_openai.py.
+#
+#   POST /v1/embeddings        deterministic unit vectors derived from the input text
+#   POST /v1/chat/completions  a canned answer, streamed token by token when stream=true
+#
+# Latencies are configurable so benchmarks can model the real services.
+
+# Output sizes of the OpenAI embedding models, used when no dimensions are requested
+MODEL_DIMENSIONS = {
+    'text-embedding-3-large': 3072,
+    'text-embedding-3-small': 1536,
+    'text-embedding-ada-002': 1536,
+}
+
+ANSWER = ("This piece runs true to size, so order your usual size. It pairs well with dark denim "
+          "and white sneakers for a casual look. I have listed some recommendations below for "
+          "their consideration based on the image and what they asked for.")
+
+# Function to build a deterministic unit vector from the text, so reruns give identical embeddings
+def fake_embedding(text, dimensions):
+    rng = random.Random(hashlib.sha256(text.encode('utf-8')).digest())
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector]
+
+# Minimal OpenAI-compatible handler; latencies are overridden per server by start_stub
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    embedding_latency = 0.0
+    first_token_latency = 0.0
+    token_latency = 0.0
+
+    def _send_json(self, payload):
+        encoded = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        path = self.path.rstrip('/')
+        if path.endswith('/embeddings'):
+            self.embeddings(body)
+        elif path.endswith('/chat/completions'):
+            self.chat_completions(body)
+        else:
+            self.send_error(404)
+
+    def embeddings(self, body):
+        time.sleep(self.embedding_latency)
+        texts = body['input'] if isinstance(body['input'], list) else [body['input']]
+        model = body.get('model', 'text-embedding-3-large')
+        dimensions = body.get('dimensions') or MODEL_DIMENSIONS.get(model, 3072)
+        self._send_json({
+            'object': 'list',
+            'model': model,
+            'data': [{'object': 'embedding', 'index': i, 'embedding': fake_embedding(text, dimensions)} for i, text in enumerate(texts)],
+            'usage': {'prompt_tokens': 0, 'total_tokens': 0},
+        })
+
+    def chat_completions(self, body):
+        model = body.get('model', 'gpt-4o')
+        created = int(time.time())
+        time.sleep(self.first_token_latency)
+        if not body.get('stream'):
+            time.sleep(self.token_latency * len(ANSWER.split()))
+            self._send_json({
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ANSWER}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        words = ANSWER.split(' ')
+        for i, word in enumerate(words):
+            chunk = {
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': {'content': word if i == 0 else ' ' + word}, 'finish_reason': None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            time.sleep(self.token_latency)
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+# Function to start the stub on a background thread and return the server
+def start_stub(host='127.0.0.1', port=0, embedding_latency=0.0, first_token_latency=0.0, token_latency=0.0):
+    handler = type('ConfiguredStubOpenAIHandler', (StubOpenAIHandler,), {
+        'embedding_latency': embedding_latency,
+        'first_token_latency': first_token_latency,
+        'token_latency': token_latency,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve deterministic fake OpenAI embeddings and chat completions for offline runs.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8808)
+    parser.add_argument('--embedding-latency', type=float, default=0.0, help="Seconds per embeddings request")
+    parser.add_argument('--first-token-latency', type=float, default=0.0, help="Seconds before the first chat token")
+    parser.add_argument('--token-latency', type=float, default=0.0, help="Seconds between chat tokens")
+    args = parser.parse_args()
+    server = start_stub(args.host, args.port, args.embedding_latency, args.first_token_latency, args.token_latency)
+    print(f"Stub OpenAI server listening on http://{args.host}:{server.server_address[1]}/v1")
+    threading.Event().wait()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The generator scripts import each other as top-level modules, and vector_codec from
+# the web app, as the scripts themselves do
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.append(os.path.join(APP_DIR, '..', '..', 'ecomm-web-app'))
@@ -0,0 +1,95 @@
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from image_cache import ImageCache, _atomic_write, create_session, fetch_images
+
+IMAGES = {
+    '/a.jpg': b'image a',
+    '/b.jpg': b'image b',
+    # Same bytes as /a.jpg under another URL
+    '/a-copy.jpg': b'image a',
+}
+
+# Local image server counting the requests per path
+@pytest.fixture
+def server():
+    hits = Counter()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits[self.path] += 1
+            content = IMAGES.get(self.path)
+            if content is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", hits
+    httpd.shutdown()
+
+def test_each_unique_url_is_downloaded_once(tmp_path, server):
+    base, hits = server
+    cache = ImageCache(str(tmp_path))
+    urls = [f"{base}/a.jpg"] * 50 + [f"{base}/b.jpg"] * 50 + [f"{base}/a-copy.jpg"]
+
+    resolved = fetch_images(urls, cache, create_session(8), workers=8)
+    assert set(resolved) == set(urls)
+    assert hits == {'/a.jpg': 1, '/b.jpg': 1, '/a-copy.jpg': 1}
+    # Identical bytes share one blob
+    assert resolved[f"{base}/a.jpg"] == resolved[f"{base}/a-copy.jpg"]
+    assert cache.get_image(resolved[f"{base}/b.jpg"]) == b'image b'
+
+    # A second run is served from the cache
+    assert fetch_images(urls, ImageCache(str(tmp_path)), create_session(8), workers=8) == resolved
+    assert sum(hits.values()) == 3
+
+def test_failed_urls_map_to_none(tmp_path, server):
+    base, _ = server
+    resolved = fetch_images([f"{base}/missing.jpg", f"{base}/a.jpg"], ImageCache(str(tmp_path)), create_session(2), workers=2)
+    assert resolved[f"{base}/missing.jpg"] is None
+    assert resolved[f"{base}/a.jpg"] is not None
+
+def test_cache_write_errors_fail_only_that_url(tmp_path, server, monkeypatch):
+    base, _ = server
+    cache = ImageCache(str(tmp_path))
+    put_image = cache.put_image
+
+    def failing_put_image(url, content):
+        if url.endswith('/b.jpg'):
+            raise OSError('No space left on device')
+        return put_image(url, content)
+
+    monkeypatch.setattr(cache, 'put_image', failing_put_image)
+    resolved = fetch_images([f"{base}/a.jpg", f"{base}/b.jpg"], cache, create_session(2), workers=2)
+    assert resolved[f"{base}/b.jpg"] is None
+    assert resolved[f"{base}/a.jpg"] is not None
+
+def test_concurrent_writes_to_one_path(tmp_path):
+    path = str(tmp_path / 'embedding')
+    errors = []
+
+    def write(i):
+        try:
+            for _ in range(50):
+                _atomic_write(path, f"value {i}", 'w')
+        except OSError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert open(path).read().startswith('value ')
+    # No temporary files are left behind
+    assert [p.name for p in tmp_path.iterdir()] == ['embedding']
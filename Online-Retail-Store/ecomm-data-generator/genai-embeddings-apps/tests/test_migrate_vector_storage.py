@@ -0,0 +1,32 @@
+import importlib.util
+import os
+import pytest
+from vector_codec import encode_vector, storage_of
+
+# The script's file name is not a module name, so load it by path
+@pytest.fixture(scope='module')
+def migration():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrate-vector-storage.py')
+    spec = importlib.util.spec_from_file_location('migrate_vector_storage', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+VECTOR = [0.6, 0.8, 0.0, 0.0]
+
+def test_converted_products_are_skipped(migration):
+    document = {'embeddings': encode_vector(VECTOR, 'int8'), 'image_embeddings': [encode_vector(VECTOR, 'int8')]}
+    assert migration.convert(document, 'int8', None, None) is None
+
+def test_image_embeddings_are_converted_on_their_own(migration):
+    # An earlier run converted the text embeddings only
+    document = {'embeddings': encode_vector(VECTOR, 'int8'), 'image_embeddings': [VECTOR, VECTOR]}
+    updates = migration.convert(document, 'int8', None, None)
+    assert set(updates) == {'image_embeddings'}
+    assert [storage_of(vector) for vector in updates['image_embeddings']] == ['int8', 'int8']
+
+def test_embeddings_are_converted(migration):
+    document = {'embeddings': VECTOR}
+    updates = migration.convert(document, 'float32', None, None)
+    assert set(updates) == {'embeddings'}
+    assert storage_of(updates['embeddings']) == 'float32'
@@ -0,0 +1,45 @@
+import importlib.util
+import os
+import mongomock
+import pytest
+from bson import ObjectId
+
+# The script's file name is not a module name, so load it by path
+@pytest.fixture
+def generator(monkeypatch):
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'recommendations-generator.py')
+    spec = importlib.util.spec_from_file_location('recommendations_generator', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    db = mongomock.MongoClient()['retail_store']
+    monkeypatch.setattr(module, 'collection', db['products'])
+    monkeypatch.setattr(module, 'recommendations_collection', db['product_recommendations'])
+    return module
+
+def test_row_changes(generator):
+    ids = sorted(ObjectId() for _ in range(6))
+    generator.collection.insert_many([
+        {'_id': ids[1], 'embeddings': [1.0], 'embeddings_hash': 'a'},
+        {'_id': ids[2], 'embeddings': [1.0], 'embeddings_hash': 'b'},
+        {'_id': ids[3], 'embeddings': [1.0]},
+        {'_id': ids[4], 'embeddings': [1.0], 'embeddings_hash': 'd'},
+        {'_id': ids[5], 'name': 'No embeddings'},
+    ])
+    generator.recommendations_collection.insert_many([
+        {'_id': ids[0], 'source_hash': 'x'},
+        {'_id': ids[1], 'source_hash': 'a'},
+        {'_id': ids[2], 'source_hash': 'old'},
+        {'_id': ids[3], 'source_hash': None},
+        {'_id': ids[5], 'source_hash': 'f'},
+    ])
+
+    assert list(generator.row_changes(False)) == [
+        ('orphan', ids[0]),
+        ('stale', ids[2]),
+        # No hash to compare, so always refreshed
+        ('stale', ids[3]),
+        # No row yet
+        ('stale', ids[4]),
+        ('orphan', ids[5]),
+    ]
+    assert [product_id for change, product_id in generator.row_changes(True) if change == 'stale'] == ids[1:5]
@@ -1,14 +1,15 @@
+import argparse
+import os
 import random
 import string
 import datetime
+import time
+import resource
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pymongo import MongoClient
 from config import Config
 
-# Connect to MongoDB
-client = MongoClient(Config.MONGODB_URI)
-db = client[Config.MONGODB_DATABASE]
-collection = db[Config.MONGODB_COLLECTION]
-
 # Sample data for attributes
 categories = {
     'Women': {
@@ -37,69 +38,149 @@ materials = ['Cashmere', 'Chiffon', 'Cord', 'Cotton', 'Denim', 'Fleece', 'Leathe
 
 conditions = ['Average', 'Good', 'Great', 'Like New', 'New']
 
+# Every (gender, main category, sub category) combination, in a stable order
+combinations = [
+    (gender, main_category, sub_category)
+    for gender in ['Men', 'Women']
+    for main_category in categories[gender]
+    for sub_category in categories[gender][main_category]
+]
+
+# Fixed reference date so a seeded run produces the same dates on every day it is run
+REFERENCE_DATE = datetime.datetime(2024, 6, 1)
+
 # Function to generate a random SKU
-def generate_sku():
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+def generate_sku(rng=random):
+    return ''.join(rng.choices(string.ascii_uppercase + string.digits, k=8))
 
 # Function to generate a random date within the last 6 months
-def generate_random_date():
-    now = datetime.datetime.now()
+def generate_random_date(rng=random, now=None):
+    now = now or datetime.datetime.now()
     six_months_ago = now - datetime.timedelta(days=6*30)
-    return six_months_ago + datetime.timedelta(seconds=random.randint(0, int((now - six_months_ago).total_seconds())))
+    return six_months_ago + datetime.timedelta(seconds=rng.randint(0, int((now - six_months_ago).total_seconds())))
 
 # Function to generate a random review
-def generate_review():
+def generate_review(rng=random, now=None):
     return {
-        'author': f"user{random.randint(1000, 9999)}",
+        'author': f"user{rng.randint(1000, 9999)}",
         'comment': 'This is a sample review.',
-        'date': generate_random_date(),
-        'rating': random.randint(1, 5)
+        'date': generate_random_date(rng, now),
+        'rating': rng.randint(1, 5)
     }
 
 # Function to generate a random product
-def generate_product(gender, main_category, sub_category):
-    brand = random.choice(brands[gender] + designer_brands[gender])
+def generate_product(gender, main_category, sub_category, rng=random, now=None):
+    brand = rng.choice(brands[gender] + designer_brands[gender])
     is_designer = brand in designer_brands[gender]
-    pre_owned = random.choice([True, False])
-    created_at = generate_random_date()
-    updated_at = generate_random_date()
+    pre_owned = rng.choice([True, False])
+    created_at = generate_random_date(rng, now)
+    updated_at = generate_random_date(rng, now)
 
     product = {
         'gender': gender,
         'main_category': main_category,
         'sub_category': sub_category,
-        'sku': generate_sku(),
-        'name': f"{brand} Product {random.randint(1000, 9999)}",
-        'price': round(random.uniform(10, 500), 2),
+        'sku': generate_sku(rng),
+        'name': f"{brand} Product {rng.randint(1000, 9999)}",
+        'price': round(rng.uniform(10, 500), 2),
         'description': f"A high-quality {sub_category.lower()} from {brand}.",
-        'sizes': random.sample(['XS', 'S', 'M', 'L', 'XL'], random.randint(1, 5)),
-        'colors': random.sample(['Red', 'Blue', 'Green', 'Yellow', 'Orange', 'Purple', 'Pink', 'Brown', 'Black', 'Grey', 'White'], random.randint(1, 5)),
+        'sizes': rng.sample(['XS', 'S', 'M', 'L', 'XL'], rng.randint(1, 5)),
+        'colors': rng.sample(['Red', 'Blue', 'Green', 'Yellow', 'Orange', 'Purple', 'Pink', 'Brown', 'Black', 'Grey', 'White'], rng.randint(1, 5)),
         'brand': brand,
         'designer': is_designer,
-        'material': random.choice(materials),
-        'images': [f"https://img.freepik.com/free-vector/summer-clothes-set_74855-446.jpg" for _ in range(random.randint(1, 3))],
-        'stock': random.randint(1, 100),
-        'availability': 'In Stock' if random.random() > 0.1 else 'Out of Stock',
-        'rating': round(random.uniform(1, 5), 1),
-        'reviews': [generate_review() for _ in range(random.randint(0, 10))],
-        'on_sale': random.choice([True, False]),
+        'material': rng.choice(materials),
+        'images': [f"https://img.freepik.com/free-vector/summer-clothes-set_74855-446.jpg" for _ in range(rng.randint(1, 3))],
+        'stock': rng.randint(1, 100),
+        'availability': 'In Stock' if rng.random() > 0.1 else 'Out of Stock',
+        'rating': round(rng.uniform(1, 5), 1),
+        'reviews': [generate_review(rng, now) for _ in range(rng.randint(0, 10))],
+        'on_sale': rng.choice([True, False]),
         'pre_owned': pre_owned,
-        'condition': random.choice(conditions) if pre_owned else None,
-        'sponsored': random.choice([True, False]),
-        'new_in': random.choice([True, False]),
+        'condition': rng.choice(conditions) if pre_owned else None,
+        'sponsored': rng.choice([True, False]),
+        'new_in': rng.choice([True, False]),
         'created_at': created_at,
         'updated_at': updated_at
     }
     return product
 
-# Generate and insert 1000 products for each gender and category
-products = []
-for gender in ['Men', 'Women']:
-    for main_category in categories[gender]:
-        for sub_category in categories[gender][main_category]:
-            for _ in range(1000):
-                products.append(generate_product(gender, main_category, sub_category))
+# Function to generate one batch of products. Each batch has its own RNG derived from
+# the run seed and the batch start, so the output does not depend on the worker count.
+def generate_batch(seed, start, size, now):
+    rng = random.Random(f"{seed}:{start}")
+    products = []
+    for index in range(start, start + size):
+        gender, main_category, sub_category = combinations[index % len(combinations)]
+        products.append(generate_product(gender, main_category, sub_category, rng, now))
+    return products
+
+# Function to lazily yield the (start, size) of every batch in the catalog
+def batch_ranges(count, batch_size):
+    for start in range(0, count, batch_size):
+        yield start, min(batch_size, count - start)
+
+# Function to report peak resident memory of this process and its workers, in MB
+def peak_memory_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return (own + children) / 1024
+
+# Function to stream generated batches from a process pool into MongoDB
+def generate_catalog(collection, count, seed, workers, batch_size, now):
+    started = time.perf_counter()
+    inserted = 0
+    ranges = batch_ranges(count, batch_size)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Keep a bounded window of batches in flight so memory stays flat
+        # however large the catalog is, and write them back in submission order
+        pending = deque()
+        for start, size in ranges:
+            pending.append(executor.submit(generate_batch, seed, start, size, now))
+            if len(pending) >= workers * 2:
+                inserted += write_batch(collection, pending.popleft().result())
+                report_progress(inserted, count, started)
+        while pending:
+            inserted += write_batch(collection, pending.popleft().result())
+            report_progress(inserted, count, started)
+    return inserted, time.perf_counter() - started
+
+# Function to write one batch with an unordered bulk insert
+def write_batch(collection, products):
+    if collection is not None:
+        collection.insert_many(products, ordered=False)
+    return len(products)
+
+# Function to print throughput after every batch written
+def report_progress(inserted, count, started):
+    elapsed = time.perf_counter() - started
+    rate = inserted / elapsed if elapsed else 0
+    print(f"{inserted}/{count} products, {rate:,.0f} docs/sec, peak memory {peak_memory_mb():,.1f} MB", end='\r', flush=True)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic product catalog into MongoDB.")
+    parser.add_argument('--count', type=int, default=1000 * len(combinations), help="Number of products to generate (default: 1000 per sub category)")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for reproducible output (default: random, printed at start)")
+    parser.add_argument('--workers', type=int, default=None, help="Number of generator processes (default: CPU count)")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Products per unordered insert batch")
+    parser.add_argument('--dry-run', action='store_true', help="Generate products without writing them to MongoDB")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    seed = args.seed if args.seed is not None else random.SystemRandom().randrange(2**32)
+    workers = args.workers or os.cpu_count()
+    print(f"Generating {args.count} products with seed {seed} on {workers} workers")
+
+    collection = None
+    if not args.dry_run:
+        # Connect to MongoDB
+        client = MongoClient(Config.MONGODB_URI)
+        db = client[Config.MONGODB_DATABASE]
+        collection = db[Config.MONGODB_COLLECTION]
 
-collection.insert_many(products)
+    inserted, elapsed = generate_catalog(collection, args.count, seed, workers, args.batch_size, REFERENCE_DATE)
 
-print("Inserted products into the MongoDB collection.")
+    print()
+    action = "Generated" if args.dry_run else "Inserted"
+    print(f"{action} {inserted} products in {elapsed:.1f}s "
+          f"({inserted / elapsed:,.0f} docs/sec, peak memory {peak_memory_mb():,.1f} MB).")
@@ -0,0 +1,153 @@
+import datetime
+import threading
+import numpy as np
+from bson.son import SON
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from clients import LazyCollection
+from config import Config
+import structlog
+
+logger = structlog.get_logger()
+
+# Error code of create_index when an index on the same keys exists with other options
+INDEX_OPTIONS_CONFLICT = 85
+
+# Semantic cache of FashionBot answers.
+#
+# Each entry stores a product_id, the question, its embedding, the answer and the
+# recommendations that were returned. A new question for the same product is answered
+# from the cache when its embedding is close enough (cosine similarity) to a stored one.
+# Entries expire through a TTL index on created_at, and each product keeps at most
+# FASHIONBOT_CACHE_MAX_ENTRIES_PER_PRODUCT entries, newest first. When the TTL setting
+# changes, the existing TTL index is updated in place with collMod.
+class AnswerCache:
+    def __init__(self, collection, threshold, ttl_seconds, max_entries_per_product):
+        self.collection = collection
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_product = max_entries_per_product
+        self.hits = 0
+        self.misses = 0
+        self._indexes_ready = False
+        self._lock = threading.Lock()
+
+    def _ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        with self._lock:
+            if not self._indexes_ready:
+                self.collection.create_index([('product_id', ASCENDING), ('created_at', DESCENDING)])
+                try:
+                    self.collection.create_index('created_at', expireAfterSeconds=self.ttl_seconds)
+                except OperationFailure as e:
+                    if e.code != INDEX_OPTIONS_CONFLICT:
+                        raise
+                    try:
+                        self.collection.database.command(self._ttl_update())
+                        logger.info("Updated FashionBot cache TTL", ttl_seconds=self.ttl_seconds)
+                    except Exception as error:
+                        logger.error("Could not update FashionBot cache TTL, keeping the existing one", error=str(error))
+                self._indexes_ready = True
+
+    # collMod command setting the TTL of the existing created_at index
+    def _ttl_update(self):
+        return SON([('collMod', self.collection.name), ('index', {'keyPattern': {'created_at': 1}, 'expireAfterSeconds': self.ttl_seconds})])
+
+    def _recent_entries(self, product_id):
+        return self.collection.find(
+            {'product_id': product_id},
+            {'question_embedding': 1, 'answer': 1, 'recommendations': 1}
+        ).sort('created_at', DESCENDING).limit(self.max_entries_per_product)
+
+    # Function to pick the entry closest to the question, or None below the threshold
+    def _closest(self, product_id, entries, question_embedding):
+        if entries:
+            matrix = np.asarray([entry['question_embedding'] for entry in entries], dtype=np.float32)
+            query = np.asarray(question_embedding, dtype=np.float32)
+            similarities = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)).clip(1e-12)
+            best = int(similarities.argmax())
+            if similarities[best] >= self.threshold:
+                self.hits += 1
+                logger.debug("FashionBot cache hit", product_id=product_id, similarity=float(similarities[best]))
+                return entries[best]
+
+        self.misses += 1
+        return None
+
+    def _new_entry(self, product_id, question, question_embedding, answer, recommendations):
+        return {
+            'product_id': product_id,
+            'question': question,
+            'question_embedding': question_embedding,
+            'answer': answer,
+            'recommendations': recommendations,
+            'hits': 0,
+            'created_at': datetime.datetime.utcnow()
+        }
+
+    def _stale_entries(self, product_id):
+        return self.collection.find({'product_id': product_id}, {'_id': 1}).sort('created_at', DESCENDING).skip(self.max_entries_per_product)
+
+    # Function to return the closest cached entry for the product, or None below the threshold
+    def lookup(self, product_id, question_embedding):
+        self._ensure_indexes()
+        entry = self._closest(product_id, list(self._recent_entries(product_id)), question_embedding)
+        if entry:
+            self.collection.update_one({'_id': entry['_id']}, {'$inc': {'hits': 1}})
+        return entry
+
+    # Function to store a new answer and trim the product's entries to the size cap
+    def store(self, product_id, question, question_embedding, answer, recommendations):
+        self._ensure_indexes()
+        self.collection.insert_one(self._new_entry(product_id, question, question_embedding, answer, recommendations))
+        stale_ids = [entry['_id'] for entry in self._stale_entries(product_id)]
+        if stale_ids:
+            self.collection.delete_many({'_id': {'$in': stale_ids}})
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+# The same cache on an async (motor) collection, used by the ASGI app in async_routes.py
+class AsyncAnswerCache(AnswerCache):
+    async def _ensure_indexes(self):
+        if not self._indexes_ready:
+            await self.collection.create_index([('product_id', ASCENDING), ('created_at', DESCENDING)])
+            try:
+                await self.collection.create_index('created_at', expireAfterSeconds=self.ttl_seconds)
+            except OperationFailure as e:
+                if e.code != INDEX_OPTIONS_CONFLICT:
+                    raise
+                try:
+                    await self.collection.database.command(self._ttl_update())
+                    logger.info("Updated FashionBot cache TTL", ttl_seconds=self.ttl_seconds)
+                except Exception as error:
+                    logger.error("Could not update FashionBot cache TTL, keeping the existing one", error=str(error))
+            self._indexes_ready = True
+
+    async def lookup(self, product_id, question_embedding):
+        await self._ensure_indexes()
+        entries = await self._recent_entries(product_id).to_list(None)
+        entry = self._closest(product_id, entries, question_embedding)
+        if entry:
+            await self.collection.update_one({'_id': entry['_id']}, {'$inc': {'hits': 1}})
+        return entry
+
+    async def store(self, product_id, question, question_embedding, answer, recommendations):
+        await self._ensure_indexes()
+        await self.collection.insert_one(self._new_entry(product_id, question, question_embedding, answer, recommendations))
+        stale_ids = [entry['_id'] async for entry in self._stale_entries(product_id)]
+        if stale_ids:
+            await self.collection.delete_many({'_id': {'$in': stale_ids}})
+
+answer_cache = AnswerCache(
+    LazyCollection(Config.MONGODB_FASHIONBOT_CACHE_COLLECTION),
+    threshold=Config.FASHIONBOT_CACHE_THRESHOLD,
+    ttl_seconds=Config.FASHIONBOT_CACHE_TTL_SECONDS,
+    max_entries_per_product=Config.FASHIONBOT_CACHE_MAX_ENTRIES_PER_PRODUCT
+)
@@ -1,6 +1,5 @@
 from flask import Flask, render_template, jsonify
-from products import products_bp
-from user import user_bp
+from config import Config
 import logging_setup
 import structlog
 import logging
@@ -9,34 +8,54 @@ import logging
 logging.basicConfig(level=logging.DEBUG)
 logger = structlog.get_logger()
 
-# Create Flask app
-app = Flask(__name__)
-
-# Register blueprints
-app.register_blueprint(products_bp)
-app.register_blueprint(user_bp)
-
-# Define the home route
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-# Define the admin route
-@app.route('/admin')
-def admin():
-    return render_template('admin.html')
-
-# Enhanced error handling
-@app.errorhandler(Exception)
-def handle_error(e):
-    logger.error("General error occurred", error=str(e))
-    response = {
-        "error": str(e),
-        "message": "An error occurred while processing your request.",
-        "status_code": 500
-    }
-    return jsonify(response), 500
+# Application factory. MongoDB and OpenAI clients are created lazily by clients.py on
+# first use in each process, so the app is safe to import under gunicorn --preload.
+def create_app():
+    from products import products_bp
+    from user import user_bp
+    from compression import compress_response
+    from metrics import init_metrics
+
+    # Create Flask app
+    app = Flask(__name__)
+
+    # Register blueprints
+    app.register_blueprint(products_bp)
+    app.register_blueprint(user_bp)
+
+    # Compress JSON and page responses for clients that accept it
+    app.after_request(compress_response)
+
+    # Per-route latency, MongoDB and OpenAI timings, served at /metrics
+    if Config.METRICS_ENABLED:
+        init_metrics(app)
+
+    # Define the home route
+    @app.route('/')
+    def index():
+        return render_template('index.html')
+
+    # Define the admin route
+    @app.route('/admin')
+    def admin():
+        return render_template('admin.html')
+
+    # Enhanced error handling
+    @app.errorhandler(Exception)
+    def handle_error(e):
+        logger.error("General error occurred", error=str(e))
+        response = {
+            "error": str(e),
+            "message": "An error occurred while processing your request.",
+            "status_code": 500
+        }
+        return jsonify(response), 500
+
+    return app
+
+# Module-level app for `python app.py` and `gunicorn app:app`
+app = create_app()
 
 # Run the Flask app
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
@@ -0,0 +1,87 @@
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart, request
+from werkzeug.exceptions import HTTPException
+from config import Config
+from compression import COMPRESSIBLE_MIMETYPES, choose_encoding, compress_body
+from metrics import finish_request, start_request
+import structlog
+
+logger = structlog.get_logger()
+
+# Async serving mode: `hypercorn asgi:app` (one event loop per worker).
+#
+# The async read endpoints of async_routes.py (listings, details, recommendations,
+# autocomplete and FashionBot) run on a Quart app with motor and AsyncOpenAI. Every
+# other request - writes, bulk import and export, admin pages, /metrics - is handed to
+# the unchanged Flask app through asgiref's WSGI adapter, which runs it in a thread.
+
+# The request's context carries over to motor's threads, so its MongoDB commands are
+# recorded under its route
+async def _start_timer():
+    start_request(request.method, request.url_rule.rule if request.url_rule else 'unmatched', request.full_path.rstrip('?'))
+
+async def _record_latency(response):
+    finish_request(str(response.status_code))
+    return response
+
+# Same rules as compression.compress_response for the Flask app
+async def _compress_response(response):
+    if not Config.COMPRESSION_ENABLED or 'Content-Encoding' in response.headers:
+        return response
+    if response.status_code < 200 or response.status_code >= 300 or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = await response.get_data()
+    if len(data) < Config.COMPRESSION_MIN_SIZE:
+        return response
+    response.set_data(compress_body(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def create_quart_app():
+    from async_routes import products_bp, user_bp
+
+    app = Quart(__name__)
+    app.register_blueprint(products_bp)
+    app.register_blueprint(user_bp)
+    app.after_request(_compress_response)
+    # Latency and slow request traces of the async routes; the /metrics route itself is served by the Flask app
+    if Config.METRICS_ENABLED:
+        app.before_request(_start_timer)
+        app.after_request(_record_latency)
+    return app
+
+# ASGI application sending a request to the Quart app when it defines the Flask rule the
+# request matches, and to the Flask app otherwise. Matching on the Flask map keeps its
+# precedence, e.g. /products/export is not taken for /products/<product_id>.
+class Router:
+    def __init__(self, async_app, wsgi_app):
+        self.async_app = async_app
+        self.wsgi_app = WsgiToAsgi(wsgi_app)
+        self.routes = wsgi_app.url_map.bind('localhost')
+        self.async_routes = {(rule.rule, method) for rule in async_app.url_map.iter_rules() for method in rule.methods}
+
+    def _is_async(self, scope):
+        try:
+            rule, _ = self.routes.match(scope['path'], method=scope['method'], return_rule=True)
+        except HTTPException:
+            return False
+        return (rule.rule, scope['method']) in self.async_routes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and not self._is_async(scope):
+            return await self.wsgi_app(scope, receive, send)
+        # Lifespan events go to Quart, which starts and stops its own resources
+        return await self.async_app(scope, receive, send)
+
+def create_asgi_app():
+    from app import app as wsgi_app
+
+    return Router(create_quart_app(), wsgi_app)
+
+# Module-level app for `hypercorn asgi:app`
+app = create_asgi_app()
@@ -0,0 +1,343 @@
+import asyncio
+import time
+from quart import Blueprint, Response, request, jsonify
+from bson import ObjectId
+from config import Config
+from clients import AsyncLazyCollection, get_async_openai_client, get_embedding_service
+from cache import RedisBackend, normalize_args
+from serialization import dumps
+from vector_search import AtlasVectorBackend
+from hybrid_search import text_pipeline, vector_projection, fuse, hybrid_response
+from answer_cache import AsyncAnswerCache
+from autocomplete_index import autocomplete_index, autocomplete_refresher
+from metrics import observe_openai
+from products import (
+    LISTING_PROJECTION, PRODUCT_DETAIL_PROJECTION, response_cache, sparse_projection, build_search_clauses,
+    cursor_page_query, cursor_page, listing_pipeline, listing_response, page_too_deep,
+    precomputed_recommendations_pipeline, order_recommendations
+)
+from user import vector_backend, build_conversation, sse_event
+import structlog
+
+# Initialize structured logging
+logger = structlog.get_logger()
+
+# Async versions of the read endpoints of products_bp and user_bp, served by asgi.py.
+#
+# They share the queries, projections, caches and response shapes of the WSGI handlers
+# and only swap the I/O: motor for MongoDB and AsyncOpenAI for chat and embeddings.
+# Independent calls run concurrently, so a FashionBot request waiting on the model holds
+# a coroutine instead of a thread. Writes, exports and admin routes stay on the WSGI app.
+
+products_bp = Blueprint('products', __name__)
+user_bp = Blueprint('user', __name__)
+
+# Collections on the shared async client, with the read preferences of the WSGI handlers
+collection = AsyncLazyCollection()
+listing_collection = AsyncLazyCollection(read_preference=Config.MONGODB_LISTING_READ_PREFERENCE)
+recommendations_collection = AsyncLazyCollection(Config.MONGODB_RECOMMENDATIONS_COLLECTION, read_preference=Config.MONGODB_LISTING_READ_PREFERENCE)
+
+answer_cache = AsyncAnswerCache(
+    AsyncLazyCollection(Config.MONGODB_FASHIONBOT_CACHE_COLLECTION),
+    threshold=Config.FASHIONBOT_CACHE_THRESHOLD,
+    ttl_seconds=Config.FASHIONBOT_CACHE_TTL_SECONDS,
+    max_entries_per_product=Config.FASHIONBOT_CACHE_MAX_ENTRIES_PER_PRODUCT
+)
+
+# Function to build a JSON response with the fast encoder of serialization.py
+def json_response(payload, status=200):
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+# The in-process cache answers from memory; a Redis round trip would block the event
+# loop, so with the shared backend lookups and stores run in a worker thread
+async def cache_get(tag, key):
+    if isinstance(response_cache.backend, RedisBackend):
+        return await asyncio.get_running_loop().run_in_executor(None, response_cache.get, tag, key)
+    return response_cache.get(tag, key)
+
+async def cache_set(entry_key, value):
+    if isinstance(response_cache.backend, RedisBackend):
+        return await asyncio.get_running_loop().run_in_executor(None, response_cache.set, entry_key, value)
+    response_cache.set(entry_key, value)
+
+async def generate_embedding(text):
+    try:
+        return await get_embedding_service().embed_async(text)
+    except Exception as e:
+        logger.error("Error generating embedding", error=str(e))
+        raise
+
+# Function to run a vector search on the configured backend without blocking the loop:
+# $vectorSearch goes through motor, the local engine scores in a worker thread and
+# fetches the matched documents through motor
+async def vector_search(query_vector, limit, projection, exclude_id=None):
+    if isinstance(vector_backend, AtlasVectorBackend):
+        pipeline = vector_backend.pipeline(query_vector, limit, projection, exclude_id)
+        return await listing_collection.aggregate(pipeline).to_list(None)
+
+    matches = await asyncio.get_running_loop().run_in_executor(None, vector_backend.matches, query_vector, limit, exclude_id)
+    documents = await listing_collection.find({'_id': {'$in': [product_id for product_id, _ in matches]}}, projection).to_list(None)
+    return vector_backend.attach_scores(matches, documents)
+
+async def find_recommendations(embedding, product_id, limit=7):
+    recommendations = await vector_search(embedding, limit, LISTING_PROJECTION, exclude_id=ObjectId(product_id))
+    for recommendation in recommendations:
+        recommendation['_id'] = str(recommendation['_id'])
+    return recommendations
+
+async def vector_leg(search_query, projection):
+    embedding = await generate_embedding(search_query)
+    return await vector_search(embedding, Config.HYBRID_CANDIDATES, vector_projection(projection))
+
+async def _no_embedding():
+    return None
+
+@products_bp.route('/products', methods=['GET'])
+async def get_products():
+    try:
+        cache_key = normalize_args(request.args)
+        cached, cache_entry = await cache_get('listing', cache_key)
+        if cached is not None:
+            return json_response(cached)
+
+        page = int(request.args.get('page', 1))
+        limit = 12
+        skip = (page - 1) * limit
+        projection = sparse_projection(request.args.get('fields', ''), LISTING_PROJECTION, allowed=LISTING_PROJECTION)
+
+        if page_too_deep(request.args, page):
+            return jsonify({'error': 'Page too deep', 'message': f'Pages beyond {Config.MAX_OFFSET_PAGE} must be fetched with the cursor parameter', 'status_code': 400}), 400
+
+        must_clauses, should_clauses = build_search_clauses(request.args)
+
+        if request.args.get('mode') == 'hybrid' and request.args.get('q'):
+            text_results, vector_results = await asyncio.gather(
+                listing_collection.aggregate(text_pipeline(must_clauses, should_clauses, projection)).to_list(None),
+                vector_leg(request.args['q'], projection)
+            )
+            response = hybrid_response(fuse(text_results, vector_results, request.args, projection), page, limit)
+            await cache_set(cache_entry, response)
+            return json_response(response)
+
+        if 'cursor' in request.args:
+            pipeline, query = cursor_page_query(request.args['cursor'], must_clauses, should_clauses, limit, projection)
+            if pipeline is not None:
+                products = await listing_collection.aggregate(pipeline).to_list(None)
+            else:
+                products = await listing_collection.find(query, projection).sort('_id', 1).limit(limit).to_list(None)
+            response = cursor_page(products, limit, pipeline is not None)
+            await cache_set(cache_entry, response)
+            return json_response(response)
+
+        pipeline = listing_pipeline(must_clauses, should_clauses, skip, limit, projection)
+        results = await listing_collection.aggregate(pipeline).to_list(1)
+        response = listing_response(results[0] if results else {'products': [], 'meta': []}, page, limit)
+        await cache_set(cache_entry, response)
+        return json_response(response)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'message': 'Invalid request parameters', 'status_code': 400}), 400
+    except Exception as e:
+        logger.error("Error fetching products", error=str(e))
+        return jsonify({'error': str(e), 'message': 'An error occurred while fetching products', 'status_code': 500}), 500
+
+@products_bp.route('/products/<product_id>', methods=['GET'])
+async def get_product(product_id):
+    try:
+        fields = request.args.get('fields', '')
+        product, cache_entry = await cache_get(f'product:{product_id}', fields)
+        if product is not None:
+            return json_response(product)
+
+        projection = sparse_projection(fields, PRODUCT_DETAIL_PROJECTION)
+        product = await collection.find_one({'_id': ObjectId(product_id)}, projection)
+        if product:
+            await cache_set(cache_entry, product)
+            return json_response(product)
+        else:
+            return jsonify({'error': 'Product not found', 'message': 'The product with the specified ID does not exist', 'status_code': 404}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e), 'message': 'Invalid request parameters', 'status_code': 400}), 400
+    except Exception as e:
+        logger.error("Error fetching product", error=str(e))
+        return jsonify({'error': str(e), 'message': 'An error occurred while fetching the product', 'status_code': 500}), 500
+
+@products_bp.route('/products/<product_id>/recommendations', methods=['GET'])
+async def get_recommendations(product_id):
+    try:
+        rows = await recommendations_collection.aggregate(precomputed_recommendations_pipeline(product_id)).to_list(1)
+        if rows:
+            return json_response(order_recommendations(rows[0]))
+
+        # No precomputed row yet, fall back to a live vector search
+        product = await listing_collection.find_one({'_id': ObjectId(product_id)}, {'embeddings': 1})
+        if not product or 'embeddings' not in product:
+            return jsonify({'error': 'Product not found or missing embeddings', 'message': 'The product with the specified ID does not exist or is missing embeddings', 'status_code': 404}), 404
+
+        recommendations = await vector_search(product['embeddings'], Config.RECOMMENDATIONS_COUNT + 1, LISTING_PROJECTION, exclude_id=ObjectId(product_id))
+        return json_response(recommendations)
+    except Exception as e:
+        logger.error("Error fetching recommendations", error=str(e))
+        return jsonify({'error': str(e), 'message': 'An error occurred while fetching recommendations', 'status_code': 500}), 500
+
+@user_bp.route('/fashionbot', methods=['POST'])
+async def fashionbot():
+    try:
+        data = await request.get_json()
+        product_id = data.get('product_id')
+        question = data.get('question')
+
+        if not product_id or not question:
+            logger.error("Product ID and question are required")
+            return jsonify({'error': 'Product ID and question are required', 'status_code': 400}), 400
+
+        # The product lookup and the question embedding do not depend on each other
+        product, cache_embedding = await asyncio.gather(
+            collection.find_one({'_id': ObjectId(product_id)}, {'images': 1}),
+            generate_embedding(question) if Config.FASHIONBOT_CACHE_ENABLED else _no_embedding()
+        )
+
+        # Answer repeated questions about the same product from the semantic cache
+        if cache_embedding is not None:
+            cached = await answer_cache.lookup(product_id, cache_embedding)
+            if cached:
+                return jsonify({'answer': cached['answer'], 'recommendations': cached['recommendations'], 'cached': True})
+
+        if not product or not product.get('images'):
+            logger.error("Product not found or missing images")
+            return jsonify({'error': 'Product not found or missing embeddings or images', 'status_code': 404}), 404
+
+        started = time.perf_counter()
+        completion = await get_async_openai_client().chat.completions.create(
+            model="gpt-4o",
+            messages=build_conversation(question, product['images'][0]),
+        )
+        observe_openai('chat', time.perf_counter() - started)
+        answer_content = completion.choices[0].message.content
+
+        question_embedding = await generate_embedding(f"Question: {question}\nAnswer: {answer_content}")
+        recommendations = await find_recommendations(question_embedding, product_id)
+
+        if cache_embedding is not None:
+            await answer_cache.store(product_id, question, cache_embedding, answer_content, recommendations)
+
+        return jsonify({'answer': answer_content, 'recommendations': recommendations})
+    except Exception as e:
+        logger.error("General Error", error=str(e))
+        return jsonify({'error': 'An unexpected error occurred. Please try again later.', 'status_code': 500}), 500
+
+# Streaming variant of /fashionbot with the events documented in user.py
+@user_bp.route('/fashionbot/stream', methods=['POST'])
+async def fashionbot_stream():
+    try:
+        data = await request.get_json()
+        product_id = data.get('product_id')
+        question = data.get('question')
+
+        if not product_id or not question:
+            logger.error("Product ID and question are required")
+            return jsonify({'error': 'Product ID and question are required', 'status_code': 400}), 400
+
+        question_embedding, product = await asyncio.gather(
+            generate_embedding(question),
+            collection.find_one({'_id': ObjectId(product_id)}, {'images': 1})
+        )
+        if Config.FASHIONBOT_CACHE_ENABLED:
+            cached = await answer_cache.lookup(product_id, question_embedding)
+            if cached:
+                async def replay():
+                    yield sse_event('token', {'text': cached['answer']})
+                    yield sse_event('recommendations', {'stage': 'final', 'items': cached['recommendations']})
+                    yield sse_event('done', {'cached': True})
+                return Response(replay(), mimetype='text/event-stream')
+
+        if not product or not product.get('images'):
+            logger.error("Product not found or missing images")
+            return jsonify({'error': 'Product not found or missing images', 'status_code': 404}), 404
+
+        # Start the first recommendation search now so it overlaps with the model's answer
+        initial_recommendations = asyncio.ensure_future(find_recommendations(question_embedding, product_id))
+        stream_started = time.perf_counter()
+        stream = await get_async_openai_client().chat.completions.create(
+            model="gpt-4o",
+            messages=build_conversation(question, product['images'][0]),
+            stream=True,
+        )
+        observe_openai('chat_stream_connect', time.perf_counter() - stream_started)
+    except Exception as e:
+        logger.error("General Error", error=str(e))
+        return jsonify({'error': 'An unexpected error occurred. Please try again later.', 'status_code': 500}), 500
+
+    async def generate():
+        answer_parts = []
+        initial_sent = False
+        try:
+            async for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    if not answer_parts:
+                        observe_openai('chat_stream_first_token', time.perf_counter() - stream_started)
+                    answer_parts.append(text)
+                    yield sse_event('token', {'text': text})
+                if not initial_sent and initial_recommendations.done():
+                    initial_sent = True
+                    yield sse_event('recommendations', {'stage': 'initial', 'items': initial_recommendations.result()})
+            if not initial_sent:
+                yield sse_event('recommendations', {'stage': 'initial', 'items': await initial_recommendations})
+
+            answer_content = ''.join(answer_parts)
+            observe_openai('chat_stream', time.perf_counter() - stream_started)
+            combined_embedding = await generate_embedding(f"Question: {question}\nAnswer: {answer_content}")
+            recommendations = await find_recommendations(combined_embedding, product_id)
+            yield sse_event('recommendations', {'stage': 'final', 'items': recommendations})
+
+            if Config.FASHIONBOT_CACHE_ENABLED:
+                await answer_cache.store(product_id, question, question_embedding, answer_content, recommendations)
+            yield sse_event('done', {'cached': False})
+        except Exception as e:
+            logger.error("Error streaming FashionBot answer", error=str(e))
+            yield sse_event('error', {'error': 'An unexpected error occurred. Please try again later.'})
+        finally:
+            initial_recommendations.cancel()
+
+    response = Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Answers can stream for longer than Quart's default response timeout
+    response.timeout = None
+    return response
+
+@user_bp.route('/autocomplete', methods=['GET'])
+async def autocomplete():
+    try:
+        search_query = request.args.get('q', '')
+        if not search_query:
+            return jsonify([])
+
+        if Config.AUTOCOMPLETE_BACKEND == 'local':
+            autocomplete_refresher.ensure_started()
+            if autocomplete_index.ready:
+                suggestions = autocomplete_index.suggest(search_query)
+                if suggestions:
+                    return jsonify(suggestions)
+
+        pipeline = [
+            {
+                '$search': {
+                    'index': 'name_ac',
+                    'autocomplete': {
+                        'query': search_query,
+                        'path': 'name',
+                        'fuzzy': {'maxEdits': 1}
+                    }
+                }
+            },
+            {'$limit': Config.AUTOCOMPLETE_LIMIT},
+            {'$project': {
+                '_id': 1,
+                'name': 1
+            }}
+        ]
+
+        results = await listing_collection.aggregate(pipeline).to_list(None)
+        return jsonify([{'id': str(result['_id']), 'name': result['name']} for result in results])
+    except Exception as e:
+        logger.error("Error fetching autocomplete suggestions", error=str(e))
+        return jsonify({'error': str(e), 'message': 'An error occurred while fetching autocomplete suggestions', 'status_code': 500}), 500
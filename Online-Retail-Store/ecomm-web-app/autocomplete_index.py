@@ -0,0 +1,300 @@
+import bisect
+import heapq
+import os
+import re
+import threading
+import time
+from change_streams import watch_changes
+from clients import LazyCollection
+from config import Config
+import structlog
+
+logger = structlog.get_logger()
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+# In-process autocomplete over product names.
+#
+# Every name token is stored in one sorted array of (token, entry) pairs, so all tokens
+# starting with a prefix form one contiguous range found with two bisections. Short
+# prefixes match huge ranges, so the best entries for every prefix up to
+# precomputed_prefix_length characters are ranked once at build time, and longer prefixes
+# scan at most max_scan pairs (most popular first within each token). Suggestions are
+# ordered by popularity; when exact prefixes give too few, prefixes within one edit of
+# the last typed word are tried.
+#
+# Writes are kept in a small overlay (added entries plus removed ids) that is merged into
+# every lookup and folded in by the next rebuild. A rebuild keeps the overlay entries
+# written after it started reading, since its snapshot may not include them. Overlay
+# names are indexed by token in a small sorted list of their own, so lookups stay
+# prefix range scans however many writes arrive between rebuilds, and writes that leave
+# the name and popularity unchanged are ignored.
+class AutocompleteIndex:
+    def __init__(self, limit=5, precomputed_prefix_length=3, max_scan=5000):
+        self.limit = limit
+        self.precomputed_prefix_length = precomputed_prefix_length
+        self.max_scan = max_scan
+        self.ready = False
+        self._lock = threading.Lock()
+        self._entries = []
+        self._positions = {}
+        self._tokens = []
+        self._token_entries = []
+        self._top_by_prefix = {}
+        self._alphabet = ''
+        self._added = {}
+        self._added_tokens = []
+        self._removed = set()
+        # Overlay write sequence number of each product in the overlay
+        self._sequence = 0
+        self._written_at = {}
+
+    # Function to rebuild the index from (id, name, popularity) tuples
+    def build(self, products):
+        with self._lock:
+            started_at = self._sequence
+        entries = []
+        pairs = []
+        top_by_prefix = {}
+        alphabet = set()
+        for product_id, name, popularity in products:
+            index = len(entries)
+            entries.append((product_id, name, popularity))
+            for token in set(tokenize(name)):
+                pairs.append((token, -popularity, index))
+                alphabet.update(token)
+                for length in range(1, min(len(token), self.precomputed_prefix_length) + 1):
+                    heap = top_by_prefix.setdefault(token[:length], [])
+                    # Keep extra candidates so removals and duplicate names do not empty the list
+                    item = (popularity, -index)
+                    if len(heap) < self.limit * 4:
+                        heapq.heappush(heap, item)
+                    elif item > heap[0]:
+                        heapq.heapreplace(heap, item)
+        pairs.sort()
+
+        positions = {product_id: index for index, (product_id, _, _) in enumerate(entries)}
+
+        with self._lock:
+            self._entries = entries
+            self._positions = positions
+            self._tokens = [token for token, _, _ in pairs]
+            self._token_entries = [index for _, _, index in pairs]
+            self._top_by_prefix = {
+                prefix: [-index for _, index in sorted(heap, reverse=True)]
+                for prefix, heap in top_by_prefix.items()
+            }
+            self._alphabet = ''.join(sorted(alphabet))
+            self._written_at = {product_id: sequence for product_id, sequence in self._written_at.items() if sequence > started_at}
+            self._added = {product_id: entry for product_id, entry in self._added.items() if product_id in self._written_at}
+            self._added_tokens = sorted((token, product_id) for product_id, (_, name, _) in self._added.items() for token in set(tokenize(name)))
+            self._removed = {product_id for product_id in self._removed if product_id in self._written_at}
+            self.ready = True
+
+    def _written(self, product_id):
+        self._sequence += 1
+        self._written_at[product_id] = self._sequence
+
+    # Function to return the entry lookups currently see for a product, or None
+    def _current(self, product_id):
+        if product_id in self._added:
+            return self._added[product_id]
+        if product_id in self._removed:
+            return None
+        index = self._positions.get(product_id)
+        return self._entries[index] if index is not None else None
+
+    def _drop_added(self, product_id):
+        entry = self._added.pop(product_id, None)
+        if entry is not None:
+            for token in set(tokenize(entry[1])):
+                position = bisect.bisect_left(self._added_tokens, (token, product_id))
+                if position < len(self._added_tokens) and self._added_tokens[position] == (token, product_id):
+                    del self._added_tokens[position]
+
+    def upsert(self, product_id, name, popularity=0):
+        entry = (product_id, name, popularity)
+        with self._lock:
+            if self._current(product_id) == entry:
+                return
+            self._drop_added(product_id)
+            self._removed.add(product_id)
+            self._added[product_id] = entry
+            for token in set(tokenize(name)):
+                bisect.insort(self._added_tokens, (token, product_id))
+            self._written(product_id)
+
+    def remove(self, product_id):
+        with self._lock:
+            if product_id in self._removed and product_id not in self._added:
+                return
+            self._drop_added(product_id)
+            self._removed.add(product_id)
+            self._written(product_id)
+
+    def _prefix_range(self, prefix):
+        start = bisect.bisect_left(self._tokens, prefix)
+        end = bisect.bisect_left(self._tokens, prefix + '\uffff', start)
+        return start, end
+
+    # Every term must prefix a token of the name; candidates come from the narrowest term
+    def _matches(self, terms):
+        if len(terms) == 1 and len(terms[0]) <= self.precomputed_prefix_length:
+            candidates = self._top_by_prefix.get(terms[0], [])
+        else:
+            start, end = min((self._prefix_range(term) for term in terms), key=lambda bounds: bounds[1] - bounds[0])
+            candidates = self._token_entries[start:min(end, start + self.max_scan)]
+
+        # Candidates are most popular first within each token, so stop once there are enough
+        results = []
+        seen = set()
+        for index in candidates:
+            if index in seen:
+                continue
+            seen.add(index)
+            product_id, name, popularity = self._entries[index]
+            if product_id in self._removed:
+                continue
+            if len(terms) > 1 and not _contains_terms(name, terms):
+                continue
+            results.append((product_id, name, popularity))
+            if len(results) >= self.limit * 4:
+                break
+
+        # Overlay entries come from the prefix range of the longest, usually narrowest, term
+        term = max(terms, key=len)
+        start = bisect.bisect_left(self._added_tokens, (term,))
+        end = bisect.bisect_left(self._added_tokens, (term + '\uffff',), start)
+        for product_id in dict.fromkeys(product_id for _, product_id in self._added_tokens[start:end]):
+            entry = self._added[product_id]
+            if len(terms) == 1 or _contains_terms(entry[1], terms):
+                results.append(entry)
+        return results
+
+    # Function to return up to limit {'id', 'name'} suggestions, most popular first
+    def suggest(self, query):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            results = self._matches(terms)
+            if len(results) < self.limit:
+                seen = {product_id for product_id, _, _ in results}
+                for variant in _edits(terms[-1], self._alphabet):
+                    for result in self._matches(terms[:-1] + [variant]):
+                        if result[0] not in seen:
+                            seen.add(result[0])
+                            results.append(result)
+                    if len(results) >= self.limit * 4:
+                        break
+
+        suggestions = []
+        names = set()
+        for product_id, name, _ in sorted(results, key=lambda result: result[2], reverse=True):
+            if name not in names:
+                names.add(name)
+                suggestions.append({'id': product_id, 'name': name})
+                if len(suggestions) == self.limit:
+                    break
+        return suggestions
+
+def _contains_terms(name, terms):
+    tokens = tokenize(name)
+    return all(any(token.startswith(term) for token in tokens) for term in terms)
+
+# Function to yield every string within one edit (delete, transpose, replace, insert) of word
+def _edits(word, alphabet):
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    for left, right in splits:
+        if right:
+            yield left + right[1:]
+        if len(right) > 1:
+            yield left + right[1] + right[0] + right[2:]
+        for char in alphabet:
+            if right and char != right[0]:
+                yield left + char + right[1:]
+            yield left + char + right
+
+# Function to read (id, name, popularity) for every product with a name
+def load_products(collection):
+    field = Config.AUTOCOMPLETE_POPULARITY_FIELD
+    for product in collection.find({'name': {'$exists': True}}, {'name': 1, field: 1}).batch_size(10000):
+        yield str(product['_id']), product['name'], product.get(field) or 0
+
+# Keeps the index current: a change stream applies writes from every worker as they
+# happen, and a full rebuild runs every AUTOCOMPLETE_REBUILD_SECONDS. The change stream is
+# reopened after errors from the last change applied; when that change is no longer in
+# the oplog it starts over and a rebuild runs straight away. Deployments without change
+# streams (standalone mongod) fall back to the periodic rebuild alone.
+class AutocompleteRefresher:
+    def __init__(self, index, collection, max_retry_seconds=60):
+        self.index = index
+        self.collection = collection
+        self.max_retry_seconds = max_retry_seconds
+        self._pid = None
+        self._lock = threading.Lock()
+        self._rebuild_now = threading.Event()
+
+    # Function to start the background threads once per process
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._rebuild_loop, daemon=True).start()
+                threading.Thread(target=self._watch_loop, daemon=True).start()
+
+    def _rebuild(self):
+        started = time.perf_counter()
+        self.index.build(load_products(self.collection))
+        logger.info("Built autocomplete index", entries=len(self.index._entries), seconds=round(time.perf_counter() - started, 2))
+
+    def _rebuild_loop(self):
+        while True:
+            try:
+                self._rebuild()
+            except Exception as e:
+                logger.error("Error building autocomplete index", error=str(e))
+            self._rebuild_now.wait(Config.AUTOCOMPLETE_REBUILD_SECONDS)
+            self._rebuild_now.clear()
+
+    # Only inserts, replaces, deletes and updates of the name or popularity matter here,
+    # and only those two fields of the looked-up document are sent back
+    def _pipeline(self):
+        field = Config.AUTOCOMPLETE_POPULARITY_FIELD
+        return [
+            {'$match': {'$or': [
+                {'operationType': {'$in': ['insert', 'replace', 'delete']}},
+                {'operationType': 'update', '$or': [
+                    {'updateDescription.updatedFields.name': {'$exists': True}},
+                    {f'updateDescription.updatedFields.{field}': {'$exists': True}},
+                    {'updateDescription.removedFields': {'$in': ['name', field]}}
+                ]}
+            ]}},
+            {'$project': {'operationType': 1, 'documentKey': 1, 'fullDocument.name': 1, f'fullDocument.{field}': 1}}
+        ]
+
+    def _apply(self, change):
+        product_id = str(change['documentKey']['_id'])
+        document = change.get('fullDocument')
+        if change['operationType'] == 'delete' or not document or 'name' not in document:
+            self.index.remove(product_id)
+        else:
+            self.index.upsert(product_id, document['name'], document.get(Config.AUTOCOMPLETE_POPULARITY_FIELD) or 0)
+
+    def _watch_loop(self):
+        watch_changes(self.collection, self._pipeline(), self._apply, 'autocomplete', on_history_lost=self._rebuild_now.set, max_retry_seconds=self.max_retry_seconds)
+        logger.warning("Relying on periodic autocomplete rebuilds")
+
+autocomplete_index = AutocompleteIndex(
+    limit=Config.AUTOCOMPLETE_LIMIT,
+    precomputed_prefix_length=Config.AUTOCOMPLETE_PRECOMPUTED_PREFIX_LENGTH
+)
+autocomplete_refresher = AutocompleteRefresher(
+    autocomplete_index,
+    LazyCollection(read_preference=Config.MONGODB_LISTING_READ_PREFERENCE)
+)
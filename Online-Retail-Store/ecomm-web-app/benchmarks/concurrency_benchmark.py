@@ -0,0 +1,183 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+from pymongo import MongoClient
+
+# Concurrency benchmark comparing the WSGI app with the async ASGI mode.
+#
+# Starts each server as a single worker process against the stub OpenAI server, then
+# opens --chat-clients connections that keep asking FashionBot questions while
+# --catalog-clients connections browse listings and product details. A synchronous
+# worker holds a thread for every chatbot request waiting on the model, so it stalls
+# once the threads are taken; the async worker keeps one coroutine per request.
+#
+# Reports how many chatbot requests the server kept in flight (throughput times the
+# upstream latency of one request, by Little's law), chatbot throughput and latency,
+# and catalog latency while the chatbot load runs. Uses the data and vector snapshot
+# seeded by load_test.py (run it once first).
+#
+#   python benchmarks/concurrency_benchmark.py --chat-clients 300 --threads 32
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import DATABASE, QUESTIONS, load_state
+
+SERVERS = {
+    'wsgi': lambda port, args: ['gunicorn', '--workers', '1', '--threads', str(args.threads), '--bind', f'127.0.0.1:{port}', 'app:app'],
+    'asgi': lambda port, args: ['hypercorn', '--workers', '1', '--bind', f'127.0.0.1:{port}', 'asgi:app'],
+}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def wait_until_ready(port, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"Server exited with code {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/products?page=1')
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit("Server did not become ready")
+
+# Function to run one client until the deadline, recording (kind, ms, status)
+def client(port, kind, state, seed, deadline, results):
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    while time.perf_counter() < deadline:
+        if kind == 'chat':
+            body = json.dumps({'product_id': rng.choice(state['ids']), 'question': rng.choice(QUESTIONS)})
+            method, path, headers = 'POST', '/fashionbot', {'Content-Type': 'application/json'}
+        else:
+            body, headers, method = None, {}, 'GET'
+            path = f"/products?page={rng.randint(1, 3)}" if rng.random() < 0.5 else f"/products/{rng.choice(state['ids'])}"
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+            status = 0
+        results.append((kind, (time.perf_counter() - started) * 1000, status))
+
+def run_server(mode, args, env, state):
+    port = free_port()
+    process = subprocess.Popen(SERVERS[mode](port, args), cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(port, process)
+        results = []
+        deadline = time.perf_counter() + args.duration
+        threads = [
+            threading.Thread(target=client, args=(port, 'chat', state, args.seed * 1000 + i, deadline, results))
+            for i in range(args.chat_clients)
+        ] + [
+            threading.Thread(target=client, args=(port, 'catalog', state, args.seed * 2000 + i, deadline, results))
+            for i in range(args.catalog_clients)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Without the answer cache each question waits on one chat completion and one embedding
+        return summarize(results, time.perf_counter() - started, args.chat_latency + args.embedding_latency)
+    finally:
+        process.terminate()
+        process.wait()
+
+def summarize(results, duration, upstream_seconds):
+    summary = {}
+    for kind in ('chat', 'catalog'):
+        rows = [row for row in results if row[0] == kind]
+        ok = np.array([row[1] for row in rows if 200 <= row[2] < 300]) if rows else np.array([])
+        summary[kind] = {
+            'requests': len(rows),
+            'errors': len(rows) - len(ok),
+            'throughput_rps': len(ok) / duration,
+            'p50_ms': float(np.percentile(ok, 50)) if len(ok) else None,
+            'p95_ms': float(np.percentile(ok, 95)) if len(ok) else None,
+        }
+    summary['chat_in_flight'] = summary['chat']['throughput_rps'] * upstream_seconds
+    return summary
+
+def print_summary(summaries):
+    print(f"\n{'Mode':<6} {'Chats in flight':>16} {'Chat RPS':>9} {'Chat p50':>9} {'Chat p95':>9} {'Chat err':>9} {'Catalog RPS':>12} {'Catalog p95':>12}")
+    for mode, summary in summaries.items():
+        chat, catalog = summary['chat'], summary['catalog']
+        def ms(value):
+            return f"{value:.0f}" if value is not None else '-'
+        print(f"{mode:<6} {summary['chat_in_flight']:>16.0f} {chat['throughput_rps']:>9.1f} {ms(chat['p50_ms']):>9} {ms(chat['p95_ms']):>9} "
+              f"{chat['errors']:>9} {catalog['throughput_rps']:>12.1f} {ms(catalog['p95_ms']):>12}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare concurrent FashionBot capacity of the WSGI and ASGI servers.")
+    parser.add_argument('--mongodb-uri', default='mongodb://127.0.0.1:27017/?directConnection=true')
+    parser.add_argument('--modes', default='wsgi,asgi', help="Servers to run, in order")
+    parser.add_argument('--chat-clients', type=int, default=300, help="Concurrent FashionBot clients")
+    parser.add_argument('--catalog-clients', type=int, default=8, help="Concurrent listing and detail clients")
+    parser.add_argument('--threads', type=int, default=32, help="Threads of the WSGI worker")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds of load per server")
+    parser.add_argument('--chat-latency', type=float, default=0.8, help="Stub chat completion latency in seconds")
+    parser.add_argument('--embedding-latency', type=float, default=0.1, help="Stub embeddings latency in seconds")
+    parser.add_argument('--dimensions', type=int, default=256, help="Embedding dimensions served by the stub")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--work-dir', default=os.path.join(APP_DIR, 'benchmarks', 'results'))
+    parser.add_argument('--output', default=None, help="Optional JSON results file")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    from stub_openai import start_stub
+    stub = start_stub(embedding_latency=args.embedding_latency, first_token_latency=args.chat_latency)
+
+    env = dict(
+        os.environ,
+        MONGODB_URI=args.mongodb_uri,
+        OPENAI_API_KEY='stub',
+        OPENAI_BASE_URL=f"http://127.0.0.1:{stub.server_address[1]}/v1",
+        EMBEDDING_DIMENSIONS=str(args.dimensions),
+        VECTOR_BACKEND='local',
+        VECTOR_SNAPSHOT_PATH=os.path.join(args.work_dir, 'vector-snapshot'),
+        AUTOCOMPLETE_BACKEND='local',
+        CACHE_BACKEND='none',
+        FASHIONBOT_CACHE_ENABLED='false',
+        METRICS_ENABLED='false',
+    )
+    os.environ.update(env)
+    client = MongoClient(args.mongodb_uri)
+    if not client[DATABASE].list_collection_names():
+        sys.exit("No data found; seed it with benchmarks/load_test.py first.")
+    state = load_state(client)
+
+    summaries = {}
+    for mode in args.modes.split(','):
+        print(f"Running {mode}: {args.chat_clients} chat clients, {args.catalog_clients} catalog clients, {args.duration:.0f}s")
+        summaries[mode] = run_server(mode, args, env, state)
+    print_summary(summaries)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'settings': vars(args), 'results': summaries}, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import os
+import random
+import sys
+import time
+import numpy as np
+from pymongo import MongoClient
+from werkzeug.datastructures import MultiDict
+
+# Listing latency of SEARCH_LISTING_MODE=pipeline against stored_source.
+#
+# Runs the aggregation GET /products builds for a seeded set of filter combinations and
+# pages, in both modes against the same server, and reports p50/p95 latency and how
+# often both modes return the same products for a page. Needs Atlas Search with the
+# default index from search-index-mappings.json (including storedSource), e.g. the
+# mongodb/mongodb-atlas-local image seeded by load_test.py.
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from config import Config
+from products import LISTING_PROJECTION, build_search_clauses, listing_pipeline
+
+MODES = ('pipeline', 'stored_source')
+
+# Function to pick seeded (args, page) combinations shaped like storefront traffic
+def build_queries(collection, count, seed):
+    rng = random.Random(seed)
+    brands = sorted(collection.distinct('brand'))
+    categories = sorted(collection.distinct('main_category'))
+    queries = []
+    for _ in range(count):
+        args = {}
+        if rng.random() < 0.5:
+            args['q'] = rng.choice(brands)
+        if rng.random() < 0.5:
+            args['category'] = rng.choice(categories)
+        if rng.random() < 0.3:
+            args['on_sale'] = 'true'
+        if rng.random() < 0.2:
+            args = {}
+        queries.append((MultiDict(args), rng.choice([1, 1, 1, 2, 3, Config.MAX_OFFSET_PAGE])))
+    return queries
+
+def run_query(collection, args, page, limit=12):
+    must_clauses, should_clauses = build_search_clauses(args)
+    pipeline = listing_pipeline(must_clauses, should_clauses, (page - 1) * limit, limit, LISTING_PROJECTION)
+    started = time.perf_counter()
+    result = next(collection.aggregate(pipeline), {'products': []})
+    return (time.perf_counter() - started) * 1000, [product['_id'] for product in result['products']]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare listing latency with and without stored source.")
+    parser.add_argument('--mongodb-uri', default=Config.MONGODB_URI or 'mongodb://127.0.0.1:27017/?directConnection=true')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=3, help="Times each query runs per mode")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    collection = MongoClient(args.mongodb_uri)[Config.MONGODB_DATABASE][Config.MONGODB_COLLECTION]
+    queries = build_queries(collection, args.queries, args.seed)
+
+    latencies = {mode: [] for mode in MODES}
+    pages = {mode: [] for mode in MODES}
+    for round_number in range(args.rounds):
+        # Alternate the order so neither mode always runs on a warmer cache
+        for mode in (MODES if round_number % 2 == 0 else reversed(MODES)):
+            Config.SEARCH_LISTING_MODE = mode
+            for query_args, page in queries:
+                ms, ids = run_query(collection, query_args, page)
+                latencies[mode].append(ms)
+                if round_number == 0:
+                    pages[mode].append(ids)
+
+    print(f"{len(queries)} queries x {args.rounds} rounds")
+    print(f"{'Mode':<14} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for mode in MODES:
+        values = np.array(latencies[mode])
+        print(f"{mode:<14} {np.percentile(values, 50):>8.2f} {np.percentile(values, 95):>8.2f} {np.percentile(values, 99):>8.2f}")
+    # Ties on score may be ordered differently, so compare the sets of products per page
+    same = sum(1 for a, b in zip(*pages.values()) if set(a) == set(b))
+    print(f"Pages with the same products in both modes: {same}/{len(queries)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlparse
+import numpy as np
+from pymongo import MongoClient, monitoring
+
+# Reproducible load test for the web API.
+#
+#   1. Seeds a local MongoDB with generateProducts.py and product-embeddings-generator.py,
+#      using the stub OpenAI server for embeddings, and writes a vector snapshot.
+#   2. Boots the app from app.py in this process with the stub OpenAI server and the
+#      local vector search and autocomplete engines.
+#   3. Drives a weighted, seeded mix of listing, pagination, detail, recommendation,
+#      autocomplete and FashionBot requests from concurrent keep-alive clients.
+#   4. Reports p50/p95/p99 latency, throughput, errors and MongoDB round trips per
+#      request for each endpoint, saves the run as JSON and optionally compares it with
+#      an earlier run, exiting non-zero on a regression.
+#
+# Filtered listings and cursor pages need Atlas Search. They run only when the server
+# answers $search (e.g. the mongodb/mongodb-atlas-local image with the indexes from
+# search-index-mappings.json); otherwise they are left out and the run records it.
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GENERATOR_DIR = os.path.join(APP_DIR, '..', 'ecomm-data-generator')
+EMBEDDINGS_DIR = os.path.join(GENERATOR_DIR, 'genai-embeddings-apps')
+sys.path.insert(0, APP_DIR)
+
+DATABASE = 'retail_store'
+COLLECTION = 'products'
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+QUESTIONS = [
+    "Does this run true to size?",
+    "What shoes would go with this?",
+    "Is this suitable for a summer wedding?",
+    "How should I wash this?",
+]
+
+# Counts the MongoDB commands issued by each request's handler thread. The app reports
+# the count in a response header, so background threads (index refreshers, change
+# streams) are never attributed to a request.
+class RoundTripCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.local = threading.local()
+
+    def started(self, event):
+        counts = getattr(self.local, 'counts', None)
+        if counts is not None:
+            counts[0] += 1
+
+    def succeeded(self, event): pass
+    def failed(self, event): pass
+
+def run(command, cwd, env):
+    print(f"$ {' '.join(command)}")
+    subprocess.run(command, cwd=cwd, env=env, check=True)
+
+# Function to seed the database; refuses anything but a local server unless forced
+def seed(args, env):
+    if urlparse(args.mongodb_uri).hostname not in LOCAL_HOSTS and not args.force:
+        sys.exit("Refusing to drop and reseed a non-local MongoDB; pass --force to do it anyway.")
+
+    client = MongoClient(args.mongodb_uri)
+    client.drop_database(DATABASE)
+    run([sys.executable, 'generateProducts.py', '--count', str(args.products), '--seed', str(args.seed)], GENERATOR_DIR, env)
+    # The embedding generator and the unfiltered listing only cover manually created products
+    client[DATABASE][COLLECTION].update_many({}, {'$set': {'created_manually': True}})
+    run([sys.executable, 'product-embeddings-generator.py', '--checkpoint', os.path.join(args.work_dir, 'embeddings.checkpoint.json')], EMBEDDINGS_DIR, env)
+
+def search_available(client):
+    try:
+        next(client[DATABASE][COLLECTION].aggregate([{'$search': {'index': 'default', 'exists': {'path': 'name'}}}, {'$limit': 1}]), None)
+        return True
+    except Exception:
+        return False
+
+# Function to import and serve the app in a background thread; returns the base URL
+def start_app(counter):
+    from werkzeug.serving import make_server
+    from app import app
+    from autocomplete_index import autocomplete_index, autocomplete_refresher
+
+    @app.before_request
+    def count_round_trips():
+        counter.local.counts = [0]
+
+    @app.after_request
+    def report_round_trips(response):
+        counts = getattr(counter.local, 'counts', None)
+        if counts is not None:
+            response.headers['X-Mongo-Round-Trips'] = str(counts[0])
+            counter.local.counts = None
+        return response
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    autocomplete_refresher.ensure_started()
+    while not autocomplete_index.ready:
+        time.sleep(0.1)
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+# Request builders; each returns (method, path, json body) from the worker's seeded rng
+def products_unfiltered(rng, state):
+    return 'GET', f"/products?page={rng.randint(1, 3)}", None
+
+def products_filtered(rng, state):
+    params = {'page': rng.randint(1, 3)}
+    if rng.random() < 0.5:
+        params['q'] = rng.choice(state['brands'])
+    if rng.random() < 0.5:
+        params['category'] = rng.choice(state['categories'])
+    if rng.random() < 0.3:
+        params['gender'] = rng.choice(['Men', 'Women'])
+    if rng.random() < 0.3:
+        params['on_sale'] = 'true'
+    if len(params) == 1:
+        params['brand'] = rng.choice(state['brands'])
+    return 'GET', f"/products?{urlencode(params)}", None
+
+def products_deep_page(rng, state):
+    return 'GET', f"/products?q={rng.choice(state['brands'])}&page={rng.randint(10, state['max_page'])}", None
+
+def products_cursor(rng, state):
+    cursor = state.get('cursor') or ''
+    return 'GET', f"/products?{urlencode({'q': state['cursor_query'], 'cursor': cursor})}", None
+
+def product_detail(rng, state):
+    return 'GET', f"/products/{rng.choice(state['ids'])}", None
+
+def recommendations(rng, state):
+    return 'GET', f"/products/{rng.choice(state['ids'])}/recommendations", None
+
+def autocomplete(rng, state):
+    name = rng.choice(state['names'])
+    return 'GET', f"/autocomplete?{urlencode({'q': name[:rng.randint(2, min(8, len(name)))]})}", None
+
+def fashionbot(rng, state):
+    return 'POST', '/fashionbot', {'product_id': rng.choice(state['ids']), 'question': rng.choice(QUESTIONS)}
+
+# name -> (builder, default weight, needs Atlas Search)
+SCENARIOS = {
+    'products': (products_unfiltered, 10, False),
+    'products_filtered': (products_filtered, 25, True),
+    'products_deep_page': (products_deep_page, 5, True),
+    'products_cursor': (products_cursor, 5, True),
+    'product_detail': (product_detail, 20, False),
+    'recommendations': (recommendations, 10, False),
+    'autocomplete': (autocomplete, 25, False),
+    'fashionbot': (fashionbot, 2, False),
+}
+
+# Function to pick the products and terms requests are built from; seeded SKUs make the
+# selection the same on every run
+def load_state(client):
+    from config import Config
+
+    collection = client[DATABASE][COLLECTION]
+    sample = list(collection.find({'embeddings': {'$exists': True}}, {'name': 1}).sort('sku', 1).limit(2000))
+    return {
+        'ids': sorted(str(product['_id']) for product in sample),
+        'names': sorted(product['name'] for product in sample),
+        'brands': sorted(collection.distinct('brand')),
+        'categories': sorted(collection.distinct('main_category')),
+        'cursor_query': 'product',
+        'max_page': Config.MAX_OFFSET_PAGE,
+    }
+
+# Function to run one client until the deadline, recording (scenario, ms, status, round trips)
+def worker(base_url, scenarios, weights, state, seed, deadline, results):
+    rng = random.Random(seed)
+    address = urlparse(base_url)
+    connection = http.client.HTTPConnection(address.hostname, address.port, timeout=60)
+    # Each client keeps its own cursor chain
+    state = dict(state)
+    while time.perf_counter() < deadline:
+        name = rng.choices(scenarios, weights)[0]
+        method, path, body = SCENARIOS[name][0](rng, state)
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = connection.getresponse()
+            payload = response.read()
+            status = response.status
+            round_trips = int(response.getheader('X-Mongo-Round-Trips', 0))
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection(address.hostname, address.port, timeout=60)
+            status, round_trips, payload = 0, 0, b''
+        elapsed = (time.perf_counter() - started) * 1000
+        results.append((name, elapsed, status, round_trips))
+
+        # Cursor pagination follows the next_cursor chain, restarting when it ends
+        if name == 'products_cursor' and status == 200:
+            state['cursor'] = json.loads(payload).get('next_cursor')
+
+def summarize(results, duration):
+    summary = {}
+    for name in sorted({result[0] for result in results}):
+        rows = [result for result in results if result[0] == name]
+        latencies = np.array([row[1] for row in rows])
+        errors = sum(1 for row in rows if not 200 <= row[2] < 300)
+        summary[name] = {
+            'requests': len(rows),
+            'errors': errors,
+            'error_rate': errors / len(rows),
+            'throughput_rps': len(rows) / duration,
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'mean_ms': float(latencies.mean()),
+            'mongo_round_trips_per_request': float(np.mean([row[3] for row in rows])),
+        }
+    return summary
+
+def print_summary(summary, total_rps):
+    print(f"\n{'Endpoint':<20} {'Requests':>9} {'Errors':>7} {'RPS':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'Mongo/req':>10}")
+    for name, row in summary.items():
+        print(f"{name:<20} {row['requests']:>9} {row['errors']:>7} {row['throughput_rps']:>8.1f} {row['p50_ms']:>8.1f} "
+              f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['mongo_round_trips_per_request']:>10.2f}")
+    print(f"Total throughput: {total_rps:.1f} requests/s")
+
+# Function to compare a run with a baseline; returns the list of regressions
+def compare(summary, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['endpoints']
+    regressions = []
+    print(f"\nCompared with {baseline_path} (tolerance {tolerance:.0%})")
+    for name, row in summary.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        p95_change = row['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+        rps_change = row['throughput_rps'] / before['throughput_rps'] - 1 if before['throughput_rps'] else 0.0
+        flags = []
+        if p95_change > tolerance:
+            flags.append('p95')
+        if rps_change < -tolerance:
+            flags.append('throughput')
+        if row['error_rate'] > before['error_rate'] + 0.01:
+            flags.append('errors')
+        if row['mongo_round_trips_per_request'] > before['mongo_round_trips_per_request'] + 0.01:
+            flags.append('round trips')
+        print(f"{name:<20} p95 {p95_change:+.1%}  rps {rps_change:+.1%}  {'REGRESSION: ' + ', '.join(flags) if flags else 'ok'}")
+        if flags:
+            regressions.append(name)
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=APP_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Seed a local MongoDB, boot the app and load test its endpoints.")
+    parser.add_argument('--mongodb-uri', default='mongodb://127.0.0.1:27017/?directConnection=true')
+    parser.add_argument('--products', type=int, default=20000, help="Products to seed")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for the generated data and the request mix")
+    parser.add_argument('--skip-seed', action='store_true', help="Reuse the data and vector snapshot of a previous run")
+    parser.add_argument('--force', action='store_true', help="Allow reseeding a non-local MongoDB")
+    parser.add_argument('--dimensions', type=int, default=256, help="Embedding dimensions served by the stub")
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent clients")
+    parser.add_argument('--duration', type=float, default=60, help="Seconds of measured load")
+    parser.add_argument('--warmup', type=float, default=10, help="Seconds of unmeasured load first")
+    parser.add_argument('--cache', default='none', choices=['none', 'local'], help="Response cache backend")
+    parser.add_argument('--embedding-latency', type=float, default=0.1, help="Stub embeddings latency in seconds")
+    parser.add_argument('--chat-latency', type=float, default=0.8, help="Stub chat completion latency in seconds")
+    parser.add_argument('--weights', default='', help="Scenario weight overrides, e.g. autocomplete=50,fashionbot=0")
+    parser.add_argument('--work-dir', default=os.path.join(APP_DIR, 'benchmarks', 'results'))
+    parser.add_argument('--output', default=None, help="Results file (default: <work-dir>/load-<timestamp>.json)")
+    parser.add_argument('--compare', default=None, help="Earlier results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Allowed relative p95/throughput change")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    os.makedirs(args.work_dir, exist_ok=True)
+
+    from stub_openai import start_stub
+    stub = start_stub(embedding_latency=args.embedding_latency, first_token_latency=args.chat_latency)
+
+    env = dict(
+        os.environ,
+        MONGODB_URI=args.mongodb_uri,
+        OPENAI_API_KEY='stub',
+        OPENAI_BASE_URL=f"http://127.0.0.1:{stub.server_address[1]}/v1",
+        EMBEDDING_DIMENSIONS=str(args.dimensions),
+        VECTOR_BACKEND='local',
+        VECTOR_SNAPSHOT_PATH=os.path.join(args.work_dir, 'vector-snapshot'),
+        AUTOCOMPLETE_BACKEND='local',
+        CACHE_BACKEND=args.cache,
+        FASHIONBOT_CACHE_ENABLED='false',
+    )
+    if not args.skip_seed:
+        seed(args, env)
+    # The app reads its configuration from the environment when it is imported
+    os.environ.update(env)
+
+    client = MongoClient(args.mongodb_uri)
+    if not args.skip_seed:
+        from vector_search import build_snapshot
+        print(f"Wrote {build_snapshot(client[DATABASE][COLLECTION], env['VECTOR_SNAPSHOT_PATH'])} vectors to the snapshot")
+
+    weights = {name: weight for name, (_, weight, _) in SCENARIOS.items()}
+    for override in filter(None, args.weights.split(',')):
+        name, weight = override.split('=')
+        weights[name] = float(weight)
+    has_search = search_available(client)
+    skipped = [name for name, (_, _, needs_search) in SCENARIOS.items() if needs_search and not has_search]
+    if skipped:
+        print(f"Atlas Search is not available; skipping {', '.join(skipped)}")
+    scenarios = [name for name in SCENARIOS if name not in skipped and weights[name] > 0]
+
+    counter = RoundTripCounter()
+    monitoring.register(counter)
+    server, base_url = start_app(counter)
+    state = load_state(client)
+    print(f"App listening on {base_url}; {args.concurrency} clients, {args.warmup:.0f}s warmup, {args.duration:.0f}s measured")
+
+    for phase, duration in (('warmup', args.warmup), ('measured', args.duration)):
+        if duration <= 0:
+            continue
+        results = []
+        deadline = time.perf_counter() + duration
+        threads = [
+            threading.Thread(target=worker, args=(base_url, scenarios, [weights[name] for name in scenarios], state, args.seed * 1000 + i, deadline, results))
+            for i in range(args.concurrency)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    summary = summarize(results, elapsed)
+    print_summary(summary, len(results) / elapsed)
+
+    output = args.output or os.path.join(args.work_dir, f"load-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump({
+            'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+            'weights': {name: weights[name] for name in scenarios},
+            'skipped': skipped,
+            'total_throughput_rps': len(results) / elapsed,
+            'endpoints': summary,
+        }, f, indent=2)
+    print(f"Saved results to {output}")
+
+    if args.compare and compare(summary, args.compare, args.tolerance):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import datetime
+import gzip
+import os
+import random
+import sys
+import time
+from bson import ObjectId
+
+# Payload size and serialization benchmark for product detail and listing responses.
+#
+# Builds documents shaped like generateProducts.py output plus the vectors written by
+# the embedding generators, then compares the old responses (whole document, str()
+# on _id, Flask's stdlib encoder) with the lean ones (PRODUCT_DETAIL_PROJECTION and
+# serialization.dumps), uncompressed, gzipped and brotli-compressed when available.
+# No database is needed; the projections are applied in Python.
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+def sample_product(rng, dimensions, image_dimensions, reviews):
+    now = datetime.datetime(2024, 6, 1)
+    return {
+        '_id': ObjectId(),
+        'gender': 'Women',
+        'main_category': 'Clothing',
+        'sub_category': 'Dresses',
+        'sku': f"SKU{rng.randint(100000, 999999)}",
+        'name': f"Gucci Product {rng.randint(1000, 9999)}",
+        'price': round(rng.uniform(10, 500), 2),
+        'description': "A high-quality dresses from Gucci.",
+        'sizes': ['S', 'M', 'L'],
+        'colors': ['Red', 'Black'],
+        'brand': 'Gucci',
+        'designer': True,
+        'material': 'Silk',
+        'images': ["https://img.freepik.com/free-vector/summer-clothes-set_74855-446.jpg"] * 2,
+        'stock': rng.randint(1, 100),
+        'availability': 'In Stock',
+        'rating': round(rng.uniform(1, 5), 1),
+        'reviews': [
+            {'author': f"user{rng.randint(1000, 9999)}", 'comment': 'This is a sample review.', 'date': now, 'rating': rng.randint(1, 5)}
+            for _ in range(reviews)
+        ],
+        'on_sale': True,
+        'pre_owned': False,
+        'condition': None,
+        'sponsored': False,
+        'new_in': True,
+        'created_at': now,
+        'updated_at': now,
+        'embeddings': [rng.uniform(-0.05, 0.05) for _ in range(dimensions)],
+        'embeddings_hash': '0' * 64,
+        'image_embeddings': [rng.uniform(-0.05, 0.05) for _ in range(image_dimensions)]
+    }
+
+def apply_projection(document, projection):
+    if all(value == 0 or isinstance(value, dict) for value in projection.values()):
+        projected = {key: value for key, value in document.items() if projection.get(key) != 0}
+    else:
+        projected = {key: value for key, value in document.items() if key in projection or key == '_id'}
+    for key, value in projection.items():
+        if isinstance(value, dict) and '$slice' in value and key in projected:
+            projected[key] = projected[key][value['$slice']:]
+    return projected
+
+def old_encode(payload):
+    from flask import json as flask_json
+    return flask_json.dumps(payload).encode('utf-8')
+
+def time_per_call(function, argument, runs):
+    started = time.perf_counter()
+    for _ in range(runs):
+        function(argument)
+    return (time.perf_counter() - started) / runs * 1000
+
+def report(label, encode, payload, runs):
+    from compression import brotli
+    body = encode(payload)
+    row = f"{label:<34} {len(body) / 1024:>9.1f} KB {time_per_call(encode, payload, runs):>9.3f} ms"
+    row += f" {len(gzip.compress(body, 6)) / 1024:>9.1f} KB"
+    row += f" {len(brotli.compress(body, quality=4)) / 1024:>9.1f} KB" if brotli is not None else f" {'n/a':>12}"
+    print(row)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare product payload sizes and serialization times.")
+    parser.add_argument('--dimensions', type=int, default=3072, help="Text embedding dimensions")
+    parser.add_argument('--image-dimensions', type=int, default=512, help="Image embedding dimensions")
+    parser.add_argument('--reviews', type=int, default=10)
+    parser.add_argument('--listing-size', type=int, default=12)
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    from flask import Flask
+    from products import LISTING_PROJECTION, PRODUCT_DETAIL_PROJECTION
+    from serialization import dumps, orjson
+
+    rng = random.Random(42)
+    products = [sample_product(rng, args.dimensions, args.image_dimensions, args.reviews) for _ in range(args.listing_size)]
+
+    old_detail = dict(products[0], _id=str(products[0]['_id']))
+    new_detail = apply_projection(products[0], PRODUCT_DETAIL_PROJECTION)
+    old_listing = {'products': [dict(apply_projection(p, LISTING_PROJECTION), _id=str(p['_id'])) for p in products]}
+    new_listing = {'products': [apply_projection(p, LISTING_PROJECTION) for p in products]}
+
+    print(f"Encoder: {'orjson' if orjson is not None else 'stdlib json (orjson not installed)'}")
+    print(f"{'Payload':<34} {'Size':>12} {'Encode':>12} {'gzip':>12} {'brotli':>12}")
+    with Flask(__name__).app_context():
+        report("detail, full document, jsonify", old_encode, old_detail, args.runs)
+        report("detail, lean projection, fast", dumps, new_detail, args.runs)
+        report("listing, jsonify", old_encode, old_listing, args.runs)
+        report("listing, fast", dumps, new_listing, args.runs)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pymongo import monitoring
+
+# Startup-time and connection-count benchmark for the web app.
+#
+# 1. Imports app.py in fresh interpreters and reports the time to a ready app object.
+# 2. Imports the app once (like gunicorn --preload), forks N workers that each serve
+#    a few requests, and reports how many connection pools and connections each
+#    process opened, plus the server-side connection count if the server is reachable.
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class ConnectionCounter(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self.pools = 0
+        self.connections = 0
+
+    def pool_created(self, event):
+        self.pools += 1
+
+    def connection_created(self, event):
+        self.connections += 1
+
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): pass
+    def connection_check_out_started(self, event): pass
+    def connection_check_out_failed(self, event): pass
+    def connection_checked_out(self, event): pass
+    def connection_checked_in(self, event): pass
+
+def measure_import_time(runs):
+    code = "import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)"
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', code], cwd=APP_DIR, capture_output=True, text=True, check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    timings.sort()
+    print(f"App import + create_app: median {timings[len(timings) // 2] * 1000:.0f} ms over {runs} runs")
+
+def server_connections(client):
+    try:
+        return client.admin.command('serverStatus')['connections']['current']
+    except Exception:
+        return None
+
+def measure_forked_workers(workers, requests_per_worker, paths):
+    counter = ConnectionCounter()
+    monitoring.register(counter)
+    sys.path.insert(0, APP_DIR)
+    from app import app
+    from clients import get_mongo_client
+
+    print(f"After preload import: {counter.pools} pools, {counter.connections} connections in the master")
+    before = server_connections(get_mongo_client())
+
+    children = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            counter.pools = counter.connections = 0
+            client = app.test_client()
+            for _ in range(requests_per_worker):
+                for path in paths:
+                    client.get(path)
+            os.write(write_fd, f"{counter.pools} {counter.connections}".encode())
+            os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+
+    during = server_connections(get_mongo_client())
+    for pid, read_fd in children:
+        pools, connections = os.read(read_fd, 64).decode().split()
+        os.waitpid(pid, 0)
+        print(f"Worker {pid}: {pools} pools, {connections} connections")
+    if before is not None:
+        print(f"Server connections: {before} before workers, {during} while workers ran")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure app startup time and MongoDB connections per worker.")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=10)
+    parser.add_argument('--paths', nargs='+', default=['/products', '/autocomplete?q=pol'])
+    args = parser.parse_args()
+
+    measure_import_time(args.runs)
+    measure_forked_workers(args.workers, args.requests, args.paths)
@@ -0,0 +1,99 @@
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import numpy as np
+from bson import ObjectId
+from pymongo import MongoClient
+
+# Throughput of stock decrements under contention.
+#
+# Seeds --products hot products with --stock units each in a scratch database, then has
+# --clients threads buy random carts of them for --duration seconds, in two modes:
+#
+#   direct     one conditional update_one per cart item, as a handler without
+#              coalescing would do
+#   coalesced  StockUpdater from stock.py, which merges concurrent items into bulk writes
+#
+# Reports items/s, cart latency and the average batch size, and checks that stock never
+# went below zero and that the stock taken equals the items reported as applied.
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from stock import StockUpdater, stock_update
+
+DATABASE = 'stock_benchmark'
+
+def seed(collection, products, stock):
+    collection.drop()
+    ids = collection.insert_many([{'name': f'Product {i}', 'stock': stock, 'availability': 'In Stock'} for i in range(products)]).inserted_ids
+    return [str(product_id) for product_id in ids]
+
+class DirectUpdater:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def apply(self, items):
+        results = []
+        for product_id, delta in items:
+            result = self.collection.update_one({'_id': ObjectId(product_id), 'stock': {'$gte': -delta}}, stock_update(delta))
+            results.append('applied' if result.matched_count else 'insufficient_stock')
+        return results
+
+    def stats(self):
+        return {}
+
+def client(updater, ids, max_cart, seed, deadline, results):
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        cart = [(product_id, -1) for product_id in rng.sample(ids, rng.randint(1, max_cart))]
+        started = time.perf_counter()
+        outcome = updater.apply(cart)
+        results.append(((time.perf_counter() - started) * 1000, sum(1 for result in outcome if result == 'applied'), len(cart)))
+
+def run(mode, collection, args):
+    ids = seed(collection, args.products, args.stock)
+    updater = DirectUpdater(collection) if mode == 'direct' else StockUpdater(collection, window_ms=args.window_ms)
+    results = []
+    deadline = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=client, args=(updater, ids, args.max_cart, args.seed + i, deadline, results)) for i in range(args.clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array([row[0] for row in results])
+    applied = sum(row[1] for row in results)
+    items = sum(row[2] for row in results)
+    stocks = [document['stock'] for document in collection.find({}, {'stock': 1})]
+    taken = args.products * args.stock - sum(stocks)
+    print(f"{mode:<10} {items / elapsed:>10.0f} {applied:>9} {np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 95):>8.1f} "
+          f"{updater.stats().get('items_per_batch', 1.0):>8.1f}  min stock {min(stocks)}, taken {taken} {'ok' if taken == applied and min(stocks) >= 0 else 'MISMATCH'}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark contended stock decrements with and without coalescing.")
+    parser.add_argument('--mongodb-uri', default='mongodb://127.0.0.1:27017/?directConnection=true')
+    parser.add_argument('--products', type=int, default=20, help="Hot products all clients compete for")
+    parser.add_argument('--stock', type=int, default=100000, help="Initial stock per product")
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--max-cart', type=int, default=3, help="Largest number of items per cart")
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--window-ms', type=int, default=2, help="Coalescing window")
+    parser.add_argument('--modes', default='direct,coalesced')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    collection = MongoClient(args.mongodb_uri, maxPoolSize=args.clients)[DATABASE]['products']
+    print(f"{args.clients} clients, {args.products} products, carts of 1-{args.max_cart} items, {args.duration:.0f}s per mode")
+    print(f"{'Mode':<10} {'Items/s':>10} {'Applied':>9} {'p50 ms':>8} {'p95 ms':>8} {'Batch':>8}")
+    for mode in args.modes.split(','):
+        run(mode, collection, args)
+    collection.database.client.drop_database(DATABASE)
+
+if __name__ == '__main__':
+    main()
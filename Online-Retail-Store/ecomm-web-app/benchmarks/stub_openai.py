@@ -0,0 +1,18 @@
+import importlib.util
+import os
+
+# The OpenAI stub lives with the data generator scripts, as
+# ecomm-data-generator/genai-embeddings-apps/stub-embeddings-server.py. Its file name is
+# not importable, so it is loaded from there and re-exported for the benchmarks and tests.
+STUB_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..',
+    'ecomm-data-generator', 'genai-embeddings-apps', 'stub-embeddings-server.py'
+)
+
+_spec = importlib.util.spec_from_file_location('stub_embeddings_server', STUB_PATH)
+_stub = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_stub)
+
+MODEL_DIMENSIONS = _stub.MODEL_DIMENSIONS
+fake_embedding = _stub.fake_embedding
+start_stub = _stub.start_stub
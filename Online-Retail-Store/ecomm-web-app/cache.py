@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import OrderedDict
+import serialization
+from config import Config
+import structlog
+
+logger = structlog.get_logger()
+
+# Size-bounded LRU with per-entry expiry, private to one worker process.
+#
+# Generation counters are bounded too, keeping the max_entries most recently
+# incremented. Generations come from one increasing sequence, and a counter that was
+# dropped reads as the highest generation dropped so far: never lower than the value it
+# had, so entries written before its last invalidation stay unreachable.
+class LocalBackend:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.counters = OrderedDict()
+        self.sequence = 0
+        self.dropped_generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_counters(self, keys):
+        with self.lock:
+            return [self.counters.get(key, self.dropped_generation) for key in keys]
+
+    def incr(self, key):
+        with self.lock:
+            self.sequence += 1
+            self.counters[key] = self.sequence
+            self.counters.move_to_end(key)
+            while len(self.counters) > self.max_entries:
+                _, generation = self.counters.popitem(last=False)
+                self.dropped_generation = max(self.dropped_generation, generation)
+            return self.sequence
+
+# Redis-backed store shared by every gunicorn worker; Redis' own maxmemory LRU bounds its size.
+# Values go through serialization.py, the encoder used for the responses themselves.
+class RedisBackend:
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self.client.get(key)
+        return serialization.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(key, serialization.dumps(value), ex=ttl)
+
+    def get_counters(self, keys):
+        return [int(value or 0) for value in self.client.mget(keys)]
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+# Response cache keyed on normalized request arguments.
+#
+# Entries are grouped under tags ("listing", "product:<id>"). Each tag, plus one global
+# tag, has a generation counter that is part of every key, so invalidating is a single
+# increment and the orphaned entries simply age out. This works the same for in-process
+# and shared backends.
+#
+# get() returns the value together with the entry key it looked up, and set() stores
+# under that entry key. A response built while a write invalidated its tag is then
+# stored under the old generation, where no later lookup finds it.
+class ResponseCache:
+    def __init__(self, backend, ttl, namespace='cache'):
+        self.backend = backend
+        self.ttl = ttl
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, tag, key):
+        global_generation, generation = self.backend.get_counters([f"{self.namespace}:gen:*", f"{self.namespace}:gen:{tag}"])
+        return f"{self.namespace}:{tag}:{global_generation}.{generation}:{key}"
+
+    # Function to look up a response; returns (value or None, entry key for set())
+    def get(self, tag, key):
+        entry_key, value = None, None
+        try:
+            entry_key = self._key(tag, key)
+            value = self.backend.get(entry_key)
+        except Exception as e:
+            logger.error("Cache lookup failed", error=str(e))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value, entry_key
+
+    def set(self, entry_key, value):
+        if entry_key is None:
+            return
+        try:
+            self.backend.set(entry_key, value, self.ttl)
+        except Exception as e:
+            logger.error("Cache store failed", error=str(e))
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            try:
+                self.backend.incr(f"{self.namespace}:gen:{tag}")
+            except Exception as e:
+                logger.error("Cache invalidation failed", tag=tag, error=str(e))
+
+    def invalidate_all(self):
+        self.invalidate('*')
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+# A cache that never stores anything, used when caching is switched off
+class NullCache(ResponseCache):
+    def __init__(self):
+        super().__init__(None, 0)
+
+    def get(self, tag, key):
+        self.misses += 1
+        return None, None
+
+    def set(self, entry_key, value):
+        pass
+
+    def invalidate(self, *tags):
+        pass
+
+# Function to turn request arguments into a stable cache key; empty values are dropped
+# so that "?q=&page=1" and "?page=1" share an entry
+def normalize_args(args):
+    return '&'.join(f"{name}={value}" for name, value in sorted(args.items(multi=True)) if value != '')
+
+# Function to create the cache selected by Config.CACHE_BACKEND
+def create_cache(namespace):
+    if Config.CACHE_BACKEND == 'none':
+        return NullCache()
+    if Config.CACHE_BACKEND == 'redis':
+        backend = RedisBackend(Config.CACHE_REDIS_URL)
+    else:
+        backend = LocalBackend(Config.CACHE_MAX_ENTRIES)
+    return ResponseCache(backend, Config.CACHE_TTL_SECONDS, namespace)
@@ -0,0 +1,38 @@
+import time
+from pymongo.errors import OperationFailure
+import structlog
+
+logger = structlog.get_logger()
+
+# Error codes of a standalone mongod, which has no change streams, and of a resume token
+# that fell off the oplog
+CHANGE_STREAMS_UNSUPPORTED = 40573
+CHANGE_STREAM_HISTORY_LOST = 286
+
+# Function to apply every change of a change stream until the deployment turns out not
+# to support them. The stream is reopened after errors from the last change applied;
+# when that change is no longer in the oplog it starts over and on_history_lost is
+# called so the caller can resynchronize.
+def watch_changes(collection, pipeline, apply, name, on_history_lost=None, max_retry_seconds=60):
+    resume_token = None
+    delay = 1
+    while True:
+        try:
+            with collection.watch(pipeline, full_document='updateLookup', resume_after=resume_token) as stream:
+                for change in stream:
+                    apply(change)
+                    resume_token = stream.resume_token
+                    delay = 1
+        except OperationFailure as e:
+            if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                logger.warning("Change streams unsupported", stream=name, error=str(e))
+                return
+            if e.code == CHANGE_STREAM_HISTORY_LOST:
+                resume_token = None
+                if on_history_lost:
+                    on_history_lost()
+            logger.error("Change stream failed, reopening", stream=name, error=str(e), retry_seconds=delay)
+        except Exception as e:
+            logger.error("Change stream failed, reopening", stream=name, error=str(e), retry_seconds=delay)
+        time.sleep(delay)
+        delay = min(delay * 2, max_retry_seconds)
@@ -0,0 +1,134 @@
+import os
+import threading
+from pymongo import MongoClient
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+from openai import AsyncOpenAI, OpenAI
+from config import Config
+from embedding_service import EmbeddingService
+from metrics import command_listener, observe_openai
+import structlog
+
+logger = structlog.get_logger()
+
+# Shared MongoDB and OpenAI clients for the whole process.
+#
+# Clients are created on first use and remembered together with the pid that created
+# them. A process forked by gunicorn --preload sees a different pid and builds its own
+# clients, so connection pools are never shared across a fork.
+#
+# The async clients (motor and AsyncOpenAI) serve the ASGI app in asgi.py. They bind to
+# the event loop of the first request, and the ASGI server runs one loop per worker.
+
+_lock = threading.Lock()
+_clients = {}
+
+def _get_or_create(name, factory):
+    pid = os.getpid()
+    entry = _clients.get(name)
+    if entry is None or entry[0] != pid:
+        with _lock:
+            entry = _clients.get(name)
+            if entry is None or entry[0] != pid:
+                entry = (pid, factory())
+                _clients[name] = entry
+    return entry[1]
+
+# Pool and timeout options shared by the sync client and the ASGI app's motor client below
+def mongo_client_options():
+    options = {
+        'maxPoolSize': Config.MONGODB_MAX_POOL_SIZE,
+        'minPoolSize': Config.MONGODB_MIN_POOL_SIZE,
+        'maxIdleTimeMS': Config.MONGODB_MAX_IDLE_TIME_MS,
+        'connectTimeoutMS': Config.MONGODB_CONNECT_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': Config.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        'socketTimeoutMS': Config.MONGODB_SOCKET_TIMEOUT_MS,
+        'appname': 'ecomm-web-app',
+        # Do not open connections until the first operation, which happens after fork
+        'connect': False
+    }
+    if Config.MONGODB_COMPRESSORS:
+        options['compressors'] = Config.MONGODB_COMPRESSORS
+    if Config.METRICS_ENABLED:
+        options['event_listeners'] = [command_listener]
+    return options
+
+def _create_mongo_client():
+    client = MongoClient(Config.MONGODB_URI, **mongo_client_options())
+    logger.info("Created MongoDB client", pid=os.getpid(), max_pool_size=Config.MONGODB_MAX_POOL_SIZE)
+    return client
+
+def get_mongo_client():
+    return _get_or_create('mongo', _create_mongo_client)
+
+def get_openai_client():
+    return _get_or_create('openai', lambda: OpenAI(base_url=Config.OPENAI_BASE_URL, timeout=Config.OPENAI_TIMEOUT_SECONDS))
+
+def _create_motor_client():
+    # Imported here so the WSGI app runs without motor installed
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    options = mongo_client_options()
+    options['maxPoolSize'] = Config.ASYNC_MONGODB_MAX_POOL_SIZE
+    client = AsyncIOMotorClient(Config.MONGODB_URI, **options)
+    logger.info("Created async MongoDB client", pid=os.getpid(), max_pool_size=Config.ASYNC_MONGODB_MAX_POOL_SIZE)
+    return client
+
+def get_motor_client():
+    return _get_or_create('motor', _create_motor_client)
+
+def _create_async_openai_client():
+    from httpx import Limits
+    from openai import DefaultAsyncHttpxClient
+
+    # The default pool of 100 connections would queue the chatbot requests beyond it
+    limits = Limits(max_connections=Config.OPENAI_MAX_CONNECTIONS, max_keepalive_connections=Config.OPENAI_MAX_CONNECTIONS)
+    return AsyncOpenAI(base_url=Config.OPENAI_BASE_URL, timeout=Config.OPENAI_TIMEOUT_SECONDS, http_client=DefaultAsyncHttpxClient(limits=limits))
+
+def get_async_openai_client():
+    return _get_or_create('async_openai', _create_async_openai_client)
+
+def get_embedding_service():
+    return _get_or_create('embeddings', lambda: EmbeddingService(
+        get_openai_client,
+        model=Config.EMBEDDING_MODEL,
+        dimensions=Config.EMBEDDING_DIMENSIONS,
+        max_entries=Config.EMBEDDING_CACHE_MAX_ENTRIES,
+        persist_path=Config.EMBEDDING_CACHE_PATH,
+        batch_window_ms=Config.EMBEDDING_BATCH_WINDOW_MS,
+        max_concurrent_requests=Config.EMBEDDING_MAX_CONCURRENT_REQUESTS,
+        timeout=Config.EMBEDDING_TIMEOUT_SECONDS,
+        observer=lambda seconds: observe_openai('embeddings', seconds),
+        async_client_factory=get_async_openai_client
+    ))
+
+# Function to resolve a collection on the shared client, optionally with a read preference
+def get_collection(name=None, read_preference=None):
+    db = get_mongo_client()[Config.MONGODB_DATABASE]
+    if read_preference:
+        return db.get_collection(name or Config.MONGODB_COLLECTION, read_preference=read_preference_from_name(read_preference))
+    return db[name or Config.MONGODB_COLLECTION]
+
+# Function to resolve a collection on the shared async client
+def get_async_collection(name=None, read_preference=None):
+    db = get_motor_client()[Config.MONGODB_DATABASE]
+    if read_preference:
+        return db.get_collection(name or Config.MONGODB_COLLECTION, read_preference=read_preference_from_name(read_preference))
+    return db[name or Config.MONGODB_COLLECTION]
+
+def read_preference_from_name(name):
+    return make_read_preference(read_pref_mode_from_name(name), None)
+
+# Module-level stand-in for a collection that resolves the shared client on every use,
+# so blueprints can keep a module-level handle without connecting at import time
+class LazyCollection:
+    def __init__(self, name=None, read_preference=None):
+        self.name = name
+        self.read_preference = read_preference
+
+    def __getattr__(self, attr):
+        return getattr(get_collection(self.name, self.read_preference), attr)
+
+# LazyCollection on the shared async client
+class AsyncLazyCollection(LazyCollection):
+    def __getattr__(self, attr):
+        return getattr(get_async_collection(self.name, self.read_preference), attr)
@@ -0,0 +1,57 @@
+import gzip
+from flask import request
+from config import Config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Compressible response types; images and already compressed bodies are left alone
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'text/html',
+    'text/css',
+    'text/csv',
+    'text/plain',
+    'application/javascript',
+    'text/javascript'
+}
+
+# after_request hook compressing responses with brotli when the client accepts it and
+# the brotli package is installed, gzip otherwise. Streamed responses (server-sent
+# events, exports) are passed through so they keep flushing incrementally.
+def compress_response(response):
+    if not Config.COMPRESSION_ENABLED:
+        return response
+    if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers:
+        return response
+    if response.status_code < 200 or response.status_code >= 300 or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < Config.COMPRESSION_MIN_SIZE:
+        return response
+
+    response.set_data(compress_body(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def choose_encoding(accept_encoding):
+    accept_encoding = accept_encoding.lower()
+    if brotli is not None and 'br' in accept_encoding:
+        return 'br'
+    if 'gzip' in accept_encoding:
+        return 'gzip'
+    return None
+
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=Config.BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=Config.GZIP_LEVEL)
@@ -9,4 +9,144 @@ class Config:
     MONGODB_URI = os.getenv("MONGODB_URI")
     MONGODB_DATABASE = "retail_store"
     MONGODB_COLLECTION = "products"
+    # Precomputed nearest neighbours, built by recommendations-generator.py
+    MONGODB_RECOMMENDATIONS_COLLECTION = "product_recommendations"
+    # Recommendations per product, the same variable recommendations-generator.py -k defaults to
+    RECOMMENDATIONS_COUNT = int(os.getenv("RECOMMENDATIONS_COUNT", 9))
+    MONGODB_FASHIONBOT_CACHE_COLLECTION = "fashionbot_cache"
+    # Bulk delete and update jobs, see jobs.py
+    MONGODB_JOBS_COLLECTION = "product_jobs"
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    # Optional OpenAI-compatible endpoint, e.g. the local stub in ecomm-data-generator/genai-embeddings-apps/stub-embeddings-server.py
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+    # Seconds before an OpenAI request fails, instead of the client default of ten minutes
+    OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", 60))
+
+    # Listing totals: "total" for exact counts, "lowerBound" to count exactly only up to the threshold
+    SEARCH_COUNT_TYPE = os.getenv("SEARCH_COUNT_TYPE", "lowerBound")
+    SEARCH_COUNT_THRESHOLD = int(os.getenv("SEARCH_COUNT_THRESHOLD", 1000))
+
+    # Deepest page served with $skip; deeper listings must page with the cursor parameter
+    MAX_OFFSET_PAGE = int(os.getenv("MAX_OFFSET_PAGE", 20))
+
+    # Listing pages: "pipeline" sorts and pages in mongod, "stored_source" sorts in the search
+    # index and returns the card fields from its storedSource (see search-index-mappings.json)
+    SEARCH_LISTING_MODE = os.getenv("SEARCH_LISTING_MODE", "pipeline")
+
+    # Hybrid listings (mode=hybrid), see hybrid_search.py: candidates taken from each search,
+    # the reciprocal rank fusion constant and the weight of each ranking
+    HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 100))
+    HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", 60))
+    HYBRID_TEXT_WEIGHT = float(os.getenv("HYBRID_TEXT_WEIGHT", 1.0))
+    HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", 1.0))
+    HYBRID_SPONSORED_WEIGHT = float(os.getenv("HYBRID_SPONSORED_WEIGHT", 0.5))
+    HYBRID_SEARCH_WORKERS = int(os.getenv("HYBRID_SEARCH_WORKERS", 8))
+
+    # Facet counts for GET /products/facets, see search-index-facets.json
+    SEARCH_FACET_INDEX = os.getenv("SEARCH_FACET_INDEX", "facets")
+    FACET_MAX_BUCKETS = int(os.getenv("FACET_MAX_BUCKETS", 50))
+    # Lower bounds of the price buckets; prices above the last one are counted as "other"
+    FACET_PRICE_BOUNDARIES = [float(value) for value in os.getenv("FACET_PRICE_BOUNDARIES", "0,25,50,100,200,500,1000").split(',')]
+
+    # Response cache for product listings and details: "local" (per worker), "redis" (shared) or "none"
+    CACHE_BACKEND = os.getenv("CACHE_BACKEND", "local")
+    CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", 60))
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 1024))
+    CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+    # Vector search: "atlas" ($vectorSearch on vs_details) or "local" (in-process NumPy engine)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "atlas")
+    VECTOR_SNAPSHOT_PATH = os.getenv("VECTOR_SNAPSHOT_PATH", "vector-snapshot")
+    # Must match the similarity declared in vector_search_index.json
+    VECTOR_SIMILARITY = os.getenv("VECTOR_SIMILARITY", "euclidean")
+    # Local engine: "exact" brute force or "ivf" approximate search over VECTOR_IVF_PROBES of VECTOR_IVF_LISTS clusters
+    VECTOR_SEARCH_MODE = os.getenv("VECTOR_SEARCH_MODE", "exact")
+    VECTOR_IVF_LISTS = int(os.getenv("VECTOR_IVF_LISTS", 256))
+    VECTOR_IVF_PROBES = int(os.getenv("VECTOR_IVF_PROBES", 8))
+    # Local engine: updated vectors are folded into the in-memory index once this many accumulate
+    VECTOR_COMPACT_ROWS = int(os.getenv("VECTOR_COMPACT_ROWS", 10000))
+    # Stored encoding of product vectors, see vector_codec.py: "array", "float32" or "int8".
+    # Writes use it and queries are encoded to match; reads accept every encoding
+    VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "array")
+    # int8 quantization scale; unset derives it from the vector dimensions
+    VECTOR_INT8_SCALE = float(os.getenv("VECTOR_INT8_SCALE", 0)) or None
+
+    # Shared MongoDB client pool, see clients.py
+    MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", 50))
+    MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", 0))
+    MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", 60000))
+    MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", 5000))
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 5000))
+    MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", 30000))
+    # Comma-separated wire compressors, e.g. "zstd,snappy,zlib"; empty disables compression
+    MONGODB_COMPRESSORS = os.getenv("MONGODB_COMPRESSORS", "")
+    # Read preference for listing, autocomplete and recommendation reads, e.g. "secondaryPreferred"
+    MONGODB_LISTING_READ_PREFERENCE = os.getenv("MONGODB_LISTING_READ_PREFERENCE", "primary")
+
+    # Semantic FashionBot answer cache, see answer_cache.py
+    FASHIONBOT_CACHE_ENABLED = os.getenv("FASHIONBOT_CACHE_ENABLED", "true") == "true"
+    FASHIONBOT_CACHE_THRESHOLD = float(os.getenv("FASHIONBOT_CACHE_THRESHOLD", 0.92))
+    FASHIONBOT_CACHE_TTL_SECONDS = int(os.getenv("FASHIONBOT_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+    FASHIONBOT_CACHE_MAX_ENTRIES_PER_PRODUCT = int(os.getenv("FASHIONBOT_CACHE_MAX_ENTRIES_PER_PRODUCT", 50))
+
+    # Threads running recommendation searches alongside streamed FashionBot answers
+    FASHIONBOT_STREAM_WORKERS = int(os.getenv("FASHIONBOT_STREAM_WORKERS", 8))
+
+    # Async ASGI mode, see asgi.py: MongoDB pool of the motor client and concurrent OpenAI
+    # connections per worker, sized for hundreds of in-flight FashionBot requests
+    ASYNC_MONGODB_MAX_POOL_SIZE = int(os.getenv("ASYNC_MONGODB_MAX_POOL_SIZE", 100))
+    OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 500))
+
+    # Query embeddings, see embedding_service.py. EMBEDDING_DIMENSIONS must match the stored vectors
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-large")
+    EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", 0)) or None
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 10000))
+    # Optional SQLite file that keeps embeddings across restarts
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+    EMBEDDING_BATCH_WINDOW_MS = int(os.getenv("EMBEDDING_BATCH_WINDOW_MS", 5))
+    # Embeddings requests in flight at once per worker, and seconds before one fails
+    EMBEDDING_MAX_CONCURRENT_REQUESTS = int(os.getenv("EMBEDDING_MAX_CONCURRENT_REQUESTS", 4))
+    EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_TIMEOUT_SECONDS", 10))
+
+    # Autocomplete: "local" (in-process prefix index, see autocomplete_index.py) or "atlas" ($search on name_ac)
+    AUTOCOMPLETE_BACKEND = os.getenv("AUTOCOMPLETE_BACKEND", "local")
+    AUTOCOMPLETE_LIMIT = int(os.getenv("AUTOCOMPLETE_LIMIT", 5))
+    # Numeric product field ranking suggestions, most popular first
+    AUTOCOMPLETE_POPULARITY_FIELD = os.getenv("AUTOCOMPLETE_POPULARITY_FIELD", "rating")
+    AUTOCOMPLETE_PRECOMPUTED_PREFIX_LENGTH = int(os.getenv("AUTOCOMPLETE_PRECOMPUTED_PREFIX_LENGTH", 3))
+    # Full rebuilds; change streams apply writes in between when the deployment supports them
+    AUTOCOMPLETE_REBUILD_SECONDS = int(os.getenv("AUTOCOMPLETE_REBUILD_SECONDS", 900))
+
+    # Bulk NDJSON import and streaming export, see /products/bulk and /products/export
+    BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", 1000))
+    BULK_IMPORT_MAX_REPORTED_ERRORS = int(os.getenv("BULK_IMPORT_MAX_REPORTED_ERRORS", 1000))
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+    # Background bulk delete/update jobs: products per batch, throughput cap, how long a
+    # worker's claim on a job lasts without progress, and how often idle workers look for jobs
+    JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", 500))
+    JOB_MAX_DOCS_PER_SECOND = float(os.getenv("JOB_MAX_DOCS_PER_SECOND", 2000))
+    JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 120))
+    JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 5))
+
+    # Stock updates, see stock.py: how long concurrent requests are collected into one
+    # bulk_write, the largest batch, and the most items one request may carry
+    STOCK_BATCH_WINDOW_MS = int(os.getenv("STOCK_BATCH_WINDOW_MS", 2))
+    STOCK_MAX_BATCH = int(os.getenv("STOCK_MAX_BATCH", 1000))
+    STOCK_MAX_ITEMS_PER_REQUEST = int(os.getenv("STOCK_MAX_ITEMS_PER_REQUEST", 100))
+
+    # Lean product payloads: reviews returned with a product detail, newest last
+    PRODUCT_DETAIL_MAX_REVIEWS = int(os.getenv("PRODUCT_DETAIL_MAX_REVIEWS", 10))
+
+    # Response compression, see compression.py; brotli is used when the package is installed
+    COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true") == "true"
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 500))
+    GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+    BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))
+
+    # Request metrics and the /metrics endpoint, see metrics.py
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true") == "true"
+    # Requests at least this slow are logged with their MongoDB and OpenAI calls
+    METRICS_SLOW_REQUEST_MS = float(os.getenv("METRICS_SLOW_REQUEST_MS", 500))
+    # Fraction of slow requests whose trace is logged
+    METRICS_TRACE_SAMPLE_RATE = float(os.getenv("METRICS_TRACE_SAMPLE_RATE", 1.0))
@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Memoized, micro-batched text embeddings shared by the web app and the generator scripts.
+#
+#   - an in-process LRU, plus an optional SQLite file, keyed by (model, dimensions, sha256 of text);
+#     the LRU holds float32 arrays (4 bytes per dimension rather than a boxed float each)
+#     and hands out lists
+#   - embed() callers arriving within batch_window_ms of each other share one embeddings request;
+#     up to max_concurrent_requests batches are in flight at once, each bounded by timeout
+#   - embed_many() sends large lists in chunks of max_batch texts for offline pipelines, which
+#     pass remember=False to keep a one-pass corpus out of the LRU
+#   - the dimensions parameter is forwarded so query vectors match the stored vectors
+#   - an optional observer is called with the time each caller waited on an embeddings
+#     request, from the caller's thread, so the timing lands in that request's trace
+#   - embed_async() serves the ASGI app through an async client; concurrent callers
+#     asking for the same text await a single request
+#
+# Only the standard library is imported here so scripts outside the web app can use it
+# with their own OpenAI client.
+class EmbeddingService:
+    def __init__(self, client_factory, model="text-embedding-3-large", dimensions=None, max_entries=10000,
+                 persist_path=None, batch_window_ms=5, max_batch=256, observer=None, async_client_factory=None,
+                 max_concurrent_requests=4, timeout=None):
+        self.client_factory = client_factory
+        self.async_client_factory = async_client_factory
+        self.model = model
+        self.dimensions = dimensions
+        self.max_entries = max_entries
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self.max_concurrent_requests = max_concurrent_requests
+        # Seconds before an embeddings request fails; None keeps the client's own timeout
+        self.timeout = timeout
+        self.observer = observer
+        self.hits = 0
+        self.misses = 0
+
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_ready = threading.Condition(self._lock)
+        self._worker_pid = None
+        self._executor = None
+        self._in_flight = {}
+
+        self._db = None
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            self._db_lock = threading.Lock()
+
+    def _key(self, text):
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return f"{self.model}:{self.dimensions or 'full'}:{digest}"
+
+    # Function to look up cached vectors; returns {key: vector} for the keys found
+    def _lookup(self, keys, remember=True):
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[key] = self._lru[key]
+        missing = [key for key in keys if key not in found]
+        if self._db is not None and missing:
+            with self._db_lock:
+                placeholders = ','.join('?' * len(missing))
+                rows = self._db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", missing).fetchall()
+            loaded = {key: array('f', blob) for key, blob in rows}
+            if remember:
+                self._remember(loaded, persist=False)
+            found.update(loaded)
+        return {key: vector.tolist() for key, vector in found.items()}
+
+    def _remember(self, vectors, persist=True, remember=True):
+        if remember:
+            with self._lock:
+                for key, vector in vectors.items():
+                    self._lru[key] = vector if isinstance(vector, array) else array('f', vector)
+                    self._lru.move_to_end(key)
+                while len(self._lru) > self.max_entries:
+                    self._lru.popitem(last=False)
+        if persist and self._db is not None and vectors:
+            with self._db_lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, array('f', vector).tobytes()) for key, vector in vectors.items()]
+                )
+                self._db.commit()
+
+    def _options(self, texts):
+        options = {'input': texts, 'model': self.model}
+        if self.dimensions:
+            options['dimensions'] = self.dimensions
+        if self.timeout:
+            options['timeout'] = self.timeout
+        return options
+
+    def _request(self, texts):
+        response = self.client_factory().embeddings.create(**self._options(texts))
+        vectors = [None] * len(texts)
+        for item in response.data:
+            vectors[item.index] = item.embedding
+        return vectors
+
+    # Function to embed one text, sharing a request with concurrent callers
+    def embed(self, text):
+        key = self._key(text)
+        cached = self._lookup([key])
+        if key in cached:
+            self.hits += 1
+            return cached[key]
+        self.misses += 1
+
+        future = Future()
+        started = time.perf_counter()
+        with self._lock:
+            self._ensure_worker()
+            self._pending.append((key, text, future))
+            self._pending_ready.notify()
+        try:
+            return future.result()
+        finally:
+            self._observe(started)
+
+    def _observe(self, started):
+        if self.observer:
+            self.observer(time.perf_counter() - started)
+
+    async def _request_async(self, key, text):
+        options = self._options([text])
+        started = time.perf_counter()
+        response = await self.async_client_factory().embeddings.create(**options)
+        self._observe(started)
+        vector = response.data[0].embedding
+        self._remember({key: vector})
+        return vector
+
+    # Function to embed one text from a coroutine, sharing a request with concurrent callers
+    async def embed_async(self, text):
+        key = self._key(text)
+        cached = self._lookup([key])
+        if key in cached:
+            self.hits += 1
+            return cached[key]
+        self.misses += 1
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = self._in_flight[key] = asyncio.ensure_future(self._request_async(key, text))
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # A cancelled caller must not cancel the request the others are waiting on
+        return await asyncio.shield(task)
+
+    # Function to embed many texts, reusing cached vectors and batching the rest; with
+    # remember=False new vectors only go to the SQLite file, if any
+    def embed_many(self, texts, remember=True):
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(list(dict.fromkeys(keys)), remember)
+        self.hits += sum(1 for key in keys if key in found)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.misses += len(missing)
+
+        missing_items = list(missing.items())
+        for start in range(0, len(missing_items), self.max_batch):
+            chunk = missing_items[start:start + self.max_batch]
+            started = time.perf_counter()
+            vectors = dict(zip([key for key, _ in chunk], self._request([text for _, text in chunk])))
+            self._observe(started)
+            self._remember(vectors, remember=remember)
+            found.update(vectors)
+        return [found[key] for key in keys]
+
+    # The batching thread and its request pool do not survive a fork, so start them once
+    # per process on first use
+    def _ensure_worker(self):
+        if self._worker_pid != os.getpid():
+            self._worker_pid = os.getpid()
+            self._pending = []
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent_requests, thread_name_prefix='embeddings')
+            threading.Thread(target=self._run_batches, daemon=True).start()
+
+    # Collects batches and hands each to the request pool, so one slow request does not
+    # hold up the batches behind it
+    def _run_batches(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._pending_ready.wait()
+            # Give concurrent callers a moment to join this batch
+            time.sleep(self.batch_window)
+            with self._lock:
+                batch = self._pending[:self.max_batch]
+                self._pending = self._pending[self.max_batch:]
+            self._executor.submit(self._send_batch, batch)
+
+    def _send_batch(self, batch):
+        unique = OrderedDict()
+        for key, text, _ in batch:
+            unique.setdefault(key, text)
+        try:
+            vectors = dict(zip(unique, self._request(list(unique.values()))))
+            self._remember(vectors)
+            for key, _, future in batch:
+                future.set_result(vectors[key])
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._lru)
+        }
@@ -0,0 +1,99 @@
+from config import Config
+
+# Hybrid listing for GET /products?q=...&mode=hybrid.
+#
+# The keyword $search (with every listing filter) and a vector search on the embedded
+# query run at the same time; the callers in products.py and async_routes.py run them on
+# a thread pool or as async tasks. The two ranked lists are merged with weighted
+# reciprocal rank fusion:
+#
+#   score(product) = sum over lists of weight / (HYBRID_RRF_K + rank in that list)
+#
+# Sponsored products are treated as ranking first in a third list weighted by
+# HYBRID_SPONSORED_WEIGHT, which keeps the listing's sponsored boost without letting it
+# outrank products both searches agree on.
+#
+# The vector search cannot evaluate the text filters, so its candidates are kept only
+# when their category, sub-category, gender, brand and sale fields equal the filters
+# (case-insensitively). Candidates found by both searches always pass.
+
+# Listing filter argument -> product field, as in build_search_clauses
+FILTER_FIELDS = {
+    'category': 'main_category',
+    'sub_category': 'sub_category',
+    'gender': 'gender',
+    'brand': 'brand'
+}
+
+# Function to build the keyword leg: the listing $search, cut to the fusion candidates
+def text_pipeline(must_clauses, should_clauses, projection):
+    return [
+        {
+            '$search': {
+                'index': 'default',
+                'compound': {
+                    'must': must_clauses,
+                    'should': should_clauses
+                }
+            }
+        },
+        {'$limit': Config.HYBRID_CANDIDATES},
+        {'$project': {**projection, 'score': {'$meta': 'searchScore'}}}
+    ]
+
+# Fields the vector candidates need for filtering, on top of the requested projection
+def vector_projection(projection):
+    return {**projection, **{field: 1 for field in FILTER_FIELDS.values()}, 'on_sale': 1}
+
+def matches_filters(product, args):
+    for argument, field in FILTER_FIELDS.items():
+        wanted = args.get(argument, '')
+        if wanted and str(product.get(field, '')).lower() != wanted.lower():
+            return False
+    if args.get('on_sale', 'false') == 'true' and not product.get('on_sale'):
+        return False
+    return True
+
+# Function to merge ranked lists of products; lists is [(products, weight), ...]
+def reciprocal_rank_fusion(lists, k):
+    fused = {}
+    for products, weight in lists:
+        for rank, product in enumerate(products, start=1):
+            entry = fused.setdefault(product['_id'], {'product': product, 'score': 0.0})
+            entry['score'] += weight / (k + rank)
+    return fused
+
+# Function to fuse the two legs into the ordered list of products, each with its fused score
+def fuse(text_results, vector_results, args, projection):
+    text_ids = {product['_id'] for product in text_results}
+    vector_results = [product for product in vector_results if product['_id'] in text_ids or matches_filters(product, args)]
+
+    fused = reciprocal_rank_fusion([
+        (text_results, Config.HYBRID_TEXT_WEIGHT),
+        (vector_results, Config.HYBRID_VECTOR_WEIGHT)
+    ], Config.HYBRID_RRF_K)
+    for entry in fused.values():
+        if entry['product'].get('sponsored'):
+            entry['score'] += Config.HYBRID_SPONSORED_WEIGHT / (Config.HYBRID_RRF_K + 1)
+
+    products = []
+    for entry in sorted(fused.values(), key=lambda entry: entry['score'], reverse=True):
+        # Drop the filter-only fields the caller did not ask for
+        product = {field: value for field, value in entry['product'].items() if field == '_id' or field in projection}
+        product['score'] = entry['score']
+        products.append(product)
+    return products
+
+# Function to shape one page of the fused list like the other listing responses
+def hybrid_response(products, page, limit):
+    skip = (page - 1) * limit
+    return {
+        'products': products[skip:skip + limit],
+        'total_pages': (len(products) + limit - 1) // limit,
+        'current_page': page,
+        'total_products': len(products),
+        # Only the top HYBRID_CANDIDATES of each search are fused
+        'total_is_lower_bound': len(products) >= Config.HYBRID_CANDIDATES,
+        'max_page': Config.MAX_OFFSET_PAGE,
+        'mode': 'hybrid'
+    }
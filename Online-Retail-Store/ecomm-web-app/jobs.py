@@ -0,0 +1,237 @@
+import datetime
+import os
+import socket
+import threading
+import time
+from bson import ObjectId, json_util
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.write_concern import WriteConcern
+from config import Config
+import structlog
+
+logger = structlog.get_logger()
+
+# Background jobs for bulk deletes and updates of products.
+#
+# A job records its filter, its update, its status and the last _id it reached in the
+# jobs collection, and is worked through in _id order, JOB_BATCH_SIZE products at a time:
+#
+#   1. read the next batch of matching _ids after last_id (an index-ordered range scan)
+#   2. delete or update exactly those _ids, still under the filter, with majority write
+#      concern so the job runs no faster than the secondaries replicate it
+#   3. record the new last_id and counts, and sleep to stay under JOB_MAX_DOCS_PER_SECOND
+#
+# Any worker process may run a job. Claiming one takes a lease that is renewed after
+# every batch; a job whose lease expired (its process stopped) is claimed again and
+# resumes from last_id. Cancelling sets the status to "cancelling", which the runner
+# notices at the next batch.
+#
+# Statuses: queued -> running -> completed | failed | cancelled
+
+JOB_TYPES = ('delete', 'update')
+ACTIVE_STATUSES = ('queued', 'running', 'cancelling')
+
+# Fields returned by the status endpoints
+JOB_PROJECTION = {
+    'type': 1, 'status': 1, 'filter': 1, 'update': 1, 'total': 1, 'processed': 1, 'affected': 1,
+    'batches': 1, 'error': 1, 'created_at': 1, 'started_at': 1, 'finished_at': 1, 'updated_at': 1
+}
+
+# Function to list the top-level fields an update document writes, including $rename targets
+def updated_fields(update):
+    fields = set()
+    for operator, arguments in update.items():
+        fields.update(arguments)
+        if operator == '$rename':
+            fields.update(arguments.values())
+    return {field.split('.')[0] for field in fields}
+
+class JobRunner:
+    def __init__(self, jobs, products, on_batch=None, on_finished=None):
+        self.jobs = jobs
+        self.products = products
+        # Called with (job type, _ids the batch deleted or updated, update) after each
+        # batch and with the job after it ends
+        self.on_batch = on_batch
+        self.on_finished = on_finished
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._pid = None
+        self._indexes_ready = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def _ensure_indexes(self):
+        if not self._indexes_ready:
+            self.jobs.create_index([('status', ASCENDING), ('created_at', ASCENDING)])
+            self._indexes_ready = True
+
+    # Function to start the runner thread once per process
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self.owner = f"{socket.gethostname()}:{os.getpid()}"
+                threading.Thread(target=self._run_loop, daemon=True).start()
+
+    # Function to queue a job; filter and update are stored as extended JSON so that
+    # operators and ObjectIds survive the round trip
+    def submit(self, job_type, filter_query, update=None):
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type {job_type}")
+        if not isinstance(filter_query, dict):
+            raise ValueError('The filter must be a JSON object')
+        if job_type == 'update' and (not isinstance(update, dict) or not update or not all(key.startswith('$') for key in update)):
+            raise ValueError('The update must be a JSON object of update operators such as $set')
+
+        self._ensure_indexes()
+        now = datetime.datetime.utcnow()
+        job = {
+            'type': job_type,
+            'status': 'queued',
+            'filter': json_util.dumps(filter_query),
+            'update': json_util.dumps(update) if update is not None else None,
+            'last_id': None,
+            'total': None,
+            'processed': 0,
+            'affected': 0,
+            'batches': 0,
+            'owner': None,
+            'lease_expires_at': None,
+            'created_at': now,
+            'updated_at': now
+        }
+        job['_id'] = self.jobs.insert_one(job).inserted_id
+        self.ensure_started()
+        self._wake.set()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.find_one({'_id': ObjectId(job_id)}, JOB_PROJECTION)
+
+    def recent(self, limit=20):
+        return list(self.jobs.find({}, JOB_PROJECTION).sort('created_at', -1).limit(limit))
+
+    # Function to cancel a job; queued jobs stop at once, running ones after their batch
+    def cancel(self, job_id):
+        now = datetime.datetime.utcnow()
+        job = self.jobs.find_one_and_update(
+            {'_id': ObjectId(job_id), 'status': 'queued'},
+            {'$set': {'status': 'cancelled', 'finished_at': now, 'updated_at': now}},
+            projection=JOB_PROJECTION, return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            job = self.jobs.find_one_and_update(
+                {'_id': ObjectId(job_id), 'status': 'running'},
+                {'$set': {'status': 'cancelling', 'updated_at': now}},
+                projection=JOB_PROJECTION, return_document=ReturnDocument.AFTER
+            )
+        return job or self.get(job_id)
+
+    # Function to take the oldest active job nobody holds a live lease on
+    def _claim(self):
+        now = datetime.datetime.utcnow()
+        return self.jobs.find_one_and_update(
+            {
+                'status': {'$in': list(ACTIVE_STATUSES)},
+                '$or': [{'lease_expires_at': None}, {'lease_expires_at': {'$lt': now}}]
+            },
+            {'$set': {'owner': self.owner, 'lease_expires_at': now + datetime.timedelta(seconds=Config.JOB_LEASE_SECONDS)}},
+            sort=[('created_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _run_loop(self):
+        while True:
+            try:
+                self._ensure_indexes()
+                job = self._claim()
+                if job is not None:
+                    self._run(job)
+                    continue
+            except Exception as e:
+                logger.error("Job runner error", error=str(e))
+            self._wake.wait(Config.JOB_POLL_SECONDS)
+            self._wake.clear()
+
+    def _finish(self, job, status, error=None):
+        now = datetime.datetime.utcnow()
+        update = {'status': status, 'finished_at': now, 'updated_at': now, 'lease_expires_at': None}
+        if error:
+            update['error'] = error
+        job = self.jobs.find_one_and_update({'_id': job['_id']}, {'$set': update}, return_document=ReturnDocument.AFTER)
+        logger.info("Job finished", job_id=str(job['_id']), type=job['type'], status=status, processed=job['processed'], affected=job['affected'])
+        if self.on_finished:
+            self.on_finished(job)
+
+    def _run(self, job):
+        if job['status'] == 'cancelling':
+            return self._finish(job, 'cancelled')
+
+        filter_query = json_util.loads(job['filter'])
+        update = json_util.loads(job['update']) if job.get('update') else None
+        now = datetime.datetime.utcnow()
+        if job['status'] == 'queued':
+            # An estimate for progress reporting; the job itself works from the _id ranges
+            total = self.products.count_documents(filter_query)
+            job = self.jobs.find_one_and_update(
+                {'_id': job['_id'], 'status': 'queued', 'owner': self.owner},
+                {'$set': {'status': 'running', 'started_at': now, 'updated_at': now, 'total': total}},
+                return_document=ReturnDocument.AFTER
+            )
+            if job is None:
+                # Cancelled before it started, or the lease went to another process
+                return
+        logger.info("Job started", job_id=str(job['_id']), type=job['type'], resume_after=str(job['last_id']) if job['last_id'] else None)
+
+        products = self.products.with_options(write_concern=WriteConcern(w='majority'))
+        try:
+            while True:
+                started = time.perf_counter()
+                range_query = dict(filter_query)
+                if job['last_id'] is not None:
+                    range_query = {'$and': [filter_query, {'_id': {'$gt': job['last_id']}}]}
+                ids = [document['_id'] for document in self.products.find(range_query, {'_id': 1}).sort('_id', 1).limit(Config.JOB_BATCH_SIZE)]
+                if not ids:
+                    return self._finish(job, 'completed')
+
+                # The filter is applied again so products changed since the scan are left alone
+                batch_query = {'$and': [filter_query, {'_id': {'$in': ids}}]}
+                if job['type'] == 'delete':
+                    affected = products.delete_many(batch_query).deleted_count
+                    # Products that no longer matched the filter are still there
+                    remaining = {document['_id'] for document in self.products.find({'_id': {'$in': ids}}, {'_id': 1})}
+                    changed = [product_id for product_id in ids if product_id not in remaining]
+                else:
+                    # Read before the update, which may change the fields the filter tests
+                    changed = [document['_id'] for document in self.products.find(batch_query, {'_id': 1})]
+                    affected = products.update_many(batch_query, update).modified_count
+                if self.on_batch and changed:
+                    self.on_batch(job['type'], changed, update)
+
+                now = datetime.datetime.utcnow()
+                job = self.jobs.find_one_and_update(
+                    {'_id': job['_id'], 'owner': self.owner},
+                    {
+                        '$set': {
+                            'last_id': ids[-1],
+                            'updated_at': now,
+                            'lease_expires_at': now + datetime.timedelta(seconds=Config.JOB_LEASE_SECONDS)
+                        },
+                        '$inc': {'processed': len(ids), 'affected': affected, 'batches': 1}
+                    },
+                    return_document=ReturnDocument.AFTER
+                )
+                if job is None:
+                    # The lease was lost to another process, which resumes from last_id
+                    logger.warning("Job lease lost", owner=self.owner)
+                    return
+                if job['status'] == 'cancelling':
+                    return self._finish(job, 'cancelled')
+
+                # Rate limit: a batch of n products takes at least n / JOB_MAX_DOCS_PER_SECOND seconds
+                time.sleep(max(0.0, len(ids) / Config.JOB_MAX_DOCS_PER_SECOND - (time.perf_counter() - started)))
+        except Exception as e:
+            logger.error("Job failed", job_id=str(job['_id']), error=str(e))
+            self._finish(job, 'failed', str(e))
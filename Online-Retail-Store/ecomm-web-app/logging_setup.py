@@ -3,6 +3,8 @@ import structlog
 def setup_logging():
     structlog.configure(
         processors=[
+            structlog.processors.add_log_level,
+            structlog.processors.TimeStamper(fmt='iso'),
             structlog.processors.JSONRenderer()
         ]
     )
@@ -0,0 +1,205 @@
+import bisect
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+from flask import Response, request
+from pymongo import monitoring
+from config import Config
+import structlog
+
+logger = structlog.get_logger()
+
+# Request-level performance metrics, exposed in the Prometheus text format at /metrics.
+#
+#   http_request_duration_seconds      per-route latency of every request
+#   mongodb_command_duration_seconds   every MongoDB command, tagged with the route that issued it
+#   mongodb_documents_returned_total   documents returned by those commands
+#   openai_request_duration_seconds    chat completions, time to first streamed token and embeddings
+#                                      (as waited on by the request, batching included)
+#
+# Metrics live in the worker process that recorded them, so scrape each worker (or run
+# one worker per target). Requests slower than METRICS_SLOW_REQUEST_MS are logged with
+# every MongoDB and OpenAI call they made, for a METRICS_TRACE_SAMPLE_RATE fraction of them.
+# Streamed responses are timed until their last chunk has been sent.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _label_text(labelnames, labels):
+    return ','.join(f'{name}="{value}"' for name, value in zip(labelnames, labels))
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # labels -> [bucket counts..., sum, count]
+        self.series = {}
+
+    def observe(self, value, *labels):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {labels: list(values) for labels, values in self.series.items()}
+        for labels, values in sorted(series.items()):
+            label_text = _label_text(self.labelnames, labels)
+            cumulative = 0
+            for bucket, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bucket}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {values[-1]}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {values[-2]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {values[-1]}")
+        return lines
+
+class Counter:
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def inc(self, amount, *labels):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            series = dict(self.series)
+        for labels, value in sorted(series.items()):
+            lines.append(f"{self.name}{{{_label_text(self.labelnames, labels)}}} {value}")
+        return lines
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency by route.', ('method', 'route', 'status'))
+MONGO_COMMAND_LATENCY = Histogram('mongodb_command_duration_seconds', 'MongoDB command latency by command and route.', ('command', 'route'))
+MONGO_DOCUMENTS = Counter('mongodb_documents_returned_total', 'Documents returned by MongoDB commands.', ('command', 'route'))
+OPENAI_LATENCY = Histogram('openai_request_duration_seconds', 'OpenAI request latency by operation.', ('operation',), DEFAULT_BUCKETS + (30.0, 60.0))
+REGISTRY = [REQUEST_LATENCY, MONGO_COMMAND_LATENCY, MONGO_DOCUMENTS, OPENAI_LATENCY]
+
+# The request being served in the current context: its route and the calls it made. The
+# context follows the request into motor's threads and asyncio tasks, and into executor
+# threads when the task is submitted through contextvars.copy_context().run. Work done
+# anywhere else is recorded under the route "background".
+class RequestState:
+    def __init__(self, method, route, path):
+        self.started = time.perf_counter()
+        self.method = method
+        self.route = route
+        self.path = path
+        self.spans = []
+
+_current = contextvars.ContextVar('metrics_request', default=None)
+
+def _current_route():
+    state = _current.get()
+    return state.route if state else 'background'
+
+def _record_span(kind, **fields):
+    state = _current.get()
+    if state is not None:
+        state.spans.append({'kind': kind, **fields})
+
+def _documents_returned(reply):
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+    return reply.get('n', 0)
+
+class CommandMetricsListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        seconds = event.duration_micros / 1e6
+        documents = _documents_returned(event.reply)
+        route = _current_route()
+        MONGO_COMMAND_LATENCY.observe(seconds, event.command_name, route)
+        MONGO_DOCUMENTS.inc(documents, event.command_name, route)
+        _record_span('mongodb', command=event.command_name, ms=round(seconds * 1000, 2), documents=documents)
+
+    def failed(self, event):
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMAND_LATENCY.observe(seconds, event.command_name, _current_route())
+        _record_span('mongodb', command=event.command_name, ms=round(seconds * 1000, 2), error=str(event.failure.get('errmsg', '')))
+
+command_listener = CommandMetricsListener()
+
+# Context manager timing one OpenAI call
+@contextmanager
+def openai_timer(operation):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_openai(operation, time.perf_counter() - started)
+
+def observe_openai(operation, seconds):
+    OPENAI_LATENCY.observe(seconds, operation)
+    _record_span('openai', operation=operation, ms=round(seconds * 1000, 2))
+
+# Function to start timing a request in the current context
+def start_request(method, route, path):
+    _current.set(RequestState(method, route, path))
+
+# Function to record the current request's latency and, when it was slow, its trace
+def finish_request(status):
+    state = _current.get()
+    if state is None:
+        return
+    _current.set(None)
+    seconds = time.perf_counter() - state.started
+    REQUEST_LATENCY.observe(seconds, state.method, state.route, status)
+
+    if seconds * 1000 >= Config.METRICS_SLOW_REQUEST_MS and random.random() < Config.METRICS_TRACE_SAMPLE_RATE:
+        logger.warning(
+            "Slow request",
+            method=state.method,
+            route=state.route,
+            path=state.path,
+            status=status,
+            ms=round(seconds * 1000, 2),
+            spans=state.spans
+        )
+
+def _start_request():
+    start_request(request.method, request.url_rule.rule if request.url_rule else 'unmatched', request.full_path.rstrip('?'))
+
+# A streamed body is produced after after_request, so its request is finished once the
+# server closes the response instead
+def _finish_request(response):
+    status = str(response.status_code)
+    if response.is_streamed:
+        response.call_on_close(lambda: finish_request(status))
+    else:
+        finish_request(status)
+    return response
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+# Function to attach the request timing hooks and the /metrics route to the app
+def init_metrics(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -1,7 +1,27 @@
-from flask import Blueprint, request, jsonify
-from pymongo import MongoClient, errors
-from bson import ObjectId
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from bson import ObjectId, json_util
+from bson.errors import BSONError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from config import Config
+from clients import LazyCollection, get_embedding_service
+from cache import create_cache, normalize_args
+from serialization import json_response
+from vector_codec import encode_vector
+from vector_search import get_vector_backend
+from autocomplete_index import autocomplete_index
+from jobs import JobRunner, updated_fields
+from stock import StockUpdater
+from hybrid_search import text_pipeline, vector_projection, fuse, hybrid_response
+from concurrent.futures import ThreadPoolExecutor
+import base64
+import contextvars
+import csv
+import datetime
+import io
+import json
+import re
+import threading
 import structlog
 
 # Initialize structured logging
@@ -10,156 +30,476 @@ logger = structlog.get_logger()
 # Create blueprint
 products_bp = Blueprint('products', __name__)
 
-# Connect to MongoDB
-try:
-    client = MongoClient(Config.MONGODB_URI)
-    db = client[Config.MONGODB_DATABASE]
-    collection = db[Config.MONGODB_COLLECTION]
-    logger.info("Connected to MongoDB")
-except errors.ConnectionError as e:
-    logger.error("Could not connect to MongoDB", error=str(e))
-    raise
-
-@products_bp.route('/products', methods=['GET'])
-def get_products():
+# Collections on the shared, lazily connected client. Listing and recommendation
+# reads use the configured read preference so they can be served by secondaries.
+collection = LazyCollection()
+listing_collection = LazyCollection(read_preference=Config.MONGODB_LISTING_READ_PREFERENCE)
+recommendations_collection = LazyCollection(Config.MONGODB_RECOMMENDATIONS_COLLECTION, read_preference=Config.MONGODB_LISTING_READ_PREFERENCE)
+
+# Vector search backend selected by Config.VECTOR_BACKEND
+vector_backend = get_vector_backend(listing_collection)
+
+# Cache for listing and detail responses, invalidated by the write handlers below
+response_cache = create_cache('products')
+
+# Keep the in-process indexes in step with each batch: drop deleted products, and
+# re-read updated ones when the update touched a field the indexes hold
+def on_job_batch(job_type, product_ids, update=None):
+    if job_type == 'delete':
+        for product_id in product_ids:
+            vector_backend.remove(product_id)
+            autocomplete_index.remove(str(product_id))
+        return
+
+    popularity_field = Config.AUTOCOMPLETE_POPULARITY_FIELD
+    indexed = {'embeddings', 'name', popularity_field} & updated_fields(update)
+    if not indexed:
+        return
+    for product in collection.find({'_id': {'$in': product_ids}}, {field: 1 for field in indexed | {'name', popularity_field}}):
+        if 'embeddings' in indexed:
+            if 'embeddings' in product:
+                vector_backend.upsert(product['_id'], product['embeddings'])
+            else:
+                vector_backend.remove(product['_id'])
+        if indexed & {'name', popularity_field}:
+            if 'name' in product:
+                autocomplete_index.upsert(str(product['_id']), product['name'], product.get(popularity_field) or 0)
+            else:
+                autocomplete_index.remove(str(product['_id']))
+
+# Invalidate cached responses once per job rather than once per batch
+def on_job_finished(job):
+    if job['affected']:
+        response_cache.invalidate_all()
+
+# Bulk deletes and updates run as throttled background jobs, see jobs.py
+job_runner = JobRunner(LazyCollection(Config.MONGODB_JOBS_COLLECTION), collection, on_batch=on_job_batch, on_finished=on_job_finished)
+
+# Resume interrupted jobs once a worker starts serving
+@products_bp.before_app_request
+def start_job_runner():
+    job_runner.ensure_started()
+
+# Stock changes from concurrent requests share bulk writes, see stock.py; product
+# details show the stock, so their cached responses are dropped
+stock_updater = StockUpdater(
+    collection,
+    window_ms=Config.STOCK_BATCH_WINDOW_MS,
+    max_batch=Config.STOCK_MAX_BATCH,
+    on_applied=lambda product_ids: response_cache.invalidate(*(f'product:{product_id}' for product_id in product_ids))
+)
+
+# Workers running the keyword and vector legs of hybrid listings side by side
+hybrid_executor = ThreadPoolExecutor(max_workers=Config.HYBRID_SEARCH_WORKERS)
+
+# Fields returned for product cards in listings; keep storedSource in search-index-mappings.json in sync
+LISTING_PROJECTION = {
+    'name': 1,
+    'price': 1,
+    'description': 1,
+    'brand': 1,
+    'main_category': 1,
+    'sub_category': 1,
+    'images': 1,
+    'sponsored': 1,
+    'on_sale': 1,
+    'created_manually': 1
+}
+
+# Product details leave out the vectors and their hashes and keep only the newest reviews
+PRODUCT_DETAIL_PROJECTION = {
+    'embeddings': 0,
+    'embeddings_hash': 0,
+    'image_embeddings': 0,
+    'reviews': {'$slice': -Config.PRODUCT_DETAIL_MAX_REVIEWS}
+}
+
+FIELD_NAME_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_.]*$')
+
+# Function to turn a fields= parameter into an inclusion projection. Listings may only
+# narrow LISTING_PROJECTION; details may name any field. Returns default when empty.
+def sparse_projection(fields, default, allowed=None):
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    if not names:
+        return default
+    for name in names:
+        if not FIELD_NAME_PATTERN.match(name) or (allowed is not None and name not in allowed):
+            raise ValueError(f'Unknown field: {name}')
+    projection = {name: 1 for name in names}
+    if 'reviews' in projection:
+        projection['reviews'] = {'$slice': -Config.PRODUCT_DETAIL_MAX_REVIEWS}
+    return projection
+
+# Function to build the $search count option. Lower-bound counts stop counting exactly
+# past the threshold, so very broad queries do not pay for an exact total.
+def search_count_option():
+    if Config.SEARCH_COUNT_TYPE == 'lowerBound':
+        return {'type': 'lowerBound', 'threshold': Config.SEARCH_COUNT_THRESHOLD}
+    return {'type': 'total'}
+
+# Function to wrap a pagination position in an opaque, URL-safe cursor string
+def encode_cursor(kind, value):
+    return base64.urlsafe_b64encode(json.dumps({'k': kind, 'v': value}).encode()).decode()
+
+# Function to unwrap a cursor string; an empty cursor means the first page
+def decode_cursor(cursor, kind):
+    if not cursor:
+        return None
     try:
-        search_query = request.args.get('q', '')
-        filter_category = request.args.get('category', '')
-        filter_sub_category = request.args.get('sub_category', '')
-        filter_gender = request.args.get('gender', '')
-        filter_brand = request.args.get('brand', '')
-        filter_on_sale = request.args.get('on_sale', 'false') == 'true'
-        page = int(request.args.get('page', 1))
-        limit = 12
-        skip = (page - 1) * limit
-
-        must_clauses = []
-        should_clauses = []
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    if not isinstance(decoded, dict) or decoded.get('k') != kind:
+        raise ValueError('Cursor does not belong to this query')
+    return decoded['v']
+
+# Function to build the $search compound clauses for the listing filters in args
+def build_search_clauses(args):
+    search_query = args.get('q', '')
+    filter_category = args.get('category', '')
+    filter_sub_category = args.get('sub_category', '')
+    filter_gender = args.get('gender', '')
+    filter_brand = args.get('brand', '')
+    filter_on_sale = args.get('on_sale', 'false') == 'true'
+
+    must_clauses = []
+    should_clauses = []
+
+    if search_query:
+        must_clauses.append({
+            'text': {
+                'query': search_query,
+                'path': ['name', 'description', 'brand', 'sub_category', 'material', 'colors'],
+                "fuzzy": {"maxEdits": 2, "prefixLength": 3}
+            }
+        })
 
-        if search_query:
-            must_clauses.append({
-                'text': {
-                    'query': search_query,
-                    'path': ['name', 'description', 'brand', 'sub_category', 'material', 'colors'],
-                    "fuzzy": {"maxEdits": 2, "prefixLength": 3}
-                }
-            })
+    if filter_category:
+        must_clauses.append({
+            'text': {
+                'query': filter_category,
+                'path': 'main_category'
+            }
+        })
 
-        if filter_category:
-            must_clauses.append({
-                'text': {
-                    'query': filter_category,
-                    'path': 'main_category'
-                }
-            })
+    if filter_sub_category:
+        must_clauses.append({
+            'text': {
+                'query': filter_sub_category,
+                'path': 'sub_category'
+            }
+        })
 
-        if filter_sub_category:
-            must_clauses.append({
-                'text': {
-                    'query': filter_sub_category,
-                    'path': 'sub_category'
-                }
-            })
+    if filter_gender:
+        must_clauses.append({
+            'text': {
+                'query': filter_gender,
+                'path': 'gender'
+            }
+        })
 
-        if filter_gender:
-            must_clauses.append({
-                'text': {
-                    'query': filter_gender,
-                    'path': 'gender'
-                }
-            })
+    if filter_brand:
+        must_clauses.append({
+            'text': {
+                'query': filter_brand,
+                'path': 'brand'
+            }
+        })
 
-        if filter_brand:
-            must_clauses.append({
-                'text': {
-                    'query': filter_brand,
-                    'path': 'brand'
-                }
-            })
+    if filter_on_sale:
+        must_clauses.append({
+            'equals': {
+                'value': True,
+                'path': 'on_sale'
+            }
+        })
 
-        if filter_on_sale:
-            must_clauses.append({
-                'equals': {
-                    'value': True,
-                    'path': 'on_sale'
-                }
-            })
-
-        if search_query or filter_category or filter_sub_category or filter_gender or filter_brand or filter_on_sale:
-            should_clauses.append({
-                "equals": {
-                    "value": True,
-                    "path": "sponsored",
-                    "score": {"boost": {"value": 3}}
-                }
-            })
+    if search_query or filter_category or filter_sub_category or filter_gender or filter_brand or filter_on_sale:
+        should_clauses.append({
+            "equals": {
+                "value": True,
+                "path": "sponsored",
+                "score": {"boost": {"value": 3}}
+            }
+        })
 
-        pipeline = []
+    return must_clauses, should_clauses
 
-        if must_clauses or should_clauses:
-            pipeline.append({
+# Function to build the query for one page of products after a cursor, without $skip.
+# $search queries resume from the searchSequenceToken of the last result through
+# searchAfter; the created_manually listing resumes with an _id range scan.
+# Returns (pipeline, None) for $search or (None, filter) for a find sorted on _id.
+def cursor_page_query(cursor, must_clauses, should_clauses, limit, projection):
+    if must_clauses or should_clauses:
+        search_stage = {
+            'index': 'default',
+            'compound': {
+                'must': must_clauses,
+                'should': should_clauses
+            },
+            # searchAfter needs a deterministic order, so ties are broken on _id
+            'sort': {'sponsored': -1, 'score': {'$meta': 'searchScore'}, '_id': 1}
+        }
+        token = decode_cursor(cursor, 'search')
+        if token:
+            search_stage['searchAfter'] = token
+        if Config.SEARCH_LISTING_MODE == 'stored_source':
+            search_stage['returnStoredSource'] = True
+        pipeline = [
+            {'$search': search_stage},
+            {'$limit': limit},
+            {'$project': {**projection, 'score': {'$meta': 'searchScore'}, 'cursor_token': {'$meta': 'searchSequenceToken'}}}
+        ]
+        return pipeline, None
+
+    query = {'created_manually': True}
+    last_id = decode_cursor(cursor, 'id')
+    if last_id:
+        if not ObjectId.is_valid(last_id):
+            raise ValueError('Invalid cursor')
+        query['_id'] = {'$gt': ObjectId(last_id)}
+    return None, query
+
+# Function to shape a cursor page and the cursor of the page after it
+def cursor_page(products, limit, searched):
+    if searched:
+        next_cursor = encode_cursor('search', products[-1]['cursor_token']) if len(products) == limit else None
+        for product in products:
+            del product['cursor_token']
+    else:
+        next_cursor = encode_cursor('id', str(products[-1]['_id'])) if len(products) == limit else None
+    return {'products': products, 'next_cursor': next_cursor}
+
+def list_products_after(cursor, must_clauses, should_clauses, limit, projection=LISTING_PROJECTION):
+    pipeline, query = cursor_page_query(cursor, must_clauses, should_clauses, limit, projection)
+    if pipeline is not None:
+        products = list(listing_collection.aggregate(pipeline))
+    else:
+        products = list(listing_collection.find(query, projection).sort('_id', 1).limit(limit))
+    return cursor_page(products, limit, pipeline is not None)
+
+# Function to build the pipeline fetching a page and the total in a single round trip:
+# $search reports its own count through $$SEARCH_META, the $match path counts inside
+# the same $facet
+def listing_pipeline(must_clauses, should_clauses, skip, limit, projection):
+    if Config.SEARCH_LISTING_MODE == 'stored_source':
+        return stored_source_listing_pipeline(must_clauses, should_clauses, skip, limit, projection)
+
+    page_stages = [
+        {'$sort': {'sponsored': -1}},
+        {'$skip': skip},
+        {'$limit': limit},
+        {'$project': {**projection, 'score': {'$meta': 'searchScore'}}}
+    ]
+
+    if must_clauses or should_clauses:
+        return [
+            {
                 '$search': {
                     'index': 'default',
                     'compound': {
                         'must': must_clauses,
                         'should': should_clauses
-                    }
+                    },
+                    'count': search_count_option()
                 }
-            })
-        else:
-            pipeline.append({'$match': {'created_manually': True}})
-
-        pipeline.extend([
-            {'$sort': {'sponsored': -1}},
-            {'$skip': skip},
-            {'$limit': limit},
-            {'$project': {
-                'name': 1,
-                'price': 1,
-                'description': 1,
-                'brand': 1,
-                'main_category': 1,
-                'sub_category': 1,
-                'images': 1,
-                'sponsored': 1,
-                'on_sale': 1,
-                'created_manually': 1,
-                'score': {'$meta': 'searchScore'}
+            },
+            {'$facet': {
+                'products': page_stages,
+                'meta': [{'$replaceWith': '$$SEARCH_META'}, {'$limit': 1}]
             }}
-        ])
-
-        results = collection.aggregate(pipeline)
-        products = list(results)
-
-        count_pipeline = [pipeline[0], {'$count': 'total'}] if (must_clauses or should_clauses) else [{'$match': {'created_manually': True}}, {'$count': 'total'}]
-        total_result = list(collection.aggregate(count_pipeline))
-
-        total_products = total_result[0]['total'] if total_result else 0
-
-        for product in products:
-            product['_id'] = str(product['_id'])
+        ]
+    return [
+        {'$match': {'created_manually': True}},
+        {'$facet': {
+            'products': page_stages,
+            'meta': [{'$count': 'total'}, {'$project': {'count': {'total': '$total'}}}]
+        }}
+    ]
+
+# Function to build the listing pipeline that never reads the collection: the search index
+# orders by sponsored and score, pages stream out of mongot with only the storedSource
+# card fields, and the last stages fold the page and $$SEARCH_META into the $facet shape.
+# Unfiltered listings search created_manually instead of running $match. A page past the
+# last result comes back empty with a total of 0.
+def stored_source_listing_pipeline(must_clauses, should_clauses, skip, limit, projection):
+    return [
+        {
+            '$search': {
+                'index': 'default',
+                'compound': {
+                    'must': must_clauses or [{'equals': {'value': True, 'path': 'created_manually'}}],
+                    'should': should_clauses
+                },
+                'sort': {'sponsored': -1, 'score': {'$meta': 'searchScore'}},
+                'count': search_count_option(),
+                'returnStoredSource': True
+            }
+        },
+        {'$skip': skip},
+        {'$limit': limit},
+        {'$project': {**projection, 'score': {'$meta': 'searchScore'}}},
+        {'$group': {'_id': None, 'products': {'$push': '$$ROOT'}, 'meta': {'$first': '$$SEARCH_META'}}},
+        {'$project': {'_id': 0, 'products': 1, 'meta': ['$meta']}}
+    ]
+
+# Function to shape the listing response from the $facet result
+def listing_response(result, page, limit):
+    products = result['products']
+    count = result['meta'][0]['count'] if result['meta'] else {}
+    total_products = count.get('total', count.get('lowerBound', 0))
+    # Lower-bound counts are exact below the threshold
+    total_is_lower_bound = 'lowerBound' in count and total_products >= Config.SEARCH_COUNT_THRESHOLD
+
+    total_pages = (total_products + limit - 1) // limit
+
+    return {
+        'products': products,
+        'total_pages': total_pages,
+        'current_page': page,
+        'total_products': total_products,
+        'total_is_lower_bound': total_is_lower_bound,
+        'max_page': Config.MAX_OFFSET_PAGE
+    }
+
+def vector_leg(search_query, projection):
+    embedding = get_embedding_service().embed(search_query)
+    return vector_backend.search(embedding, Config.HYBRID_CANDIDATES, vector_projection(projection))
+
+# Function to run both legs of a hybrid listing concurrently (see hybrid_search.py), so
+# it takes about as long as the slower of the two
+def hybrid_listing(args, must_clauses, should_clauses, page, limit, projection):
+    # A copy of this context keeps the vector leg's calls in the request's metrics
+    vector_results = hybrid_executor.submit(contextvars.copy_context().run, vector_leg, args['q'], projection)
+    text_results = list(listing_collection.aggregate(text_pipeline(must_clauses, should_clauses, projection)))
+    return hybrid_response(fuse(text_results, vector_results.result(), args, projection), page, limit)
+
+def page_too_deep(args, page):
+    return 'cursor' not in args and page > Config.MAX_OFFSET_PAGE
+
+# Fields counted by GET /products/facets; they are indexed as token in search-index-facets.json
+FACET_FIELDS = ['gender', 'main_category', 'sub_category', 'brand', 'material']
+
+# Function to build the pipeline returning every facet count in one aggregation.
+# $searchMeta facets cover string and number fields only, so the on_sale count is a
+# second $searchMeta joined with $unionWith rather than another request.
+def facets_pipeline(must_clauses):
+    # Like the unfiltered listing, no filters means the manually created products
+    operator_clauses = must_clauses or [{'equals': {'value': True, 'path': 'created_manually'}}]
+    facets = {
+        field: {'type': 'string', 'path': field, 'numBuckets': Config.FACET_MAX_BUCKETS}
+        for field in FACET_FIELDS
+    }
+    facets['price'] = {'type': 'number', 'path': 'price', 'boundaries': Config.FACET_PRICE_BOUNDARIES, 'default': 'other'}
+
+    on_sale_clauses = [clause for clause in operator_clauses if clause.get('equals', {}).get('path') != 'on_sale']
+    on_sale_clauses.append({'equals': {'value': True, 'path': 'on_sale'}})
+    return [
+        {'$searchMeta': {
+            'index': Config.SEARCH_FACET_INDEX,
+            'facet': {
+                'operator': {'compound': {'must': operator_clauses}},
+                'facets': facets
+            },
+            'count': {'type': 'total'}
+        }},
+        {'$unionWith': {
+            'coll': Config.MONGODB_COLLECTION,
+            'pipeline': [{'$searchMeta': {
+                'index': Config.SEARCH_FACET_INDEX,
+                'compound': {'must': on_sale_clauses},
+                'count': {'type': 'total'}
+            }}]
+        }}
+    ]
+
+# Function to shape the two $searchMeta documents into {field: [{value, count}], ...}
+def facets_response(results):
+    meta, on_sale = (results + [{}, {}])[:2]
+    response = {'total': meta.get('count', {}).get('total', 0)}
+    buckets = meta.get('facet', {})
+    for field in FACET_FIELDS + ['price']:
+        response[field] = [{'value': bucket['_id'], 'count': bucket['count']} for bucket in buckets.get(field, {}).get('buckets', [])]
+    response['on_sale'] = [{'value': True, 'count': on_sale.get('count', {}).get('total', 0)}]
+    return response
 
-        total_pages = (total_products + limit - 1) // limit
+@products_bp.route('/products', methods=['GET'])
+def get_products():
+    try:
+        cache_key = normalize_args(request.args)
+        cached, cache_entry = response_cache.get('listing', cache_key)
+        if cached is not None:
+            return json_response(cached)
 
-        return jsonify({
-            'products': products,
-            'total_pages': total_pages,
-            'current_page': page,
-            'total_products': total_products
-        })
+        page = int(request.args.get('page', 1))
+        limit = 12
+        skip = (page - 1) * limit
+        projection = sparse_projection(request.args.get('fields', ''), LISTING_PROJECTION, allowed=LISTING_PROJECTION)
+
+        # Offset paging discards every earlier result on the server, so deep pages must use cursors
+        if page_too_deep(request.args, page):
+            return jsonify({'error': 'Page too deep', 'message': f'Pages beyond {Config.MAX_OFFSET_PAGE} must be fetched with the cursor parameter', 'status_code': 400}), 400
+
+        must_clauses, should_clauses = build_search_clauses(request.args)
+
+        # Keyword and semantic results fused into one ranking
+        if request.args.get('mode') == 'hybrid' and request.args.get('q'):
+            response = hybrid_listing(request.args, must_clauses, should_clauses, page, limit, projection)
+            response_cache.set(cache_entry, response)
+            return json_response(response)
+
+        if 'cursor' in request.args:
+            response = list_products_after(request.args['cursor'], must_clauses, should_clauses, limit, projection)
+            response_cache.set(cache_entry, response)
+            return json_response(response)
+
+        pipeline = listing_pipeline(must_clauses, should_clauses, skip, limit, projection)
+        result = next(listing_collection.aggregate(pipeline), {'products': [], 'meta': []})
+        response = listing_response(result, page, limit)
+        response_cache.set(cache_entry, response)
+        return json_response(response)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'message': 'Invalid request parameters', 'status_code': 400}), 400
     except Exception as e:
         logger.error("Error fetching products", error=str(e))
         return jsonify({'error': str(e), 'message': 'An error occurred while fetching products', 'status_code': 500}), 500
 
+# Counts per gender, category, sub-category, brand, material, sale status and price
+# bucket for the same filters as GET /products. Cached with the listings, so product
+# writes invalidate them too.
+@products_bp.route('/products/facets', methods=['GET'])
+def get_product_facets():
+    try:
+        cache_key = 'facets:' + normalize_args(request.args)
+        cached, cache_entry = response_cache.get('listing', cache_key)
+        if cached is not None:
+            return json_response(cached)
+
+        must_clauses, _ = build_search_clauses(request.args)
+        response = facets_response(list(listing_collection.aggregate(facets_pipeline(must_clauses))))
+        response_cache.set(cache_entry, response)
+        return json_response(response)
+    except Exception as e:
+        logger.error("Error fetching product facets", error=str(e))
+        return jsonify({'error': str(e), 'message': 'An error occurred while fetching product facets', 'status_code': 500}), 500
+
 @products_bp.route('/products/<product_id>', methods=['GET'])
 def get_product(product_id):
     try:
-        product = collection.find_one({'_id': ObjectId(product_id)})
+        fields = request.args.get('fields', '')
+        product, cache_entry = response_cache.get(f'product:{product_id}', fields)
+        if product is not None:
+            return json_response(product)
+
+        projection = sparse_projection(fields, PRODUCT_DETAIL_PROJECTION)
+        product = collection.find_one({'_id': ObjectId(product_id)}, projection)
         if product:
-            product['_id'] = str(product['_id'])
-            return jsonify(product)
+            response_cache.set(cache_entry, product)
+            return json_response(product)
         else:
             return jsonify({'error': 'Product not found', 'message': 'The product with the specified ID does not exist', 'status_code': 404}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e), 'message': 'Invalid request parameters', 'status_code': 400}), 400
     except Exception as e:
         logger.error("Error fetching product", error=str(e))
         return jsonify({'error': str(e), 'message': 'An error occurred while fetching the product', 'status_code': 500}), 500
@@ -169,7 +509,14 @@ def add_product():
     try:
         data = request.json
         data['created_manually'] = True
+        if 'embeddings' in data:
+            data['embeddings'] = encode_vector(data['embeddings'], Config.VECTOR_STORAGE, Config.VECTOR_INT8_SCALE)
         result = collection.insert_one(data)
+        response_cache.invalidate('listing')
+        if 'embeddings' in data:
+            vector_backend.upsert(result.inserted_id, data['embeddings'])
+        if 'name' in data:
+            autocomplete_index.upsert(str(result.inserted_id), data['name'], data.get(Config.AUTOCOMPLETE_POPULARITY_FIELD) or 0)
         return jsonify({'message': 'Product added', 'id': str(result.inserted_id)}), 201
     except Exception as e:
         logger.error("Error adding product", error=str(e))
@@ -179,8 +526,13 @@ def add_product():
 def update_product(product_id):
     try:
         data = request.json
+        if 'embeddings' in data:
+            data['embeddings'] = encode_vector(data['embeddings'], Config.VECTOR_STORAGE, Config.VECTOR_INT8_SCALE)
         result = collection.update_one({'_id': ObjectId(product_id)}, {'$set': data})
         if result.matched_count:
+            response_cache.invalidate('listing', f'product:{product_id}')
+            if 'embeddings' in data:
+                vector_backend.upsert(ObjectId(product_id), data['embeddings'])
             return jsonify({'message': 'Product updated'})
         else:
             return jsonify({'error': 'Product not found', 'message': 'The product with the specified ID does not exist', 'status_code': 404}), 404
@@ -193,6 +545,9 @@ def delete_product(product_id):
     try:
         result = collection.delete_one({'_id': ObjectId(product_id)})
         if result.deleted_count:
+            response_cache.invalidate('listing', f'product:{product_id}')
+            vector_backend.remove(ObjectId(product_id))
+            autocomplete_index.remove(product_id)
             return jsonify({'message': 'Product deleted'})
         else:
             return jsonify({'error': 'Product not found', 'message': 'The product with the specified ID does not exist', 'status_code': 404}), 404
@@ -200,60 +555,326 @@ def delete_product(product_id):
         logger.error("Error deleting product", error=str(e))
         return jsonify({'error': str(e), 'message': 'An error occurred while deleting the product', 'status_code': 500}), 500
 
+# Function to queue a bulk job from the request body and answer 202 with its id
+def submit_job(job_type):
+    data = request.json or {}
+    # Extended JSON, so filters can use {"$oid": ...} and dates
+    filter_query = json_util.loads(json.dumps(data.get('filter', {})))
+    update = json_util.loads(json.dumps(data['update'])) if 'update' in data else None
+    job = job_runner.submit(job_type, filter_query, update)
+    return jsonify({'job_id': str(job['_id']), 'status': job['status'], 'status_url': f"/products/jobs/{job['_id']}"}), 202
+
+# Deletes every product matching the filter in a background job
 @products_bp.route('/products', methods=['DELETE'])
 def delete_products():
     try:
-        filter_query = request.json.get('filter', {})
-        result = collection.delete_many(filter_query)
-        return jsonify({'message': f'{result.deleted_count} products deleted'})
+        return submit_job('delete')
+    except ValueError as e:
+        return jsonify({'error': str(e), 'message': 'Invalid request parameters', 'status_code': 400}), 400
     except Exception as e:
         logger.error("Error deleting products", error=str(e))
         return jsonify({'error': str(e), 'message': 'An error occurred while deleting the products', 'status_code': 500}), 500
 
-@products_bp.route('/products/<product_id>/recommendations', methods=['GET'])
-def get_recommendations(product_id):
+# Applies {"update": {"$set": ...}} to every product matching {"filter": ...} in a background job
+@products_bp.route('/products', methods=['PATCH'])
+def update_products():
     try:
-        product = collection.find_one({'_id': ObjectId(product_id)}, {'embeddings': 1})
-        if not product or 'embeddings' not in product:
-            return jsonify({'error': 'Product not found or missing embeddings', 'message': 'The product with the specified ID does not exist or is missing embeddings', 'status_code': 404}), 404
+        return submit_job('update')
+    except ValueError as e:
+        return jsonify({'error': str(e), 'message': 'Invalid request parameters', 'status_code': 400}), 400
+    except Exception as e:
+        logger.error("Error updating products", error=str(e))
+        return jsonify({'error': str(e), 'message': 'An error occurred while updating the products', 'status_code': 500}), 500
+
+# Function to validate the items of a stock request into [(product_id, delta), ...]
+def parse_stock_items(items):
+    if not isinstance(items, list) or not items:
+        raise ValueError('items must be a non-empty list')
+    if len(items) > Config.STOCK_MAX_ITEMS_PER_REQUEST:
+        raise ValueError(f'At most {Config.STOCK_MAX_ITEMS_PER_REQUEST} items per request')
+    parsed = []
+    for item in items:
+        product_id = item.get('product_id') if isinstance(item, dict) else None
+        delta = item.get('delta') if isinstance(item, dict) else None
+        if not product_id or not ObjectId.is_valid(product_id):
+            raise ValueError(f'Invalid product_id {product_id!r}')
+        if not isinstance(delta, int) or isinstance(delta, bool) or delta == 0:
+            raise ValueError('delta must be a non-zero integer')
+        parsed.append((product_id, delta))
+    return parsed
+
+# Atomic stock changes for a cart: {"items": [{"product_id": ..., "delta": -2}, ...]}.
+# Negative deltas take stock and only apply while enough is left; positive deltas restock.
+# With "all_or_nothing": true, a cart with any item that could not be applied has its
+# applied items restocked and is reported as rejected.
+#
+# Each item is atomic, the cart is not: the rollback is a second write, so between the
+# two, concurrent buyers can see the taken stock missing and get insufficient_stock. Items
+# whose restock fails are reported as rollback_failed with a 500, as their stock stays taken.
+@products_bp.route('/products/stock', methods=['POST'])
+def update_stock():
+    try:
+        data = request.json or {}
+        items = parse_stock_items(data.get('items'))
+        results = stock_updater.apply(items)
+
+        rejected = False
+        if data.get('all_or_nothing') and any(result != 'applied' for result in results):
+            rejected = True
+            applied = [index for index, result in enumerate(results) if result == 'applied']
+            try:
+                rollback = stock_updater.apply([(items[index][0], -items[index][1]) for index in applied]) if applied else []
+            except Exception as e:
+                logger.error("Error rolling back stock", error=str(e))
+                rollback = ['error'] * len(applied)
+            for index, result in zip(applied, rollback):
+                results[index] = 'rolled_back' if result == 'applied' else 'rollback_failed'
+
+        response = {
+            'rejected': rejected,
+            'items': [
+                {'product_id': product_id, 'delta': delta, 'result': result}
+                for (product_id, delta), result in zip(items, results)
+            ]
+        }
+        failed = [item for item in response['items'] if item['result'] == 'rollback_failed']
+        if failed:
+            logger.error("Stock rollback failed", items=failed)
+            response.update({'error': 'Rollback failed', 'message': 'Stock taken for some items could not be restocked', 'status_code': 500})
+            return jsonify(response), 500
+        return jsonify(response)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'message': 'Invalid request parameters', 'status_code': 400}), 400
+    except Exception as e:
+        logger.error("Error updating stock", error=str(e))
+        return jsonify({'error': str(e), 'message': 'An error occurred while updating the stock', 'status_code': 500}), 500
 
-        embeddings = product['embeddings']
+@products_bp.route('/products/stock/stats', methods=['GET'])
+def get_stock_stats():
+    return jsonify(stock_updater.stats())
 
-        search_stage = {
-            "$vectorSearch": {
-                "index": "vs_details",
-                "queryVector": embeddings,
-                "path": "embeddings",
-                "numCandidates": 50,
-                "limit": 10,
-            }
-        }
+@products_bp.route('/products/jobs', methods=['GET'])
+def list_jobs():
+    return json_response(job_runner.recent())
 
-        pipeline = [
-            search_stage,
-            {'$match': {'_id': {'$ne': ObjectId(product_id)}}},
-            {'$project': {
-                'name': 1,
-                'price': 1,
-                'description': 1,
-                'brand': 1,
-                'main_category': 1,
-                'sub_category': 1,
-                'images': 1,
-                'sponsored': 1,
-                'on_sale': 1,
-                'created_manually': 1,
-                'score': {'$meta': 'searchScore'}
-            }}
-        ]
+@products_bp.route('/products/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    try:
+        job = job_runner.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found', 'message': 'The job with the specified ID does not exist', 'status_code': 404}), 404
+        return json_response(job)
+    except BSONError as e:
+        return jsonify({'error': str(e), 'message': 'Invalid request parameters', 'status_code': 400}), 400
+
+@products_bp.route('/products/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    try:
+        job = job_runner.cancel(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found', 'message': 'The job with the specified ID does not exist', 'status_code': 404}), 404
+        return json_response(job)
+    except BSONError as e:
+        return jsonify({'error': str(e), 'message': 'Invalid request parameters', 'status_code': 400}), 400
+
+# Columns written by CSV exports unless the fields parameter names others
+EXPORT_CSV_FIELDS = [
+    '_id', 'sku', 'name', 'brand', 'gender', 'main_category', 'sub_category', 'price',
+    'description', 'sizes', 'colors', 'material', 'stock', 'availability', 'rating',
+    'on_sale', 'pre_owned', 'condition', 'sponsored', 'new_in', 'created_at', 'updated_at'
+]
+
+# Bulk imports upsert by sku, so make sure the lookup is indexed once per process
+sku_index_lock = threading.Lock()
+sku_index_ready = False
+
+def ensure_sku_index():
+    global sku_index_ready
+    if sku_index_ready:
+        return
+    with sku_index_lock:
+        if not sku_index_ready:
+            collection.create_index('sku')
+            sku_index_ready = True
+
+# Function to apply one batch of sku upserts; returns per-line errors for the failed writes
+def flush_bulk_upserts(operations, line_numbers, totals):
+    if not operations:
+        return []
+    errors = []
+    try:
+        result = collection.bulk_write(operations, ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        errors = [{'line': line_numbers[error['index']], 'error': error['errmsg']} for error in details['writeErrors']]
+    totals['upserted'] += details['nUpserted']
+    totals['matched'] += details['nMatched']
+    totals['modified'] += details['nModified']
+    return errors
+
+# Streams an NDJSON body (one product per line, MongoDB extended JSON allowed) into
+# unordered bulk upserts keyed by sku. Lines are applied in batches as they arrive,
+# and a line that cannot be parsed or written is reported without stopping the import.
+@products_bp.route('/products/bulk', methods=['POST'])
+def bulk_import_products():
+    try:
+        ensure_sku_index()
+        totals = {'received': 0, 'upserted': 0, 'matched': 0, 'modified': 0}
+        errors = []
+        operations, line_numbers, batch_skus = [], [], set()
+        now = datetime.datetime.utcnow()
+
+        for line_number, line in enumerate(request.stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            totals['received'] += 1
+            try:
+                document = json_util.loads(line)
+                if not isinstance(document, dict):
+                    raise ValueError('Line is not a JSON object')
+                sku = document.get('sku')
+                if not sku:
+                    raise ValueError('Missing sku')
+                if 'embeddings' in document:
+                    document['embeddings'] = encode_vector(document['embeddings'], Config.VECTOR_STORAGE, Config.VECTOR_INT8_SCALE)
+            except (ValueError, BSONError) as e:
+                errors.append({'line': line_number, 'error': str(e)})
+                continue
+
+            # Unordered writes give no order within a batch, so a repeated sku starts a new one
+            if sku in batch_skus or len(operations) >= Config.BULK_IMPORT_BATCH_SIZE:
+                errors.extend(flush_bulk_upserts(operations, line_numbers, totals))
+                operations, line_numbers, batch_skus = [], [], set()
+
+            document.pop('_id', None)
+            document.setdefault('updated_at', now)
+            created_at = document.pop('created_at', now)
+            operations.append(UpdateOne({'sku': sku}, {'$set': document, '$setOnInsert': {'created_at': created_at}}, upsert=True))
+            line_numbers.append(line_number)
+            batch_skus.add(sku)
+
+        errors.extend(flush_bulk_upserts(operations, line_numbers, totals))
+        if totals['upserted'] or totals['modified']:
+            response_cache.invalidate_all()
+
+        logger.info("Bulk import finished", errors=len(errors), **totals)
+        return jsonify({
+            **totals,
+            'failed': len(errors),
+            'errors': errors[:Config.BULK_IMPORT_MAX_REPORTED_ERRORS]
+        })
+    except Exception as e:
+        logger.error("Error importing products", error=str(e))
+        return jsonify({'error': str(e), 'message': 'An error occurred while importing the products', 'status_code': 500}), 500
+
+# Function to flatten a value into a CSV cell; lists are joined with "|"
+def csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return '|'.join(csv_cell(item) for item in value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return json_util.dumps(value)
+    return str(value)
+
+# Streams the whole catalog as NDJSON (extended JSON, re-importable through
+# /products/bulk) or CSV, reading the cursor in batches and writing each batch as
+# one chunk so the response is never held in memory.
+@products_bp.route('/products/export', methods=['GET'])
+def export_products():
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'Invalid format', 'message': 'format must be ndjson or csv', 'status_code': 400}), 400
+
+    fields = [field for field in request.args.get('fields', '').split(',') if field]
+    if export_format == 'csv':
+        fields = fields or EXPORT_CSV_FIELDS
+    projection = {field: 1 for field in fields} or None
+
+    def generate():
+        cursor = listing_collection.find({}, projection).batch_size(Config.EXPORT_BATCH_SIZE)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == 'csv':
+            writer.writerow(fields)
+        count = 0
+        for document in cursor:
+            if export_format == 'csv':
+                writer.writerow([csv_cell(document.get(field)) for field in fields])
+            else:
+                buffer.write(json_util.dumps(document, json_options=json_util.RELAXED_JSON_OPTIONS))
+                buffer.write('\n')
+            count += 1
+            if count % Config.EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        logger.info("Export finished", format=export_format, documents=count)
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=products.{export_format}'}
+    )
+
+@products_bp.route('/products/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(response_cache.stats())
+
+# Pipeline reading a product's precomputed row together with the recommended products
+def precomputed_recommendations_pipeline(product_id):
+    return [
+        {'$match': {'_id': ObjectId(product_id)}},
+        {'$lookup': {
+            'from': Config.MONGODB_COLLECTION,
+            'localField': 'neighbours.product_id',
+            'foreignField': '_id',
+            'pipeline': [{'$project': LISTING_PROJECTION}],
+            'as': 'products'
+        }}
+    ]
+
+# Function to read a product's precomputed recommendations in one round trip.
+# Returns None when the product has no row yet.
+def precomputed_recommendations(product_id):
+    row = next(recommendations_collection.aggregate(precomputed_recommendations_pipeline(product_id)), None)
+    if row is None:
+        return None
+    return order_recommendations(row)
+
+# Function to list a precomputed row's products in neighbour order with their scores;
+# $lookup does not keep the neighbour order
+def order_recommendations(row):
+    products = {product['_id']: product for product in row['products']}
+    recommendations = []
+    for neighbour in row['neighbours']:
+        product = products.get(neighbour['product_id'])
+        if product:
+            product['score'] = neighbour['score']
+            recommendations.append(product)
+    return recommendations
 
-        results = collection.aggregate(pipeline)
-        recommendations = list(results)
+@products_bp.route('/products/<product_id>/recommendations', methods=['GET'])
+def get_recommendations(product_id):
+    try:
+        recommendations = precomputed_recommendations(product_id)
+        if recommendations is not None:
+            return json_response(recommendations)
 
-        for recommendation in recommendations:
-            recommendation['_id'] = str(recommendation['_id'])
+        # No precomputed row yet, fall back to a live vector search
+        product = listing_collection.find_one({'_id': ObjectId(product_id)}, {'embeddings': 1})
+        if not product or 'embeddings' not in product:
+            return jsonify({'error': 'Product not found or missing embeddings', 'message': 'The product with the specified ID does not exist or is missing embeddings', 'status_code': 404}), 404
 
-        return jsonify(recommendations)
+        # The product itself counts towards the limit, as in the precomputed rows
+        recommendations = vector_backend.search(product['embeddings'], Config.RECOMMENDATIONS_COUNT + 1, LISTING_PROJECTION, exclude_id=ObjectId(product_id))
+        return json_response(recommendations)
     except Exception as e:
         logger.error("Error fetching recommendations", error=str(e))
         return jsonify({'error': str(e), 'message': 'An error occurred while fetching recommendations', 'status_code': 500}), 500
\ No newline at end of file
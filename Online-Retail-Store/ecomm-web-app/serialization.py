@@ -0,0 +1,48 @@
+import base64
+import datetime
+import json
+from bson import ObjectId
+from bson.binary import Binary
+from flask import Response
+from config import Config
+from vector_codec import BINARY_VECTOR_SUBTYPE, decode_vector
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fast JSON for API responses and cached payloads.
+#
+# orjson serializes datetimes natively; ObjectIds become their hex string, so handlers
+# can return MongoDB documents as they are read. Naive datetimes from pymongo are UTC
+# and are written with an explicit +00:00 offset. Binary vectors are written as float
+# lists whatever their storage encoding, and other binary values as base64. Without orjson the standard library
+# encoder produces the same output, only slower.
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.isoformat()
+    if isinstance(value, Binary) and value.subtype == BINARY_VECTOR_SUBTYPE:
+        return decode_vector(value, Config.VECTOR_INT8_SCALE).tolist()
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NAIVE_UTC)
+    return json.dumps(value, default=_default, separators=(',', ':')).encode('utf-8')
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Function to build a JSON response, the fast counterpart of flask.jsonify
+def json_response(payload, status=200):
+    return Response(dumps(payload), status=status, mimetype='application/json')
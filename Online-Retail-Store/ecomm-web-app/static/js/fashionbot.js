@@ -3,28 +3,78 @@ export function sendChatMessage(question) {
     $('#chat-messages').append(`<div class="message-bubble user-message"><strong>You:</strong> ${escapeHtml(question)}</div>`);
     scrollToLatestMessage();
     showLoadingIndicator(true);
-    $.ajax({
-        url: `/fashionbot`,
+
+    // Bubble that fills in as answer tokens stream from /fashionbot/stream
+    const botMessage = $('<div class="message-bubble bot-message"><strong>FashionBot:</strong> <span class="bot-answer"></span></div>');
+    let answer = '';
+
+    fetch('/fashionbot/stream', {
         method: 'POST',
-        contentType: 'application/json',
-        data: JSON.stringify({ product_id: productId, question: question }),
-        success: function (response) {
-            const formattedAnswer = formatChatMessage(response.answer);
-            $('#chat-messages').append(`<div class="message-bubble bot-message"><strong>FashionBot:</strong> ${formattedAnswer}</div>`);
-            displayChatRecommendations(response.recommendations);
-            showLoadingIndicator(false);
-            scrollToLatestMessage();
-        },
-        error: function (xhr, status, error) {
-            showLoadingIndicator(false);
-            const message = xhr.responseJSON && xhr.responseJSON.error ? xhr.responseJSON.error : 'An unexpected error occurred. Please try again later.';
-            showError(message);
-            $('#chat-messages').append('<div class="message-bubble bot-message"><strong>FashionBot:</strong> Sorry, something went wrong. Please try again later.</div>');
-            scrollToLatestMessage();
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ product_id: productId, question: question })
+    }).then(function (response) {
+        if (!response.ok) {
+            return response.json().then(function (body) {
+                throw new Error(body.error || 'An unexpected error occurred. Please try again later.');
+            });
         }
+        $('#chat-messages').append(botMessage);
+        return readEventStream(response, function (event, data) {
+            if (event === 'token') {
+                showLoadingIndicator(false);
+                answer += data.text;
+                botMessage.find('.bot-answer').html(formatChatMessage(answer));
+                scrollToLatestMessage();
+            } else if (event === 'recommendations') {
+                displayChatRecommendations(data.items);
+            } else if (event === 'error') {
+                throw new Error(data.error);
+            }
+        });
+    }).then(function () {
+        showLoadingIndicator(false);
+        scrollToLatestMessage();
+    }).catch(function (error) {
+        showLoadingIndicator(false);
+        showError(error.message);
+        $('#chat-messages').append('<div class="message-bubble bot-message"><strong>FashionBot:</strong> Sorry, something went wrong. Please try again later.</div>');
+        scrollToLatestMessage();
     });
 }
 
+// Read a server-sent event stream from a fetch response, calling onEvent(event, data) per event
+function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    function pump() {
+        return reader.read().then(function ({ done, value }) {
+            if (done) {
+                return;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            events.forEach(function (raw) {
+                let event = 'message';
+                let data = '';
+                raw.split('\n').forEach(function (line) {
+                    if (line.startsWith('event: ')) {
+                        event = line.slice(7);
+                    } else if (line.startsWith('data: ')) {
+                        data += line.slice(6);
+                    }
+                });
+                onEvent(event, data ? JSON.parse(data) : null);
+            });
+            return pump();
+        });
+    }
+
+    return pump();
+}
+
 function scrollToLatestMessage() {
     const chatContainer = $('#chat-messages');
     chatContainer.scrollTop(chatContainer.prop("scrollHeight"));
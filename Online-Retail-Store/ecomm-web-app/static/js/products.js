@@ -19,7 +19,7 @@ export function loadProducts(page) {
         },
         success: function (data) {
             renderProducts(data.products); // Render the products
-            setupPagination(data.current_page, data.total_pages); // Setup pagination
+            setupPagination(data.current_page, Math.min(data.total_pages, data.max_page)); // Setup pagination, capped at the deepest offset page
             showLoadingSpinner(false); // Hide loading spinner
             window.scrollTo(0, 0); // Scroll to top
         },
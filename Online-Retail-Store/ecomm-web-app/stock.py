@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Atomic stock changes, coalesced across concurrent requests.
+#
+# Every item is a conditional update: a decrement only matches while the product still
+# has that much stock, so stock never goes below zero, and the same update recomputes
+# availability from the new stock. Items arriving within window_ms of each other, from
+# any number of requests, are sent together as one unordered bulk_write.
+#
+# bulk_write reports totals, not which updates matched, so each update is an upsert on
+# {_id, stock >= n}: when the condition fails the upsert collides with the existing _id
+# and the duplicate key error names the item, all within the same round trip. To keep
+# those upserts from creating products, items for products not seen before are checked
+# first (once per product per process); a product deleted in between is inserted as a
+# stub, which is reported as not found and removed straight away.
+#
+# Item results: "applied", "insufficient_stock", "not_found" or "error".
+
+DUPLICATE_KEY = 11000
+
+def stock_update(delta):
+    return [
+        {'$set': {'stock': {'$add': [{'$ifNull': ['$stock', 0]}, delta]}}},
+        {'$set': {
+            'availability': {'$cond': [{'$gt': ['$stock', 0]}, 'In Stock', 'Out of Stock']},
+            'stock_updated_at': '$$NOW'
+        }}
+    ]
+
+class StockUpdater:
+    def __init__(self, collection, window_ms=2, max_batch=1000, known_products=100000, on_applied=None):
+        self.collection = collection
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.known_products = known_products
+        # Called with the set of product _ids whose stock changed in a batch
+        self.on_applied = on_applied
+        self.batches = 0
+        self.items = 0
+
+        self._known = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_ready = threading.Condition(self._lock)
+        self._worker_pid = None
+
+    # Function to apply [(product_id, delta), ...]; returns one result per item, in order
+    def apply(self, items):
+        futures = []
+        with self._lock:
+            self._ensure_worker()
+            for product_id, delta in items:
+                future = Future()
+                self._pending.append((ObjectId(product_id), delta, future))
+                futures.append(future)
+            self._pending_ready.notify()
+        return [future.result() for future in futures]
+
+    # The batching thread does not survive a fork, so start one per process on first use
+    def _ensure_worker(self):
+        if self._worker_pid != os.getpid():
+            self._worker_pid = os.getpid()
+            self._pending = []
+            threading.Thread(target=self._run_batches, daemon=True).start()
+
+    def _run_batches(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._pending_ready.wait()
+            # Give concurrent requests a moment to join this batch
+            time.sleep(self.window)
+            with self._lock:
+                batch = self._pending[:self.max_batch]
+                self._pending = self._pending[self.max_batch:]
+            try:
+                results = self._write(batch)
+                for (_, _, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+
+    # Function to drop the items of products that do not exist; returns their indexes
+    def _missing(self, batch):
+        unknown = {product_id for product_id, _, _ in batch if product_id not in self._known}
+        if unknown:
+            for document in self.collection.find({'_id': {'$in': list(unknown)}}, {'_id': 1}):
+                self._known[document['_id']] = True
+                unknown.discard(document['_id'])
+            while len(self._known) > self.known_products:
+                self._known.popitem(last=False)
+        return {index for index, (product_id, _, _) in enumerate(batch) if product_id in unknown}
+
+    def _write(self, batch):
+        results = ['applied'] * len(batch)
+        for index in self._missing(batch):
+            results[index] = 'not_found'
+
+        indexes, operations = [], []
+        for index, (product_id, delta, _) in enumerate(batch):
+            if results[index] == 'not_found':
+                continue
+            condition = {'_id': product_id}
+            if delta < 0:
+                condition['stock'] = {'$gte': -delta}
+            indexes.append(index)
+            operations.append(UpdateOne(condition, stock_update(delta), upsert=True))
+        if not operations:
+            return results
+
+        try:
+            details = self.collection.bulk_write(operations, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            for error in details['writeErrors']:
+                results[indexes[error['index']]] = 'insufficient_stock' if error['code'] == DUPLICATE_KEY else 'error'
+
+        stubs = [upserted['_id'] for upserted in details.get('upserted', [])]
+        if stubs:
+            self.collection.delete_many({'_id': {'$in': stubs}, 'name': {'$exists': False}})
+            for upserted in details['upserted']:
+                results[indexes[upserted['index']]] = 'not_found'
+                self._known.pop(upserted['_id'], None)
+
+        self.batches += 1
+        self.items += len(batch)
+        if self.on_applied:
+            applied = {batch[index][0] for index in indexes if results[index] == 'applied'}
+            if applied:
+                self.on_applied(applied)
+        return results
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'items_per_batch': self.items / self.batches if self.batches else 0.0
+        }
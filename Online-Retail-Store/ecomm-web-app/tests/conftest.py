@@ -0,0 +1,89 @@
+import os
+import sys
+import tempfile
+import numpy as np
+import pytest
+from bson import ObjectId
+
+# Offline fixtures for the web app tests: mongomock stands in for MongoDB and the data
+# generator's stub server (loaded through benchmarks/stub_openai.py) for the OpenAI
+# endpoints. Config reads the environment at import, so it is set up here before any
+# app module is imported.
+#
+#   cd ecomm-web-app && python -m pytest tests
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, 'benchmarks'))
+
+from stub_openai import fake_embedding, start_stub
+
+DIMENSIONS = 64
+PRODUCT_IDS = [ObjectId() for _ in range(20)]
+VECTORS = np.array([fake_embedding(str(product_id), DIMENSIONS) for product_id in PRODUCT_IDS], dtype=np.float32)
+
+_snapshot_path = os.path.join(tempfile.mkdtemp(), 'vector-snapshot')
+np.save(f"{_snapshot_path}.vectors.npy", VECTORS)
+np.save(f"{_snapshot_path}.ids.npy", np.array([np.frombuffer(product_id.binary, dtype=np.uint8) for product_id in PRODUCT_IDS]))
+
+_stub = start_stub()
+os.environ.update(
+    OPENAI_API_KEY='stub',
+    OPENAI_BASE_URL=f"http://127.0.0.1:{_stub.server_address[1]}/v1",
+    EMBEDDING_DIMENSIONS=str(DIMENSIONS),
+    VECTOR_BACKEND='local',
+    VECTOR_SNAPSHOT_PATH=_snapshot_path,
+    AUTOCOMPLETE_BACKEND='local',
+    CACHE_BACKEND='local',
+    FASHIONBOT_CACHE_ENABLED='false',
+    METRICS_ENABLED='false',
+)
+
+# Motor-shaped wrappers over a mongomock collection, enough for the async routes
+class AsyncCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, limit):
+        self.cursor = self.cursor.limit(limit)
+        return self
+
+    async def to_list(self, length):
+        documents = list(self.cursor)
+        return documents[:length] if length else documents
+
+class AsyncCollection:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_one(self, *args, **kwargs):
+        return self.collection.find_one(*args, **kwargs)
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+    def aggregate(self, pipeline):
+        return AsyncCursor(self.collection.aggregate(pipeline))
+
+# A mongomock database seeded with the products of the vector snapshot, serving every
+# LazyCollection and AsyncLazyCollection of the app
+@pytest.fixture
+def db(monkeypatch):
+    import mongomock
+    import clients
+    from config import Config
+    from products import response_cache
+
+    database = mongomock.MongoClient()[Config.MONGODB_DATABASE]
+    database[Config.MONGODB_COLLECTION].insert_many([
+        {'_id': product_id, 'name': f"Product {i}", 'price': 10.0 + i, 'stock': 5, 'images': ['http://images.local/product.jpg'], 'embeddings': vector.tolist()}
+        for i, (product_id, vector) in enumerate(zip(PRODUCT_IDS, VECTORS))
+    ])
+    monkeypatch.setattr(clients, 'get_collection', lambda name=None, read_preference=None: database[name or Config.MONGODB_COLLECTION])
+    monkeypatch.setattr(clients, 'get_async_collection', lambda name=None, read_preference=None: AsyncCollection(database[name or Config.MONGODB_COLLECTION]))
+    response_cache.invalidate_all()
+    return database
@@ -0,0 +1,56 @@
+import asyncio
+import mongomock
+from pymongo.errors import OperationFailure
+from answer_cache import INDEX_OPTIONS_CONFLICT, AnswerCache, AsyncAnswerCache
+
+# mongomock collection whose TTL index was created with another expireAfterSeconds
+class ConflictingCollection:
+    def __init__(self):
+        self.collection = mongomock.MongoClient()['db']['fashionbot_cache']
+        self.commands = []
+        self.database = self
+
+    def command(self, command):
+        self.commands.append(dict(command))
+
+    def create_index(self, keys, **options):
+        if 'expireAfterSeconds' in options:
+            raise OperationFailure('An equivalent index already exists with different options', code=INDEX_OPTIONS_CONFLICT)
+        return self.collection.create_index(keys, **options)
+
+    @property
+    def name(self):
+        return self.collection.name
+
+    def __getattr__(self, attr):
+        return getattr(self.collection, attr)
+
+class AsyncConflictingCollection(ConflictingCollection):
+    async def command(self, command):
+        super().command(command)
+
+    async def create_index(self, keys, **options):
+        return super().create_index(keys, **options)
+
+def test_changed_ttl_updates_the_index():
+    collection = ConflictingCollection()
+    cache = AnswerCache(collection, threshold=0.9, ttl_seconds=600, max_entries_per_product=5)
+    assert cache.lookup('p1', [1.0, 0.0]) is None
+    assert collection.commands == [{'collMod': 'fashionbot_cache', 'index': {'keyPattern': {'created_at': 1}, 'expireAfterSeconds': 600}}]
+
+def test_failed_ttl_update_does_not_fail_requests():
+    collection = ConflictingCollection()
+
+    def failing_command(command):
+        raise OperationFailure('not authorized', code=13)
+
+    collection.command = failing_command
+    cache = AnswerCache(collection, threshold=0.9, ttl_seconds=600, max_entries_per_product=5)
+    cache.store('p1', 'Does it run small?', [1.0, 0.0], 'True to size.', [])
+    assert cache.lookup('p1', [1.0, 0.0])['answer'] == 'True to size.'
+
+def test_async_cache_updates_the_index():
+    collection = AsyncConflictingCollection()
+    cache = AsyncAnswerCache(collection, threshold=0.9, ttl_seconds=600, max_entries_per_product=5)
+    asyncio.run(cache._ensure_indexes())
+    assert collection.commands[0]['index']['expireAfterSeconds'] == 600
@@ -0,0 +1,67 @@
+import asyncio
+import json
+import pytest
+from conftest import PRODUCT_IDS
+
+pytest.importorskip('quart')
+
+# Function to send one request through the ASGI app; returns (status, headers, body)
+def call(app, method, path, body=None):
+    path, _, query = path.partition('?')
+    raw = json.dumps(body).encode('utf-8') if body is not None else b''
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'content-type', b'application/json'), (b'content-length', str(len(raw)).encode())],
+        'client': ('127.0.0.1', 50000), 'server': ('localhost', 80), 'extensions': {}
+    }
+    messages = [{'type': 'http.request', 'body': raw, 'more_body': False}]
+    response = {'status': None, 'headers': {}, 'body': b''}
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = dict(message['headers'])
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+
+    asyncio.run(asyncio.wait_for(app(scope, receive, send), 30))
+    return response['status'], response['headers'], response['body']
+
+@pytest.fixture
+def app(db):
+    from asgi import create_asgi_app
+
+    return create_asgi_app()
+
+def test_routes_follow_the_flask_url_map(app):
+    assert app._is_async({'path': f'/products/{PRODUCT_IDS[0]}', 'method': 'GET'})
+    assert app._is_async({'path': '/fashionbot/stream', 'method': 'POST'})
+    # /products/export must not be taken for /products/<product_id>
+    assert not app._is_async({'path': '/products/export', 'method': 'GET'})
+    assert not app._is_async({'path': f'/products/{PRODUCT_IDS[0]}', 'method': 'PUT'})
+
+def test_async_product_detail(app):
+    status, _, body = call(app, 'GET', f'/products/{PRODUCT_IDS[0]}')
+    assert status == 200
+    assert json.loads(body)['name'] == 'Product 0'
+
+def test_export_falls_through_to_wsgi(app):
+    status, headers, body = call(app, 'GET', '/products/export?format=ndjson')
+    assert status == 200
+    assert headers[b'content-type'].startswith(b'application/x-ndjson')
+    assert len(body.splitlines()) == len(PRODUCT_IDS)
+
+def test_fashionbot_stream(app):
+    status, headers, body = call(app, 'POST', '/fashionbot/stream', {'product_id': str(PRODUCT_IDS[0]), 'question': 'Does it run small?'})
+    assert status == 200
+    assert headers[b'content-type'].startswith(b'text/event-stream')
+    events = [line.split(': ', 1)[1] for line in body.decode('utf-8').splitlines() if line.startswith('event:')]
+    assert events[0] == 'token'
+    assert events.count('recommendations') == 2
+    assert events[-1] == 'done'
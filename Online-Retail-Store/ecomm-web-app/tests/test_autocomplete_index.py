@@ -0,0 +1,114 @@
+import threading
+import time
+from pymongo.errors import OperationFailure
+from autocomplete_index import AutocompleteIndex, AutocompleteRefresher
+from change_streams import CHANGE_STREAMS_UNSUPPORTED
+
+def test_writes_during_a_rebuild_are_kept():
+    index = AutocompleteIndex()
+    index.upsert('old', 'Old Boots', 1)
+
+    def snapshot():
+        yield 'a', 'Denim Jacket', 5
+        # Written while the rebuild is still reading
+        index.upsert('b', 'Denim Skirt', 9)
+        index.remove('a')
+        yield 'c', 'Denim Shorts', 1
+
+    index.build(snapshot())
+    assert [suggestion['id'] for suggestion in index.suggest('denim')] == ['b', 'c']
+    # Overlay writes from before the rebuild are folded in, not kept
+    assert index.suggest('boots') == []
+
+# Collection whose change stream fails once, then replays the given changes
+class FlakyCollection:
+    def __init__(self, changes):
+        self.changes = changes
+        self.resume_tokens = []
+
+    def watch(self, pipeline, full_document=None, resume_after=None):
+        self.resume_tokens.append(resume_after)
+        collection = self
+
+        class Stream:
+            resume_token = None
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def __iter__(self):
+                if len(collection.resume_tokens) == 1:
+                    self.resume_token = {'_data': '1'}
+                    yield collection.changes[0]
+                    raise ConnectionError('primary stepped down')
+                for change in collection.changes[1:]:
+                    yield change
+                # Block like an open stream with no more changes
+                time.sleep(3600)
+
+        return Stream()
+
+def test_change_stream_reopens_from_the_last_change():
+    index = AutocompleteIndex()
+    index.build([])
+    collection = FlakyCollection([
+        {'operationType': 'insert', 'documentKey': {'_id': 1}, 'fullDocument': {'name': 'Linen Shirt'}},
+        {'operationType': 'insert', 'documentKey': {'_id': 2}, 'fullDocument': {'name': 'Linen Trousers'}},
+    ])
+    refresher = AutocompleteRefresher(index, collection, max_retry_seconds=0)
+    threading.Thread(target=refresher._watch_loop, daemon=True).start()
+
+    deadline = time.time() + 5
+    while len(index.suggest('linen')) < 2 and time.time() < deadline:
+        time.sleep(0.05)
+    assert {suggestion['id'] for suggestion in index.suggest('linen')} == {'1', '2'}
+    assert collection.resume_tokens == [None, {'_data': '1'}]
+
+def test_standalone_server_stops_watching():
+    class Standalone:
+        def watch(self, *args, **kwargs):
+            raise OperationFailure('The $changeStream stage is only supported on replica sets', code=CHANGE_STREAMS_UNSUPPORTED)
+
+    # Returns instead of retrying forever
+    AutocompleteRefresher(AutocompleteIndex(), Standalone())._watch_loop()
+
+def test_overlay_lookups_use_the_token_index():
+    index = AutocompleteIndex()
+    index.build([('a', 'Wool Coat', 3)])
+    for i in range(2000):
+        index.upsert(f"new{i}", f"Cotton Tee {i}", 1)
+    index.upsert('x', 'Wool Scarf', 8)
+
+    assert [suggestion['id'] for suggestion in index.suggest('wool')] == ['x', 'a']
+    assert [suggestion['id'] for suggestion in index.suggest('wool scarf')] == ['x']
+    index.remove('x')
+    assert [suggestion['id'] for suggestion in index.suggest('wool')] == ['a']
+
+def test_unchanged_writes_are_ignored():
+    index = AutocompleteIndex()
+    index.build([('a', 'Wool Coat', 3)])
+    # A stock update replays the same name and popularity
+    index.upsert('a', 'Wool Coat', 3)
+    assert not index._added and not index._removed
+    index.upsert('a', 'Wool Coat', 4)
+    index.upsert('a', 'Wool Coat', 4)
+    assert index._sequence == 1
+
+def test_change_stream_skips_unrelated_updates():
+    import mongomock
+    from config import Config
+
+    pipeline = AutocompleteRefresher(AutocompleteIndex(), None)._pipeline()
+    events = mongomock.MongoClient()['db']['events']
+    events.insert_many([
+        {'operationType': 'update', 'updateDescription': {'updatedFields': {'stock': 3}, 'removedFields': []}, 'fullDocument': {'embeddings': [0.1]}},
+        {'operationType': 'update', 'updateDescription': {'updatedFields': {'name': 'Wool Coat'}, 'removedFields': []}, 'fullDocument': {'name': 'Wool Coat', 'embeddings': [0.1]}},
+        {'operationType': 'update', 'updateDescription': {'updatedFields': {}, 'removedFields': [Config.AUTOCOMPLETE_POPULARITY_FIELD]}},
+        {'operationType': 'delete'},
+    ])
+    changes = list(events.aggregate(pipeline))
+    assert len(changes) == 3
+    assert changes[0]['fullDocument'] == {'name': 'Wool Coat'}
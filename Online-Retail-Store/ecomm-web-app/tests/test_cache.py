@@ -0,0 +1,94 @@
+import time
+import pytest
+from cache import LocalBackend, NullCache, RedisBackend, ResponseCache
+
+# Two gunicorn workers sharing one Redis, with fakeredis as the local stand-in
+@pytest.fixture
+def shared_caches(monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    import redis
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url', classmethod(lambda cls, url: fakeredis.FakeRedis(server=server)))
+    return ResponseCache(RedisBackend('redis://stand-in'), ttl=60), ResponseCache(RedisBackend('redis://stand-in'), ttl=60)
+
+@pytest.fixture(params=['local', 'redis'])
+def cache(request):
+    if request.param == 'redis':
+        return request.getfixturevalue('shared_caches')[0]
+    return ResponseCache(LocalBackend(100), ttl=60)
+
+def test_hit_after_set(cache):
+    value, entry = cache.get('listing', 'page=1')
+    assert value is None
+    cache.set(entry, {'products': [1, 2]})
+    assert cache.get('listing', 'page=1')[0] == {'products': [1, 2]}
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+
+def test_invalidation_is_per_tag(cache):
+    cache.set(cache.get('listing', 'page=1')[1], 'listing')
+    cache.set(cache.get('product:1', '')[1], 'product 1')
+    cache.set(cache.get('product:2', '')[1], 'product 2')
+
+    cache.invalidate('listing', 'product:1')
+    assert cache.get('listing', 'page=1')[0] is None
+    assert cache.get('product:1', '')[0] is None
+    assert cache.get('product:2', '')[0] == 'product 2'
+
+    cache.invalidate_all()
+    assert cache.get('product:2', '')[0] is None
+
+def test_response_built_across_an_invalidation_is_not_served(cache):
+    value, entry = cache.get('product:1', '')
+    # A write lands while the handler is still reading the old document
+    cache.invalidate('product:1')
+    cache.set(entry, 'stale')
+    assert cache.get('product:1', '')[0] is None
+
+def test_workers_share_entries_and_invalidations(shared_caches):
+    first, second = shared_caches
+    first.set(first.get('listing', 'page=1')[1], 'listing')
+    assert second.get('listing', 'page=1')[0] == 'listing'
+    second.invalidate('listing')
+    assert first.get('listing', 'page=1')[0] is None
+
+def test_local_entries_expire_and_are_bounded():
+    backend = LocalBackend(2)
+    backend.set('a', 1, ttl=60)
+    backend.set('b', 2, ttl=60)
+    backend.get('a')
+    backend.set('c', 3, ttl=60)
+    assert backend.get('b') is None
+    assert backend.get('a') == 1
+
+    backend.set('d', 4, ttl=0.01)
+    time.sleep(0.02)
+    assert backend.get('d') is None
+
+def test_local_counters_are_bounded_without_reviving_entries():
+    cache = ResponseCache(LocalBackend(1000), ttl=60)
+    cache.backend.max_entries = 10
+    cache.set(cache.get('product:0', '')[1], 'stale')
+    cache.invalidate('product:0')
+    cache.set(cache.get('product:0', '')[1], 'fresh')
+
+    # Invalidate enough other products to push product:0's counter out
+    cache.invalidate(*(f'product:{i}' for i in range(1, 50)))
+    assert len(cache.backend.counters) == 10
+    assert cache.get('product:0', '')[0] != 'stale'
+
+def test_null_cache_stores_nothing():
+    cache = NullCache()
+    value, entry = cache.get('listing', 'page=1')
+    cache.set(entry, 'listing')
+    assert cache.get('listing', 'page=1')[0] is None
+
+def test_detail_writes_invalidate_the_cached_response(db):
+    from app import app
+    from conftest import PRODUCT_IDS
+
+    client = app.test_client()
+    product_id = str(PRODUCT_IDS[0])
+    assert client.get(f'/products/{product_id}').get_json()['price'] == 10.0
+    assert client.put(f'/products/{product_id}', json={'price': 12.5}).status_code == 200
+    assert client.get(f'/products/{product_id}').get_json()['price'] == 12.5
@@ -0,0 +1,68 @@
+import threading
+import time
+from types import SimpleNamespace
+from embedding_service import EmbeddingService
+
+# Embeddings client recording every request; texts starting with "slow" take a second
+class FakeClient:
+    def __init__(self):
+        self.requests = []
+        self.embeddings = self
+
+    def create(self, input, model, **options):
+        self.requests.append((list(input), options))
+        if any(text.startswith('slow') for text in input):
+            time.sleep(1)
+        return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=[float(len(text))]) for i, text in enumerate(input)])
+
+def embed_concurrently(service, texts):
+    results = {}
+    threads = [threading.Thread(target=lambda text=text: results.setdefault(text, service.embed(text))) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_callers_share_a_request():
+    client = FakeClient()
+    service = EmbeddingService(lambda: client, batch_window_ms=50, timeout=5)
+    results = embed_concurrently(service, ['red dress', 'blue jeans', 'red dress'])
+    assert results == {'red dress': [9.0], 'blue jeans': [10.0]}
+    assert len(client.requests) == 1
+    assert client.requests[0][1] == {'timeout': 5}
+    # Cached from now on
+    assert service.embed('blue jeans') == [10.0]
+    assert len(client.requests) == 1
+
+def test_slow_request_does_not_hold_up_later_batches():
+    client = FakeClient()
+    service = EmbeddingService(lambda: client, batch_window_ms=1)
+    slow = threading.Thread(target=service.embed, args=('slow question',))
+    slow.start()
+    time.sleep(0.1)
+
+    started = time.perf_counter()
+    assert service.embed('quick question') == [14.0]
+    assert time.perf_counter() - started < 0.5
+    slow.join()
+
+def test_timing_is_observed_on_the_calling_thread():
+    observed = []
+    service = EmbeddingService(lambda: FakeClient(), batch_window_ms=1, observer=lambda seconds: observed.append(threading.current_thread()))
+    service.embed('wool coat')
+    assert observed == [threading.current_thread()]
+
+def test_vectors_are_cached_as_float32(tmp_path):
+    client = FakeClient()
+    service = EmbeddingService(lambda: client, batch_window_ms=1, persist_path=str(tmp_path / 'embeddings.db'))
+    assert service.embed_many(['linen shirt', 'wool coat'], remember=False) == [[11.0], [9.0]]
+    # Kept out of the LRU but served from the SQLite file
+    assert service.stats()['entries'] == 0
+    assert service.embed_many(['linen shirt'], remember=False) == [[11.0]]
+    assert service.stats()['entries'] == 0
+
+    assert service.embed('linen shirt') == [11.0]
+    assert all(vector.typecode == 'f' for vector in service._lru.values())
+    assert service.embed('linen shirt') == [11.0]
+    assert len(client.requests) == 1
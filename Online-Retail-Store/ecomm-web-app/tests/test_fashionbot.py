@@ -0,0 +1,44 @@
+import json
+import pytest
+from conftest import PRODUCT_IDS
+
+QUESTION = {'product_id': str(PRODUCT_IDS[0]), 'question': 'Does it run small?'}
+
+@pytest.fixture
+def client(db):
+    from app import app
+
+    return app.test_client()
+
+# Function to split an SSE body into (event, data) pairs
+def parse_events(body):
+    events = []
+    for block in body.decode('utf-8').strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+def test_stream_sends_tokens_then_both_recommendation_stages(client):
+    response = client.post('/fashionbot/stream', json=QUESTION)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+
+    events = parse_events(response.get_data())
+    names = [name for name, _ in events]
+    assert names[0] == 'token'
+    assert names[-1] == 'done'
+    stages = [data['stage'] for name, data in events if name == 'recommendations']
+    assert stages == ['initial', 'final']
+
+    answer = ''.join(data['text'] for name, data in events if name == 'token')
+    assert answer == client.post('/fashionbot', json=QUESTION).get_json()['answer']
+    final = events[-2][1]['items']
+    # The asked-about product is never recommended
+    assert final and str(PRODUCT_IDS[0]) not in {item['_id'] for item in final}
+
+def test_stream_rejects_unknown_products(client):
+    response = client.post('/fashionbot/stream', json={'product_id': '0' * 24, 'question': 'Is it warm?'})
+    assert response.status_code == 404
+
+def test_stream_requires_a_question(client):
+    assert client.post('/fashionbot/stream', json={'product_id': str(PRODUCT_IDS[0])}).status_code == 400
@@ -0,0 +1,58 @@
+import os
+import mongomock
+import pytest
+from config import Config
+from jobs import JobRunner, updated_fields
+
+@pytest.fixture
+def runner(monkeypatch):
+    monkeypatch.setattr(Config, 'JOB_BATCH_SIZE', 3)
+    monkeypatch.setattr(Config, 'JOB_MAX_DOCS_PER_SECOND', 1e9)
+    database = mongomock.MongoClient()['jobs-test']
+    database.products.insert_many([{'_id': i, 'name': f"Product {i}", 'brand': 'a' if i % 2 else 'b'} for i in range(10)])
+    batches = []
+    runner = JobRunner(database.jobs, database.products, on_batch=lambda *args: batches.append(args))
+    runner.batches = batches
+    # The tests run jobs themselves, so the runner thread is never started
+    runner._pid = os.getpid()
+    return runner
+
+# Function to run whatever job the runner can claim, as its thread would
+def run_next(runner):
+    job = runner._claim()
+    if job is not None:
+        runner._run(job)
+    return job
+
+def test_delete_job_reports_only_deleted_products(runner):
+    job = runner.submit('delete', {'brand': 'a'})
+    # Another request moves a product out of the filter before its batch runs
+    runner.products.update_one({'_id': 3}, {'$set': {'brand': 'b'}})
+    run_next(runner)
+
+    assert runner.get(job['_id'])['status'] == 'completed'
+    deleted = [product_id for _, product_ids, _ in runner.batches for product_id in product_ids]
+    assert deleted == [1, 5, 7, 9]
+    assert runner.products.count_documents({}) == 6
+
+def test_update_job_reports_updated_products(runner):
+    update = {'$set': {'name': 'Renamed'}}
+    runner.submit('update', {'brand': 'b'}, update)
+    run_next(runner)
+
+    assert {batch[2]['$set']['name'] for batch in runner.batches} == {'Renamed'}
+    assert sorted(product_id for _, product_ids, _ in runner.batches for product_id in product_ids) == [0, 2, 4, 6, 8]
+
+def test_job_cancelled_before_it_starts_does_not_run(runner):
+    job = runner.submit('delete', {})
+    claimed = runner._claim()
+    # Cancelled between the claim and the switch to running
+    runner.cancel(job['_id'])
+    runner._run(claimed)
+
+    assert runner.get(job['_id'])['status'] == 'cancelled'
+    assert runner.products.count_documents({}) == 10
+    assert not runner.batches
+
+def test_updated_fields():
+    assert updated_fields({'$set': {'name': 'x', 'price.amount': 2}, '$rename': {'brand': 'maker'}}) == {'name', 'price', 'brand', 'maker'}
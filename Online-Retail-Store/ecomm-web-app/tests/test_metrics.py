@@ -0,0 +1,34 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, stream_with_context
+from metrics import REQUEST_LATENCY, _record_span, init_metrics
+import metrics
+
+def test_streamed_responses_are_timed_until_the_last_chunk(monkeypatch):
+    monkeypatch.setattr(metrics.Config, 'METRICS_SLOW_REQUEST_MS', 0)
+    traces = []
+    monkeypatch.setattr(metrics.logger, 'warning', lambda event, **fields: traces.append(fields))
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    app = Flask(__name__)
+    init_metrics(app)
+
+    @app.route('/test/stream')
+    def stream():
+        # Spans from an executor thread and from the generator both reach the request
+        executor.submit(contextvars.copy_context().run, _record_span, 'openai', operation='executor').result()
+
+        def generate():
+            time.sleep(0.2)
+            _record_span('openai', operation='generator')
+            yield 'done'
+        return Response(stream_with_context(generate()))
+
+    response = app.test_client().get('/test/stream')
+    assert response.get_data() == b'done'
+    response.close()
+
+    series = REQUEST_LATENCY.series[('GET', '/test/stream', '200')]
+    assert series[-1] == 1 and series[-2] >= 0.2
+    assert [span['operation'] for span in traces[0]['spans']] == ['executor', 'generator']
@@ -0,0 +1,57 @@
+import pytest
+from conftest import PRODUCT_IDS
+
+CART = [{'product_id': str(PRODUCT_IDS[0]), 'delta': -1}, {'product_id': str(PRODUCT_IDS[1]), 'delta': -9}]
+
+@pytest.fixture
+def client(db):
+    from app import app
+
+    return app.test_client()
+
+# Function to replace StockUpdater.apply with canned results, one list per call
+def fake_apply(monkeypatch, *calls):
+    import products
+
+    calls = list(calls)
+    applied = []
+
+    def apply(items):
+        applied.append(items)
+        result = calls.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(products.stock_updater, 'apply', apply)
+    return applied
+
+def test_rejected_cart_is_rolled_back(client, monkeypatch):
+    applied = fake_apply(monkeypatch, ['applied', 'insufficient_stock'], ['applied'])
+    response = client.post('/products/stock', json={'items': CART, 'all_or_nothing': True})
+
+    assert response.status_code == 200
+    assert response.get_json()['rejected'] is True
+    assert [item['result'] for item in response.get_json()['items']] == ['rolled_back', 'insufficient_stock']
+    assert applied[1] == [(str(PRODUCT_IDS[0]), 1)]
+
+def test_failed_rollback_is_reported(client, monkeypatch):
+    fake_apply(monkeypatch, ['applied', 'insufficient_stock'], ['not_found'])
+    response = client.post('/products/stock', json={'items': CART, 'all_or_nothing': True})
+
+    assert response.status_code == 500
+    assert [item['result'] for item in response.get_json()['items']] == ['rollback_failed', 'insufficient_stock']
+
+def test_rollback_error_is_reported(client, monkeypatch):
+    fake_apply(monkeypatch, ['applied', 'insufficient_stock'], ConnectionError('primary stepped down'))
+    response = client.post('/products/stock', json={'items': CART, 'all_or_nothing': True})
+
+    assert response.status_code == 500
+    assert response.get_json()['items'][0]['result'] == 'rollback_failed'
+
+def test_partial_cart_without_all_or_nothing(client, monkeypatch):
+    fake_apply(monkeypatch, ['applied', 'insufficient_stock'])
+    response = client.post('/products/stock', json={'items': CART})
+
+    assert response.get_json()['rejected'] is False
+    assert [item['result'] for item in response.get_json()['items']] == ['applied', 'insufficient_stock']
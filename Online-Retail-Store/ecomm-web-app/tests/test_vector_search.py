@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from bson import ObjectId
+from vector_search import LocalVectorBackend, VectorRefresher
+
+VECTORS = np.array([[1.0, 0.0], [0.6, 0.8], [-1.0, 0.0]], dtype=np.float32)
+IDS = [ObjectId() for _ in VECTORS]
+
+# Scores as Atlas Vector Search reports them for each similarity
+@pytest.mark.parametrize('similarity, expected', [
+    ('euclidean', [1.0, 1 / (1 + 0.8), 1 / 5]),
+    ('cosine', [1.0, 0.8, 0.0]),
+    ('dotProduct', [1.0, 0.8, 0.0]),
+])
+def test_local_scores_match_atlas(similarity, expected):
+    backend = LocalVectorBackend(None, VECTORS, IDS, similarity=similarity)
+    matches = backend.matches([1.0, 0.0], 3)
+    documents = backend.attach_scores(matches, [{'_id': product_id} for product_id in IDS])
+    assert [document['_id'] for document in documents] == IDS
+    assert [document['score'] for document in documents] == pytest.approx(expected, abs=1e-6)
+
+@pytest.mark.parametrize('mode', ['exact', 'ivf'])
+def test_updates_are_folded_into_the_index(mode):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 4)).astype(np.float32)
+    ids = [ObjectId() for _ in vectors]
+    backend = LocalVectorBackend(None, vectors, ids, mode=mode, ivf_lists=2, ivf_probes=2, compact_rows=120)
+
+    updated = rng.normal(size=(150, 4)).astype(np.float32)
+    new_ids = [ObjectId() for _ in updated]
+    # Replace every existing vector, add new ones and remove a few from the delta again
+    for product_id, vector in zip(ids + new_ids[:100], updated):
+        backend.upsert(product_id, vector.tolist())
+    for product_id in new_ids[:10]:
+        backend.remove(product_id)
+    for product_id, vector in zip(new_ids[100:], updated[100:]):
+        backend.upsert(product_id, vector.tolist())
+
+    # The first 120 writes were folded in; the rest are in the delta
+    assert len(backend.ids) == 120 and backend.deleted.sum() == 10 and len(backend.delta_ids) == 80
+    live = dict(zip(ids + new_ids, updated))
+    for product_id in new_ids[:10]:
+        del live[product_id]
+    for product_id, vector in list(live.items())[::7]:
+        assert backend.matches(vector.tolist(), 1)[0][0] == product_id
+
+def test_refresher_applies_embeddings_changes():
+    backend = LocalVectorBackend(None, VECTORS, IDS, similarity='dotProduct')
+    refresher = VectorRefresher(backend, None)
+    new_id = ObjectId()
+    refresher._apply({'operationType': 'insert', 'documentKey': {'_id': new_id}, 'fullDocument': {'embeddings': [0.0, 1.0]}})
+    refresher._apply({'operationType': 'update', 'documentKey': {'_id': IDS[0]}, 'fullDocument': {}})
+    assert [product_id for product_id, _ in backend.matches([0.0, 1.0], 3)] == [new_id, IDS[1], IDS[2]]
@@ -1,9 +1,17 @@
-from flask import Blueprint, request, jsonify
-from pymongo import MongoClient, errors
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from concurrent.futures import ThreadPoolExecutor
 from bson import ObjectId
 from config import Config
+from clients import LazyCollection, get_openai_client, get_embedding_service
+from vector_search import get_vector_backend
+from products import LISTING_PROJECTION
+from answer_cache import answer_cache
+from autocomplete_index import autocomplete_index, autocomplete_refresher
+from metrics import openai_timer, observe_openai
+import contextvars
+import json
+import time
 import structlog
-from openai import OpenAI
 
 # Initialize structured logging
 logger = structlog.get_logger()
@@ -11,26 +19,46 @@ logger = structlog.get_logger()
 # Create blueprint
 user_bp = Blueprint('user', __name__)
 
-# Initialize the OpenAI client
-aiClient = OpenAI()
+# Collections on the shared, lazily connected client; autocomplete and
+# recommendation reads may be served by secondaries
+collection = LazyCollection()
+listing_collection = LazyCollection(read_preference=Config.MONGODB_LISTING_READ_PREFERENCE)
 
-# Connect to MongoDB
-try:
-    client = MongoClient(Config.MONGODB_URI)
-    db = client[Config.MONGODB_DATABASE]
-    collection = db[Config.MONGODB_COLLECTION]
-    logger.info("Connected to MongoDB")
-except errors.ConnectionError as e:
-    logger.error("Could not connect to MongoDB", error=str(e))
-    raise
+# Vector search backend selected by Config.VECTOR_BACKEND
+vector_backend = get_vector_backend(listing_collection)
 
-def generate_embedding(text, model="text-embedding-3-large"):
+# Background workers for the recommendation searches that run while answers stream
+stream_executor = ThreadPoolExecutor(max_workers=Config.FASHIONBOT_STREAM_WORKERS)
+
+def generate_embedding(text):
     try:
-        return aiClient.embeddings.create(input=[text], model=model).data[0].embedding
+        return get_embedding_service().embed(text)
     except Exception as e:
         logger.error("Error generating embedding", error=str(e))
         raise
 
+# Function to build the chat messages for a question about a product image
+def build_conversation(question, image_url):
+    return [
+        {"role": "system", "content": "You are a helpful fashion assistant from the Zalando retail store."},
+        {"role": "assistant", "content": "Include this text at the end of the message: I have listed some recommendations below for their consideration based on the image and what they asked for."},
+        {"role": "user", "content": [
+            {"type": "text", "text": question},
+            {"type": "image_url", "image_url": {"url": image_url}}
+        ]},
+    ]
+
+# Function to find products similar to an embedding, excluding the product being discussed
+def find_recommendations(embedding, product_id, limit=7):
+    recommendations = vector_backend.search(embedding, limit, LISTING_PROJECTION, exclude_id=ObjectId(product_id))
+    for recommendation in recommendations:
+        recommendation['_id'] = str(recommendation['_id'])
+    return recommendations
+
+# Function to format one server-sent event
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @user_bp.route('/fashionbot', methods=['POST'])
 def fashionbot():
     try:
@@ -44,6 +72,13 @@ def fashionbot():
             logger.error("Product ID and question are required")
             return jsonify({'error': 'Product ID and question are required', 'status_code': 400}), 400
 
+        # Answer repeated questions about the same product from the semantic cache
+        if Config.FASHIONBOT_CACHE_ENABLED:
+            cache_embedding = generate_embedding(question)
+            cached = answer_cache.lookup(product_id, cache_embedding)
+            if cached:
+                return jsonify({'answer': cached['answer'], 'recommendations': cached['recommendations'], 'cached': True})
+
         product = collection.find_one({'_id': ObjectId(product_id)}, {'embeddings': 1, 'images': 1})
         if not product or 'embeddings' not in product or 'images' not in product:
             logger.error("Product not found or missing embeddings/images")
@@ -51,57 +86,22 @@ def fashionbot():
 
         image_url = product['images'][0]  # Assuming there's at least one image
 
-        conversation = [
-            {"role": "system", "content": "You are a helpful fashion assistant from the Zalando retail store."},
-            {"role": "assistant", "content": "Include this text at the end of the message: I have listed some recommendations below for their consideration based on the image and what they asked for."},
-            {"role": "user", "content": [
-                {"type": "text", "text": question},
-                {"type": "image_url", "image_url": {"url": image_url}}
-            ]},
-        ]
+        conversation = build_conversation(question, image_url)
 
-        completion = aiClient.chat.completions.create(
-            model="gpt-4o",
-            messages=conversation,
-        )
+        with openai_timer('chat'):
+            completion = get_openai_client().chat.completions.create(
+                model="gpt-4o",
+                messages=conversation,
+            )
         answer_content = completion.choices[0].message.content
 
         combined_input = f"Question: {question}\nAnswer: {answer_content}"
         question_embedding = generate_embedding(combined_input)
 
-        search_stage = {
-            "$vectorSearch": {
-                "index": "vs_details",
-                "queryVector": question_embedding,
-                "path": "embeddings",
-                "numCandidates": 50,
-                "limit": 7,
-            }
-        }
+        recommendations = find_recommendations(question_embedding, product_id)
 
-        pipeline = [
-            search_stage,
-            {'$match': {'_id': {'$ne': ObjectId(product_id)}}},
-            {'$project': {
-                'name': 1,
-                'price': 1,
-                'description': 1,
-                'brand': 1,
-                'main_category': 1,
-                'sub_category': 1,
-                'images': 1,
-                'sponsored': 1,
-                'on_sale': 1,
-                'created_manually': 1,
-                'score': {'$meta': 'searchScore'}
-            }}
-        ]
-
-        results = collection.aggregate(pipeline)
-        recommendations = list(results)
-
-        for recommendation in recommendations:
-            recommendation['_id'] = str(recommendation['_id'])
+        if Config.FASHIONBOT_CACHE_ENABLED:
+            answer_cache.store(product_id, question, cache_embedding, answer_content, recommendations)
 
         logger.debug("Answer content", answer_content=answer_content)
         logger.debug("Recommendations", recommendations=recommendations)
@@ -111,6 +111,94 @@ def fashionbot():
         logger.error("General Error", error=str(e))
         return jsonify({'error': 'An unexpected error occurred. Please try again later.', 'status_code': 500}), 500
 
+# Streaming variant of /fashionbot, sent as server-sent events:
+#   token           - {"text": ...} answer fragments as the model produces them
+#   recommendations - {"stage": "initial" | "final", "items": [...]}; the initial set comes
+#                     from the question alone and is searched while the answer streams,
+#                     the final set from the question and the full answer
+#   done            - {"cached": bool}
+#   error           - {"error": ...}
+@user_bp.route('/fashionbot/stream', methods=['POST'])
+def fashionbot_stream():
+    try:
+        data = request.json
+        product_id = data.get('product_id')
+        question = data.get('question')
+
+        if not product_id or not question:
+            logger.error("Product ID and question are required")
+            return jsonify({'error': 'Product ID and question are required', 'status_code': 400}), 400
+
+        question_embedding = generate_embedding(question)
+        if Config.FASHIONBOT_CACHE_ENABLED:
+            cached = answer_cache.lookup(product_id, question_embedding)
+            if cached:
+                def replay():
+                    yield sse_event('token', {'text': cached['answer']})
+                    yield sse_event('recommendations', {'stage': 'final', 'items': cached['recommendations']})
+                    yield sse_event('done', {'cached': True})
+                return Response(replay(), mimetype='text/event-stream')
+
+        product = collection.find_one({'_id': ObjectId(product_id)}, {'images': 1})
+        if not product or not product.get('images'):
+            logger.error("Product not found or missing images")
+            return jsonify({'error': 'Product not found or missing images', 'status_code': 404}), 404
+
+        # Start the first recommendation search now so it overlaps with the model's answer;
+        # running it in a copy of this context keeps its MongoDB calls in the request's metrics
+        initial_recommendations = stream_executor.submit(contextvars.copy_context().run, find_recommendations, question_embedding, product_id)
+        stream_started = time.perf_counter()
+        with openai_timer('chat_stream_connect'):
+            stream = get_openai_client().chat.completions.create(
+                model="gpt-4o",
+                messages=build_conversation(question, product['images'][0]),
+                stream=True,
+            )
+    except Exception as e:
+        logger.error("General Error", error=str(e))
+        return jsonify({'error': 'An unexpected error occurred. Please try again later.', 'status_code': 500}), 500
+
+    def generate():
+        answer_parts = []
+        initial_sent = False
+        try:
+            for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    if not answer_parts:
+                        observe_openai('chat_stream_first_token', time.perf_counter() - stream_started)
+                    answer_parts.append(text)
+                    yield sse_event('token', {'text': text})
+                if not initial_sent and initial_recommendations.done():
+                    initial_sent = True
+                    yield sse_event('recommendations', {'stage': 'initial', 'items': initial_recommendations.result()})
+            if not initial_sent:
+                yield sse_event('recommendations', {'stage': 'initial', 'items': initial_recommendations.result()})
+
+            answer_content = ''.join(answer_parts)
+            observe_openai('chat_stream', time.perf_counter() - stream_started)
+            combined_embedding = generate_embedding(f"Question: {question}\nAnswer: {answer_content}")
+            recommendations = find_recommendations(combined_embedding, product_id)
+            yield sse_event('recommendations', {'stage': 'final', 'items': recommendations})
+
+            if Config.FASHIONBOT_CACHE_ENABLED:
+                answer_cache.store(product_id, question, question_embedding, answer_content, recommendations)
+            yield sse_event('done', {'cached': False})
+        except Exception as e:
+            logger.error("Error streaming FashionBot answer", error=str(e))
+            yield sse_event('error', {'error': 'An unexpected error occurred. Please try again later.'})
+
+    # Disable proxy buffering so tokens reach the browser as soon as they are produced
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@user_bp.route('/fashionbot/cache/stats', methods=['GET'])
+def fashionbot_cache_stats():
+    return jsonify(answer_cache.stats())
+
+@user_bp.route('/embeddings/cache/stats', methods=['GET'])
+def embedding_cache_stats():
+    return jsonify(get_embedding_service().stats())
+
 @user_bp.route('/autocomplete', methods=['GET'])
 def autocomplete():
     try:
@@ -118,6 +206,14 @@ def autocomplete():
         if not search_query:
             return jsonify([])
 
+        # Serve from the in-process index once it is built; $search covers cold starts and misses
+        if Config.AUTOCOMPLETE_BACKEND == 'local':
+            autocomplete_refresher.ensure_started()
+            if autocomplete_index.ready:
+                suggestions = autocomplete_index.suggest(search_query)
+                if suggestions:
+                    return jsonify(suggestions)
+
         pipeline = [
             {
                 '$search': {
@@ -129,14 +225,14 @@ def autocomplete():
                     }
                 }
             },
-            {'$limit': 5},
+            {'$limit': Config.AUTOCOMPLETE_LIMIT},
             {'$project': {
                 '_id': 1,
                 'name': 1
             }}
         ]
 
-        results = collection.aggregate(pipeline)
+        results = listing_collection.aggregate(pipeline)
         suggestions = [{'id': str(result['_id']), 'name': result['name']} for result in results]
         return jsonify(suggestions)
     except Exception as e:
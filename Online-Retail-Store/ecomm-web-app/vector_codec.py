@@ -0,0 +1,67 @@
+import math
+import numpy as np
+from bson.binary import Binary
+
+# Storage encodings for embedding vectors.
+#
+#   "array"    BSON array of doubles (8 bytes per dimension plus per-element overhead)
+#   "float32"  BSON binary vector, subtype 9, packed little-endian float32
+#   "int8"     BSON binary vector, subtype 9, scalar-quantized to int8
+#
+# Binary vectors carry a dtype byte and a padding byte before the payload, the layout
+# Atlas Vector Search indexes natively. int8 values are round(v * scale) clipped to
+# [-127, 127]; one scale must be used for every vector and query of an index, so it is
+# derived from the dimension count unless configured. Readers accept every encoding.
+# Only numpy and bson are imported so the generator scripts can share this module.
+
+STORAGE_FORMATS = ('array', 'float32', 'int8')
+BINARY_VECTOR_SUBTYPE = 9
+FLOAT32_DTYPE = 0x27
+INT8_DTYPE = 0x03
+
+# Embedding components are roughly normal with standard deviation 1/sqrt(dimensions) for
+# unit vectors; the default int8 scale clips beyond this many standard deviations
+INT8_CLIP_SIGMAS = 5
+
+def int8_scale(dimensions, scale=None):
+    return scale or 127 * math.sqrt(dimensions) / INT8_CLIP_SIGMAS
+
+# Function to reduce a vector to its first dimensions components and renormalize it,
+# which is how the embeddings API shortens text-embedding-3 vectors
+def truncate_vector(vector, dimensions):
+    vector = np.asarray(vector, dtype=np.float32)[:dimensions]
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+# Function to encode a vector, given as floats or in any stored encoding, for storage
+# or as a $vectorSearch queryVector
+def encode_vector(vector, storage='array', scale=None):
+    vector = decode_vector(vector, scale)
+    if storage == 'array':
+        return vector.tolist()
+    if storage == 'float32':
+        return Binary(bytes([FLOAT32_DTYPE, 0]) + vector.astype('<f4').tobytes(), BINARY_VECTOR_SUBTYPE)
+    if storage == 'int8':
+        quantized = np.clip(np.rint(vector * int8_scale(len(vector), scale)), -127, 127).astype(np.int8)
+        return Binary(bytes([INT8_DTYPE, 0]) + quantized.tobytes(), BINARY_VECTOR_SUBTYPE)
+    raise ValueError(f"Unknown vector storage format: {storage}")
+
+# Function to decode any stored encoding to a float32 NumPy vector
+def decode_vector(value, scale=None):
+    if isinstance(value, np.ndarray):
+        return value.astype(np.float32, copy=False)
+    if not isinstance(value, (bytes, Binary)):
+        return np.asarray(value, dtype=np.float32)
+    raw = bytes(value)
+    dtype, payload = raw[0], raw[2:]
+    if dtype == FLOAT32_DTYPE:
+        return np.frombuffer(payload, dtype='<f4').astype(np.float32)
+    if dtype == INT8_DTYPE:
+        quantized = np.frombuffer(payload, dtype=np.int8).astype(np.float32)
+        return quantized / int8_scale(len(quantized), scale)
+    raise ValueError(f"Unsupported binary vector dtype: {dtype:#x}")
+
+# Function to name the encoding of a stored value, for migrations and reports
+def storage_of(value):
+    if isinstance(value, (bytes, Binary)):
+        return {FLOAT32_DTYPE: 'float32', INT8_DTYPE: 'int8'}.get(bytes(value)[0], 'unknown')
+    return 'array'
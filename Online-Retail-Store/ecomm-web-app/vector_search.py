@@ -0,0 +1,411 @@
+import argparse
+import os
+import threading
+import time
+import numpy as np
+from bson import ObjectId
+from change_streams import watch_changes
+from config import Config
+from vector_codec import decode_vector, encode_vector
+import structlog
+
+logger = structlog.get_logger()
+
+# Vector search backends behind one interface:
+#
+#   search(query_vector, limit, projection, exclude_id=None) -> list of documents with a 'score'
+#
+# AtlasVectorBackend runs $vectorSearch against the vs_details index. LocalVectorBackend
+# answers the same query in-process from a memory-mapped float32 snapshot of every
+# product's embeddings and only goes to MongoDB to fetch the matched documents.
+# Query vectors may be float lists or any stored encoding from vector_codec.py.
+
+class AtlasVectorBackend:
+    def __init__(self, collection, num_candidates=50):
+        self.collection = collection
+        self.num_candidates = num_candidates
+
+    def pipeline(self, query_vector, limit, projection, exclude_id=None):
+        # The query must use the same encoding as the indexed vectors
+        query_vector = encode_vector(query_vector, Config.VECTOR_STORAGE, Config.VECTOR_INT8_SCALE)
+        pipeline = [
+            {
+                "$vectorSearch": {
+                    "index": "vs_details",
+                    "queryVector": query_vector,
+                    "path": "embeddings",
+                    "numCandidates": self.num_candidates,
+                    "limit": limit,
+                }
+            }
+        ]
+        if exclude_id is not None:
+            pipeline.append({'$match': {'_id': {'$ne': exclude_id}}})
+        pipeline.append({'$project': {**projection, 'score': {'$meta': 'vectorSearchScore'}}})
+        return pipeline
+
+    def search(self, query_vector, limit, projection, exclude_id=None):
+        return list(self.collection.aggregate(self.pipeline(query_vector, limit, projection, exclude_id)))
+
+    def upsert(self, product_id, vector):
+        pass
+
+    def remove(self, product_id):
+        pass
+
+# Function to turn squared euclidean distances or dot products into Atlas-style scores;
+# Atlas scores cosine and dotProduct alike, as (1 + dot product) / 2
+def _scores(raw, similarity):
+    if similarity == 'euclidean':
+        return 1.0 / (1.0 + raw)
+    return (1.0 + raw) / 2.0
+
+# Function to load a snapshot written by build_snapshot. The matrix is memory-mapped
+# read-only, so every worker process shares one copy through the page cache.
+def load_snapshot(snapshot_path):
+    vectors = np.load(f"{snapshot_path}.vectors.npy", mmap_mode='r')
+    ids = [ObjectId(raw.tobytes()) for raw in np.load(f"{snapshot_path}.ids.npy")]
+    return vectors, ids
+
+class LocalVectorBackend:
+    def __init__(self, collection, vectors, ids, similarity='euclidean', mode='exact', ivf_lists=256, ivf_probes=8, compact_rows=10000):
+        self.collection = collection
+        self.similarity = similarity
+        self.mode = mode
+        self.ivf_probes = ivf_probes
+        self.compact_rows = compact_rows
+        self.lock = threading.Lock()
+        # Set by get_vector_backend to apply writes made by other workers
+        self.refresher = None
+
+        self.vectors = vectors
+        self.ids = ids
+        self.positions = {product_id: i for i, product_id in enumerate(self.ids)}
+        if similarity == 'cosine':
+            # Cosine similarity is a dot product over unit vectors; normalize into an in-memory copy
+            self.vectors = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True).clip(1e-12)
+        self.norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+
+        # Incremental updates live next to the snapshot: deleted or replaced rows are masked
+        # out of the base matrix and new vectors are written to a preallocated delta buffer,
+        # found through a dict of product id to row. Removing a delta row moves the last row
+        # into its place. Once the delta holds compact_rows vectors it is folded into the
+        # base matrix (and the IVF lists), which then stops being shared with other workers.
+        self.deleted = np.zeros(len(self.ids), dtype=bool)
+        self.delta_ids = []
+        self.delta_rows = {}
+        self.delta_vectors = np.empty((64, self.vectors.shape[1]), dtype=np.float32)
+        self.delta_norms = np.empty(64, dtype=np.float32)
+
+        self.centroids = None
+        if mode == 'ivf':
+            self.centroids, self.ivf_assignments = build_ivf(self.vectors, ivf_lists)
+            self._group_ivf()
+
+        logger.info("Vector index ready", vectors=len(self.ids), dimensions=self.vectors.shape[1], mode=mode)
+
+    # IVF keeps an in-memory copy of the matrix grouped by cluster, so probing a list scans
+    # contiguous rows instead of gathering scattered ones. Rows sorted by list, so each
+    # inverted list is one contiguous slice [offsets[c], offsets[c + 1])
+    def _group_ivf(self):
+        self.ivf_order = np.argsort(self.ivf_assignments, kind='stable')
+        self.ivf_offsets = np.searchsorted(self.ivf_assignments[self.ivf_order], np.arange(len(self.centroids) + 1))
+        self.ivf_vectors = np.ascontiguousarray(self.vectors[self.ivf_order])
+        self.ivf_norms = self.norms[self.ivf_order]
+
+    def _prepare_query(self, query_vector):
+        query = decode_vector(query_vector, Config.VECTOR_INT8_SCALE)
+        if self.similarity == 'cosine':
+            query = query / max(np.linalg.norm(query), 1e-12)
+        return query
+
+    def _raw_scores(self, vectors, norms, query):
+        dots = vectors @ query
+        if self.similarity == 'euclidean':
+            # Squared distance without materializing differences: |x|^2 - 2x.q + |q|^2
+            return norms - 2 * dots + query @ query
+        return dots
+
+    def _top_k(self, query, k):
+        if self.mode == 'ivf':
+            centroid_distances = ((self.centroids - query) ** 2).sum(axis=1)
+            n_probes = min(self.ivf_probes, len(self.centroids))
+            probes = np.argpartition(centroid_distances, n_probes - 1)[:n_probes]
+            slices = [slice(self.ivf_offsets[p], self.ivf_offsets[p + 1]) for p in probes]
+            candidates = np.concatenate([self.ivf_order[s] for s in slices])
+            raw = np.concatenate([self._raw_scores(self.ivf_vectors[s], self.ivf_norms[s], query) for s in slices])
+            deleted = self.deleted[candidates]
+        else:
+            candidates = None
+            raw = self._raw_scores(self.vectors, self.norms, query)
+            deleted = self.deleted
+
+        worst = np.inf if self.similarity == 'euclidean' else -np.inf
+        raw = np.where(deleted, worst, raw)
+
+        results = []
+        if len(raw):
+            k_base = min(k, len(raw))
+            order = raw if self.similarity == 'euclidean' else -raw
+            top = np.argpartition(order, k_base - 1)[:k_base]
+            for i in top:
+                if raw[i] != worst:
+                    index = i if candidates is None else candidates[i]
+                    results.append((self.ids[index], float(raw[i])))
+
+        count = len(self.delta_ids)
+        if count:
+            delta_raw = self._raw_scores(self.delta_vectors[:count], self.delta_norms[:count], query)
+            results.extend(zip(self.delta_ids, delta_raw.tolist()))
+
+        results.sort(key=lambda item: item[1], reverse=self.similarity != 'euclidean')
+        return results[:k]
+
+    # Function to find the (product_id, raw score) pairs of the nearest products
+    def matches(self, query_vector, limit, exclude_id=None):
+        if self.refresher:
+            self.refresher.ensure_started()
+        query = self._prepare_query(query_vector)
+        # Like $vectorSearch followed by $match, the excluded product counts towards the limit
+        with self.lock:
+            matches = self._top_k(query, limit)
+        return [(product_id, raw) for product_id, raw in matches if product_id != exclude_id]
+
+    def search(self, query_vector, limit, projection, exclude_id=None):
+        matches = self.matches(query_vector, limit, exclude_id)
+        documents = self.collection.find({'_id': {'$in': [product_id for product_id, _ in matches]}}, projection)
+        return self.attach_scores(matches, documents)
+
+    # Function to order fetched documents like the matches and attach Atlas-style scores
+    def attach_scores(self, matches, documents):
+        documents = {document['_id']: document for document in documents}
+        results = []
+        for product_id, raw in matches:
+            document = documents.get(product_id)
+            if document:
+                document['score'] = float(_scores(raw, self.similarity))
+                results.append(document)
+        return results
+
+    def upsert(self, product_id, vector):
+        vector = self._prepare_query(vector)
+        with self.lock:
+            position = self.positions.get(product_id)
+            if position is not None:
+                self.deleted[position] = True
+            row = self.delta_rows.get(product_id)
+            if row is None:
+                row = len(self.delta_ids)
+                if row == len(self.delta_vectors):
+                    self.delta_vectors = np.concatenate([self.delta_vectors, np.empty_like(self.delta_vectors)])
+                    self.delta_norms = np.concatenate([self.delta_norms, np.empty_like(self.delta_norms)])
+                self.delta_rows[product_id] = row
+                self.delta_ids.append(product_id)
+            self.delta_vectors[row] = vector
+            self.delta_norms[row] = vector @ vector
+            if len(self.delta_ids) >= self.compact_rows:
+                self._compact()
+
+    def remove(self, product_id):
+        with self.lock:
+            position = self.positions.get(product_id)
+            if position is not None:
+                self.deleted[position] = True
+            row = self.delta_rows.pop(product_id, None)
+            if row is not None:
+                last = len(self.delta_ids) - 1
+                if row != last:
+                    moved = self.delta_ids[last]
+                    self.delta_ids[row] = moved
+                    self.delta_rows[moved] = row
+                    self.delta_vectors[row] = self.delta_vectors[last]
+                    self.delta_norms[row] = self.delta_norms[last]
+                self.delta_ids.pop()
+
+    # Function to fold the delta and the deletions into the base matrix; IVF assigns the
+    # new rows to their nearest existing centroids rather than clustering again
+    def _compact(self):
+        started = time.perf_counter()
+        keep = ~self.deleted
+        count = len(self.delta_ids)
+        self.vectors = np.concatenate([self.vectors[keep], self.delta_vectors[:count]])
+        self.norms = np.concatenate([self.norms[keep], self.delta_norms[:count]])
+        self.ids = [product_id for product_id, deleted in zip(self.ids, self.deleted) if not deleted] + self.delta_ids
+        self.positions = {product_id: i for i, product_id in enumerate(self.ids)}
+        self.deleted = np.zeros(len(self.ids), dtype=bool)
+        if self.mode == 'ivf':
+            self.ivf_assignments = np.concatenate([self.ivf_assignments[keep], _nearest_centroid(self.delta_vectors[:count], self.centroids)])
+            self._group_ivf()
+        self.delta_ids = []
+        self.delta_rows = {}
+        logger.info("Folded vector updates into the index", vectors=len(self.ids), updates=count, seconds=round(time.perf_counter() - started, 2))
+
+# Function to cluster the vectors with a few rounds of k-means and assign every vector to a list
+def build_ivf(vectors, n_lists, iterations=10, sample_size=50000, seed=0):
+    rng = np.random.default_rng(seed)
+    n_lists = min(n_lists, len(vectors))
+    sample = vectors[rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _nearest_centroid(sample, centroids)
+        for c in range(n_lists):
+            members = sample[assignments == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+    return centroids, _nearest_centroid(vectors, centroids)
+
+# Function to assign each vector to its nearest centroid, in chunks to bound memory
+def _nearest_centroid(vectors, centroids, chunk_size=8192):
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = np.asarray(vectors[start:start + chunk_size])
+        distances = centroid_norms[None, :] - 2 * chunk @ centroids.T
+        assignments[start:start + chunk_size] = distances.argmin(axis=1)
+    return assignments
+
+# Function to write every product's embeddings to a snapshot, streaming from a batched cursor
+def build_snapshot(collection, snapshot_path, batch_size=10000):
+    ids = []
+    chunks = []
+    chunk = []
+    for document in collection.find({'embeddings': {'$exists': True}}, {'embeddings': 1}).batch_size(batch_size):
+        ids.append(np.frombuffer(document['_id'].binary, dtype=np.uint8))
+        chunk.append(decode_vector(document['embeddings'], Config.VECTOR_INT8_SCALE))
+        if len(chunk) >= batch_size:
+            chunks.append(np.asarray(chunk, dtype=np.float32))
+            chunk = []
+    if chunk:
+        chunks.append(np.asarray(chunk, dtype=np.float32))
+
+    vectors = np.concatenate(chunks) if chunks else np.empty((0, 0), dtype=np.float32)
+    # Write to temporary names first so running workers never map a half-written snapshot
+    np.save(f"{snapshot_path}.vectors.tmp.npy", vectors)
+    np.save(f"{snapshot_path}.ids.tmp.npy", np.asarray(ids, dtype=np.uint8).reshape(-1, 12))
+    os.replace(f"{snapshot_path}.vectors.tmp.npy", f"{snapshot_path}.vectors.npy")
+    os.replace(f"{snapshot_path}.ids.tmp.npy", f"{snapshot_path}.ids.npy")
+    return len(ids)
+
+# Applies embeddings written by any worker to the local backend: the worker that served
+# a write updates its own backend straight away, and every worker picks the write up from
+# a change stream on the embeddings field. Deployments without change streams (standalone
+# mongod) only see other workers' writes after the snapshot is rebuilt and the workers
+# restart, so run a single worker there.
+class VectorRefresher:
+    def __init__(self, backend, collection, max_retry_seconds=60):
+        self.backend = backend
+        self.collection = collection
+        self.max_retry_seconds = max_retry_seconds
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # Function to start the watch thread once per process
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._watch_loop, daemon=True).start()
+
+    # Only inserts, replaces, deletes and updates of the embeddings matter here, and only
+    # the embeddings of the looked-up document are sent back
+    def _pipeline(self):
+        return [
+            {'$match': {'$or': [
+                {'operationType': {'$in': ['insert', 'replace', 'delete']}},
+                {'operationType': 'update', '$or': [
+                    {'updateDescription.updatedFields.embeddings': {'$exists': True}},
+                    {'updateDescription.removedFields': 'embeddings'}
+                ]}
+            ]}},
+            {'$project': {'operationType': 1, 'documentKey': 1, 'fullDocument.embeddings': 1}}
+        ]
+
+    def _apply(self, change):
+        product_id = change['documentKey']['_id']
+        document = change.get('fullDocument')
+        if change['operationType'] == 'delete' or not document or 'embeddings' not in document:
+            self.backend.remove(product_id)
+        else:
+            self.backend.upsert(product_id, document['embeddings'])
+
+    def _watch_loop(self):
+        watch_changes(self.collection, self._pipeline(), self._apply, 'vectors', max_retry_seconds=self.max_retry_seconds)
+        logger.warning("Other workers' vector updates are only picked up from the next snapshot")
+
+_backend = None
+_backend_lock = threading.Lock()
+
+# Function to get the process-wide backend selected by Config.VECTOR_BACKEND
+def get_vector_backend(collection):
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if Config.VECTOR_BACKEND == 'local':
+                vectors, ids = load_snapshot(Config.VECTOR_SNAPSHOT_PATH)
+                _backend = LocalVectorBackend(
+                    collection,
+                    vectors,
+                    ids,
+                    similarity=Config.VECTOR_SIMILARITY,
+                    mode=Config.VECTOR_SEARCH_MODE,
+                    ivf_lists=Config.VECTOR_IVF_LISTS,
+                    ivf_probes=Config.VECTOR_IVF_PROBES,
+                    compact_rows=Config.VECTOR_COMPACT_ROWS
+                )
+                _backend.refresher = VectorRefresher(_backend, collection)
+            else:
+                _backend = AtlasVectorBackend(collection)
+        return _backend
+
+# Function to compare approximate (IVF) search with exact search on recall@k and latency
+def benchmark(vectors, k, queries, ivf_lists, ivf_probes, similarity):
+    rng = np.random.default_rng(1)
+    query_vectors = vectors[rng.choice(len(vectors), queries, replace=False)] + rng.normal(0, 0.01, (queries, vectors.shape[1])).astype(np.float32)
+
+    ids = list(range(len(vectors)))
+    engines = {'exact': LocalVectorBackend(None, vectors, ids, similarity, 'exact')}
+    started = time.perf_counter()
+    engines['ivf'] = LocalVectorBackend(None, vectors, ids, similarity, 'ivf', ivf_lists, ivf_probes)
+    print(f"IVF build: {time.perf_counter() - started:.2f}s for {ivf_lists} lists")
+
+    results = {}
+    for mode, engine in engines.items():
+        latencies = []
+        results[mode] = []
+        for query in query_vectors:
+            started = time.perf_counter()
+            results[mode].append({product_id for product_id, _ in engine._top_k(engine._prepare_query(query), k)})
+            latencies.append((time.perf_counter() - started) * 1000)
+        recall = np.mean([len(found & truth) / k for found, truth in zip(results[mode], results['exact'])])
+        print(f"{mode:>6}: recall@{k} {recall:.3f}, p50 {np.percentile(latencies, 50):.2f} ms, p99 {np.percentile(latencies, 99):.2f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build vector snapshots and benchmark the local vector search engine.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('snapshot', help="Write the embeddings snapshot from MongoDB")
+    bench = subparsers.add_parser('benchmark', help="Recall and latency of IVF against exact search")
+    bench.add_argument('--synthetic', type=int, default=0, help="Benchmark on this many random vectors instead of the snapshot")
+    bench.add_argument('--dimensions', type=int, default=3072)
+    bench.add_argument('-k', type=int, default=10)
+    bench.add_argument('--queries', type=int, default=200)
+    bench.add_argument('--lists', type=int, default=Config.VECTOR_IVF_LISTS)
+    bench.add_argument('--probes', type=int, default=Config.VECTOR_IVF_PROBES)
+    args = parser.parse_args()
+
+    if args.command == 'snapshot':
+        from pymongo import MongoClient
+
+        client = MongoClient(Config.MONGODB_URI)
+        count = build_snapshot(client[Config.MONGODB_DATABASE][Config.MONGODB_COLLECTION], Config.VECTOR_SNAPSHOT_PATH)
+        print(f"Wrote {count} vectors to {Config.VECTOR_SNAPSHOT_PATH}")
+    else:
+        if args.synthetic:
+            # Clustered random vectors, closer to real embeddings than uniform noise
+            rng = np.random.default_rng(0)
+            centers = rng.normal(size=(max(args.synthetic // 200, 1), args.dimensions))
+            vectors = (centers[rng.integers(0, len(centers), args.synthetic)] + rng.normal(0, 0.5, (args.synthetic, args.dimensions))).astype(np.float32)
+        else:
+            vectors = np.load(f"{Config.VECTOR_SNAPSHOT_PATH}.vectors.npy", mmap_mode='r')
+        benchmark(vectors, args.k, args.queries, args.lists, args.probes, Config.VECTOR_SIMILARITY)